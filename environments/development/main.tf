@@ -232,6 +232,8 @@ module "notifications" {
 
   lambda_notify_function_arn  = module.lambda.notify_function_arn
   lambda_notify_function_name = module.lambda.notify_function_name
+  lambda_pdf_function_arn     = module.lambda.pdf_function_arn
+  lambda_pdf_function_name    = module.lambda.pdf_function_name
 
   ses_email_identity        = var.notifications.ses_email_identity
   enable_ses_event_tracking = true
@@ -470,4 +472,8 @@ module "ecs_portal" {
   //Lambda pdf_generat
   pdf_lambda_function_name = module.lambda.pdf_function_name
   pdf_lambda_function_arn  = module.lambda.pdf_function_arn
+
+  # Reportes PDF pre-generados (reports/ en el bucket de datos)
+  s3_bucket_name = module.s3.data_bucket_name
+  s3_bucket_arn  = module.s3.data_bucket_arn
 }
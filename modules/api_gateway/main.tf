@@ -48,6 +48,13 @@ resource "aws_api_gateway_resource" "ingest" {
   path_part   = "ingest"
 }
 
+# /api/v1/uploads resource (presigned direct-to-S3 uploads)
+resource "aws_api_gateway_resource" "uploads" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  parent_id   = aws_api_gateway_resource.v1.id
+  path_part   = "uploads"
+}
+
 # /api/v1/health resource
 resource "aws_api_gateway_resource" "health" {
   rest_api_id = aws_api_gateway_rest_api.main.id
@@ -84,6 +91,28 @@ resource "aws_api_gateway_integration" "ingest_lambda" {
   uri                     = var.lambda_ingest_invoke_arn
 }
 
+# POST /api/v1/uploads method
+resource "aws_api_gateway_method" "uploads_post" {
+  rest_api_id      = aws_api_gateway_rest_api.main.id
+  resource_id      = aws_api_gateway_resource.uploads.id
+  http_method      = "POST"
+  authorization    = "NONE"
+  api_key_required = var.enable_api_key_required
+
+  request_validator_id = aws_api_gateway_request_validator.body.id
+}
+
+# Lambda proxy integration for POST /api/v1/uploads (same Lambda Ingest)
+resource "aws_api_gateway_integration" "uploads_lambda" {
+  rest_api_id = aws_api_gateway_rest_api.main.id
+  resource_id = aws_api_gateway_resource.uploads.id
+  http_method = aws_api_gateway_method.uploads_post.http_method
+
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = var.lambda_ingest_invoke_arn
+}
+
 # Lambda permission for ingest endpoint
 resource "aws_lambda_permission" "api_gateway_ingest" {
   statement_id  = "AllowAPIGatewayInvoke"
@@ -225,7 +254,7 @@ resource "aws_api_gateway_integration_response" "ingest_options" {
   status_code = aws_api_gateway_method_response.ingest_options_200.status_code
 
   response_parameters = {
-    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'"
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,Idempotency-Key'"
     "method.response.header.Access-Control-Allow-Methods" = "'POST,OPTIONS'"
     "method.response.header.Access-Control-Allow-Origin"  = "'${join(",", var.cors_allow_origins)}'"
   }
@@ -250,6 +279,9 @@ resource "aws_api_gateway_deployment" "main" {
       aws_api_gateway_resource.ingest.id,
       aws_api_gateway_method.ingest_post.id,
       aws_api_gateway_integration.ingest_lambda.id,
+      aws_api_gateway_resource.uploads.id,
+      aws_api_gateway_method.uploads_post.id,
+      aws_api_gateway_integration.uploads_lambda.id,
       aws_api_gateway_resource.health.id,
       aws_api_gateway_method.health_get.id,
       aws_api_gateway_integration.health_mock.id,
@@ -265,6 +297,7 @@ resource "aws_api_gateway_deployment" "main" {
 
   depends_on = [
     aws_api_gateway_integration.ingest_lambda,
+    aws_api_gateway_integration.uploads_lambda,
     aws_api_gateway_integration.health_mock,
     aws_api_gateway_integration.pdf_lambda,
     aws_api_gateway_integration_response.health,
@@ -17,3 +17,21 @@ resource "aws_iam_role_policy" "portal_invoke_pdf_lambda" {
   })
 }
 
+# Read pre-generated PDF reports (HEAD + presigned GET from the portal)
+resource "aws_iam_role_policy" "portal_read_reports" {
+  name = "${var.project_name}-${var.environment}-portal-read-reports"
+  role = aws_iam_role.task.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject"
+        ]
+        Resource = "${var.s3_bucket_arn}/reports/*"
+      }
+    ]
+  })
+}
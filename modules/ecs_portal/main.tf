@@ -177,6 +177,10 @@ resource "aws_ecs_task_definition" "portal" {
           name  = "PDF_LAMBDA_NAME"
           value = var.pdf_lambda_function_name
         },
+        {
+          name  = "S3_BUCKET"
+          value = var.s3_bucket_name
+        },
         {
           name  = "APP_URL"
           value = var.app_url
@@ -153,3 +153,13 @@ variable "pdf_lambda_function_arn" {
   description = "ARN de la Lambda que genera PDFs de resultados"
   type        = string
 }
+
+variable "s3_bucket_name" {
+  description = "Bucket donde la Lambda PDF guarda los reportes (reports/)"
+  type        = string
+}
+
+variable "s3_bucket_arn" {
+  description = "ARN del bucket de reportes"
+  type        = string
+}
@@ -3,108 +3,132 @@ import io
 import json
 import logging
 import os
+from collections import OrderedDict
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, TextIO, Tuple
 
-import boto3
+from lab_ingest.adapter import AdapterRuntime, ParserPlugin, flag_fields
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
-lambda_client = boto3.client("lambda")
-
-INGEST_FUNCTION_NAME = os.environ["INGEST_FUNCTION_NAME"]
 LAB_NAME_DEFAULT = os.environ.get("LAB_NAME", "Small Lab")
 
+# Agrupación en streaming: grupos abiertos a la vez
+CSV_MAX_OPEN_GROUPS = int(os.environ.get("CSV_MAX_OPEN_GROUPS", "64"))
 
-def lambda_handler(event, context):
-    """
-    Adapter CSV -> JSON canónico para Lambda Ingest.
 
-    Soporta:
-      - Evento S3 con archivos CSV
-      - Invocación directa con {"csv_body": "...csv..."}
-    """
-    logger.info("CSV adapter started")
-    logger.info(f"Event: {json.dumps(event)}")
+class CSVGroupingError(ValueError):
+    """Filas de un grupo que ya se cerró: el archivo no está ordenado"""
 
-    # 1) Obtener CSV como texto
-    csv_text = extract_csv_from_event(event)
 
-    # 2) Parsear CSV a JSON normalizado
-    normalized = parse_csv_to_json(csv_text)
+class CSVParser(ParserPlugin):
+    """Un resultado por grupo de filas (paciente, fecha, orden)"""
 
-    # 3) Invocar Lambda Ingest
-    response = lambda_client.invoke(
-        FunctionName=INGEST_FUNCTION_NAME,
-        InvocationType="Event",  # async
-        Payload=json.dumps(normalized).encode("utf-8"),
-    )
+    source_format = "CSV"
+    inline_key = "csv_body"
+    empty_warning = "No result rows found in CSV input"
 
-    logger.info(
-        "Invoked ingest function: %s, response: %s",
-        INGEST_FUNCTION_NAME,
-        response,
-    )
+    def parse(self, stream: TextIO) -> Iterator[Dict[str, Any]]:
+        return iter_csv_results(stream)
 
-    return {
-        "statusCode": 202,
-        "body": json.dumps(
-            {
-                "status": "accepted",
-                "message": "CSV received, normalized and sent to ingest",
-                "ingest_function": INGEST_FUNCTION_NAME,
-            }
-        ),
-    }
+
+# Evento, lectura de S3, lotes, concurrencia, reintentos y métricas (layer lab_ingest)
+runtime = AdapterRuntime(CSVParser())
 
 
-def extract_csv_from_event(event: Dict[str, Any]) -> str:
+def lambda_handler(event, context):
     """
-    Si viene directo: {"csv_body": "PatientID,LabID,..."}
-    Si viene de S3: Records[0].s3.bucket.name / object.key
+    Adapter CSV -> JSON canónico, escrito directo en S3 + SQS.
+    Soporta:
+      - Evento S3 con uno o varios archivos CSV (se procesan todos los Records)
+      - Invocación directa con {"csv_body": "PatientID,LabID,..."}
     """
-    if "csv_body" in event:
-        return event["csv_body"]
+    return runtime.handle(event)
+
 
-    if "Records" in event and event["Records"]:
-        record = event["Records"][0]
-        bucket = record["s3"]["bucket"]["name"]
-        key = record["s3"]["object"]["key"]
+def group_key(row: Dict[str, str]) -> Tuple[str, str, str]:
+    """Un resultado por (PatientID, TestDate, OrderID)"""
+    return (
+        (row.get("PatientID") or "").strip(),
+        (row.get("TestDate") or "").strip(),
+        (row.get("OrderID") or "").strip(),
+    )
 
-        s3 = boto3.client("s3")
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        body = obj["Body"].read().decode("utf-8")
-        logger.info("Read CSV file from s3://%s/%s", bucket, key)
-        return body
 
-    raise ValueError("No CSV found in event")
+def iter_csv_groups(stream: TextIO) -> Iterator[List[Dict[str, str]]]:
+    """
+    Filas agrupadas por group_key en una sola pasada.
+
+    Los grupos quedan abiertos mientras sigan llegando filas; si hay más de
+    CSV_MAX_OPEN_GROUPS abiertos, se cierra el que lleva más tiempo sin filas.
+    El archivo tiene que venir ordenado por paciente (lo normal): cada grupo
+    sale entero y la memoria queda acotada a CSV_MAX_OPEN_GROUPS grupos.
+    Una fila de uno de los últimos CSV_MAX_OPEN_GROUPS grupos cerrados levanta
+    CSVGroupingError y el archivo falla, en vez de partir el resultado en dos
+    (las keys cerradas también se guardan en un LRU acotado, no todas las del
+    archivo).
+    """
+    open_groups: "OrderedDict[Tuple[str, str, str], List[Dict[str, str]]]" = (
+        OrderedDict()
+    )
+    closed: "OrderedDict[Tuple[str, str, str], None]" = OrderedDict()
+
+    for row in csv.DictReader(stream):
+        if not any((value or "").strip() for value in row.values()):
+            continue
+        key = group_key(row)
+        group = open_groups.get(key)
+        if group is None:
+            if key in closed:
+                raise CSVGroupingError(
+                    f"CSV rows for patient {key[0]} (date {key[1]!r}, order "
+                    f"{key[2]!r}) appear after more than {CSV_MAX_OPEN_GROUPS} "
+                    "other groups; sort the file by PatientID, TestDate, OrderID "
+                    "or raise CSV_MAX_OPEN_GROUPS"
+                )
+            group = open_groups[key] = []
+            if len(open_groups) > CSV_MAX_OPEN_GROUPS:
+                oldest_key, oldest = open_groups.popitem(last=False)
+                closed[oldest_key] = None
+                if len(closed) > CSV_MAX_OPEN_GROUPS:
+                    closed.popitem(last=False)
+                yield oldest
+        else:
+            open_groups.move_to_end(key)
+        group.append(row)
+
+    yield from open_groups.values()
+
+
+def iter_csv_results(stream: TextIO) -> Iterator[Dict[str, Any]]:
+    """Un resultado normalizado por grupo (paciente, fecha, orden)"""
+    for rows in iter_csv_groups(stream):
+        yield normalize_csv_group(rows)
 
 
 def parse_csv_to_json(csv_text: str) -> Dict[str, Any]:
+    """Normaliza el primer grupo de un CSV (compatibilidad)"""
+    for normalized in iter_csv_results(io.StringIO(csv_text)):
+        return normalized
+    raise ValueError("CSV has no data rows")
+
+
+def normalize_csv_group(rows: List[Dict[str, str]]) -> Dict[str, Any]:
     """
     Espera columnas:
-      PatientID,LabID,TestDate,TestCode,TestName,Value,Unit,RefRange
+      PatientID,LabID,TestDate,TestCode,TestName,Value,Unit,RefRange[,OrderID][,Flag]
 
-    Asumimos:
-      - un solo paciente por archivo
-      - misma fecha para todas las filas
+    Todas las filas del grupo son del mismo paciente, fecha y orden.
     """
-    file_obj = io.StringIO(csv_text)
-    reader = csv.DictReader(file_obj)
-
-    rows: List[Dict[str, str]] = list(reader)
-
-    if not rows:
-        raise ValueError("CSV has no data rows")
-
     first = rows[0]
 
-    patient_id = first.get("PatientID", "UNKNOWN")
-    lab_id = first.get("LabID", "").strip() or "SMALL001"
+    patient_id = first.get("PatientID") or "UNKNOWN"
+    lab_id = (first.get("LabID") or "").strip() or "SMALL001"
     test_date_raw = first.get("TestDate", "")
     test_code = first.get("TestCode", "")
     test_name = first.get("TestName", "")
+    order_id = (first.get("OrderID") or "").strip()
 
     # Test type para el resultado “global”
     if test_name and test_code:
@@ -137,10 +161,6 @@ def parse_csv_to_json(csv_text: str) -> Dict[str, Any]:
         except (ValueError, TypeError):
             value = None
 
-        # Sin flags en CSV, asumimos normal por ahora
-        is_abnormal = False
-        severity = "normal"
-
         results.append(
             {
                 "test_code": code,
@@ -148,8 +168,8 @@ def parse_csv_to_json(csv_text: str) -> Dict[str, Any]:
                 "value": value,
                 "unit": unit,
                 "reference_range": ref_range,
-                "is_abnormal": is_abnormal,
-                "severity": severity,
+                # Columna Flag opcional; sin flag clasifica el rango de referencia
+                **flag_fields(row.get("Flag")),
             }
         )
 
@@ -161,6 +181,10 @@ def parse_csv_to_json(csv_text: str) -> Dict[str, Any]:
         "test_date": test_date_iso,
         "results": results,
     }
+    if order_id:
+        normalized["order_id"] = order_id
 
-    logger.info("Normalized CSV to JSON: %s", json.dumps(normalized))
+    logger.debug("Normalized CSV group with %d results", len(results))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Normalized payload: %s", json.dumps(normalized))
     return normalized
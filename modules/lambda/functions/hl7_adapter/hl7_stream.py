@@ -0,0 +1,187 @@
+r"""
+Tokenizer HL7 v2 en streaming
+
+Lee un archivo HL7 (un mensaje o un batch FHS/BHS ... BTS/FTS con miles de
+ORU^R01) desde un stream de texto, en bloques, y entrega un mensaje a la vez
+como lista de Segment. La memoria queda acotada a un bloque de lectura más el
+mensaje en curso, sin importar el tamaño del archivo.
+
+  - Separadores de segmento: \r, \n o \r\n (se aceptan mezclados) y se
+    descartan los caracteres de framing MLLP (\x0b, \x1c).
+  - Delimitadores leídos de cada MSH / FHS / BHS (MSH-1 y MSH-2).
+  - Cada línea se separa en campos una sola vez; componentes, repeticiones y
+    secuencias de escape (\F\ \S\ \T\ \R\ \E\ \Xhh\ \.br\) se resuelven solo
+    en los campos que se leen.
+"""
+
+import re
+from functools import lru_cache
+from typing import Iterator, List, NamedTuple, TextIO
+
+READ_CHUNK_SIZE = 64 * 1024
+
+HEADER_SEGMENTS = ("MSH", "FHS", "BHS")
+ENVELOPE_SEGMENTS = ("FHS", "BHS", "BTS", "FTS")
+
+_SEGMENT_SPLIT = re.compile(r"\r\n|\r|\n")
+_FRAMING_CHARS = "\x0b\x1c \t"
+
+
+class Delimiters(NamedTuple):
+    field: str = "|"
+    component: str = "^"
+    repetition: str = "~"
+    escape: str = "\\"
+    subcomponent: str = "&"
+
+    @classmethod
+    def from_header(cls, line: str) -> "Delimiters":
+        """Delimitadores declarados en un MSH / FHS / BHS"""
+        if len(line) < 4:
+            return cls()
+        field = line[3]
+        encoding = line[4:].split(field, 1)[0]
+        defaults = cls()
+        return cls(
+            field=field,
+            component=encoding[0] if len(encoding) > 0 else defaults.component,
+            repetition=encoding[1] if len(encoding) > 1 else defaults.repetition,
+            escape=encoding[2] if len(encoding) > 2 else defaults.escape,
+            subcomponent=encoding[3] if len(encoding) > 3 else defaults.subcomponent,
+        )
+
+
+DEFAULT_DELIMITERS = Delimiters()
+
+
+@lru_cache(maxsize=8)
+def _escape_pattern(escape: str) -> "re.Pattern[str]":
+    esc = re.escape(escape)
+    return re.compile(f"{esc}([^{esc}]*){esc}")
+
+
+def unescape(value: str, delimiters: Delimiters = DEFAULT_DELIMITERS) -> str:
+    """Resuelve las secuencias de escape HL7 de un valor"""
+    if delimiters.escape not in value:
+        return value
+
+    replacements = {
+        "F": delimiters.field,
+        "S": delimiters.component,
+        "T": delimiters.subcomponent,
+        "R": delimiters.repetition,
+        "E": delimiters.escape,
+        ".br": "\n",
+        "H": "",  # inicio de resaltado
+        "N": "",  # fin de resaltado
+    }
+
+    def replace(match: "re.Match[str]") -> str:
+        code = match.group(1)
+        if code in replacements:
+            return replacements[code]
+        if code.startswith("X") and len(code) > 1:
+            try:
+                return bytes.fromhex(code[1:]).decode("utf-8", errors="replace")
+            except ValueError:
+                pass
+        # Secuencia desconocida: se deja tal cual
+        return match.group(0)
+
+    return _escape_pattern(delimiters.escape).sub(replace, value)
+
+
+class Segment:
+    """
+    Un segmento HL7 separado en campos. field(n) sigue la numeración HL7:
+    en MSH / FHS / BHS field(1) es el separador y field(2) los encoding chars.
+    """
+
+    __slots__ = ("name", "fields", "delimiters")
+
+    def __init__(self, line: str, delimiters: Delimiters = DEFAULT_DELIMITERS):
+        fields = line.split(delimiters.field)
+        self.name = fields[0]
+        if self.name in HEADER_SEGMENTS:
+            fields.insert(1, delimiters.field)
+        self.fields = fields
+        self.delimiters = delimiters
+
+    def field(self, index: int) -> str:
+        """Campo crudo (sin resolver escapes), "" si no existe"""
+        return self.fields[index] if index < len(self.fields) else ""
+
+    def repetitions(self, index: int) -> List[str]:
+        """Repeticiones crudas de un campo"""
+        raw = self.field(index)
+        if self.name in HEADER_SEGMENTS and index <= 2:
+            return [raw]
+        return raw.split(self.delimiters.repetition) if raw else []
+
+    def component(self, index: int, component: int = 1, repetition: int = 0) -> str:
+        """Componente (1-based) de una repetición del campo, con escapes resueltos"""
+        reps = self.repetitions(index)
+        if repetition >= len(reps):
+            return ""
+        parts = reps[repetition].split(self.delimiters.component)
+        if component > len(parts):
+            return ""
+        return unescape(parts[component - 1], self.delimiters)
+
+    def value(self, index: int) -> str:
+        """Primer componente de la primera repetición (caso más común)"""
+        return self.component(index, 1, 0)
+
+    def __repr__(self) -> str:
+        return f"Segment({self.delimiters.field.join(self.fields)!r})"
+
+
+def iter_segments(stream: TextIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+    """Líneas de segmento no vacías, leyendo el stream por bloques"""
+    pending = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+        *lines, pending = _SEGMENT_SPLIT.split(pending)
+        for line in lines:
+            line = line.strip(_FRAMING_CHARS)
+            if line:
+                yield line
+
+    pending = pending.strip(_FRAMING_CHARS)
+    if pending:
+        yield pending
+
+
+def iter_messages(
+    stream: TextIO, chunk_size: int = READ_CHUNK_SIZE
+) -> Iterator[List[Segment]]:
+    """
+    Un mensaje (MSH + segmentos siguientes) por iteración. Los segmentos de
+    envoltura de batch (FHS/BHS/BTS/FTS) cierran el mensaje en curso y no se
+    incluyen; los segmentos fuera de un MSH se ignoran.
+    """
+    delimiters = DEFAULT_DELIMITERS
+    message: List[Segment] = []
+
+    for line in iter_segments(stream, chunk_size):
+        name = line[:3]
+
+        if name in HEADER_SEGMENTS:
+            delimiters = Delimiters.from_header(line)
+
+        if name == "MSH":
+            if message:
+                yield message
+            message = [Segment(line, delimiters)]
+        elif name in ENVELOPE_SEGMENTS:
+            if message:
+                yield message
+            message = []
+        elif message:
+            message.append(Segment(line, delimiters))
+
+    if message:
+        yield message
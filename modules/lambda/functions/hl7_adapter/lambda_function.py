@@ -1,158 +1,121 @@
+import io
 import json
 import logging
 import os
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, TextIO
 
-import boto3
+from lab_ingest.adapter import AdapterRuntime, ParserPlugin, flag_fields
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+from hl7_stream import Segment, iter_messages
 
-lambda_client = boto3.client("lambda")
+logger = logging.getLogger()
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
-INGEST_FUNCTION_NAME = os.environ["INGEST_FUNCTION_NAME"]
 LAB_ID_DEFAULT = os.environ.get("LAB_ID", "LAB002")
 LAB_NAME_DEFAULT = os.environ.get("LAB_NAME", "LabCorp")
 
 
-def lambda_handler(event, context):
-    """
-    Adapter HL7 -> JSON canónico para Lambda Ingest.
-    Espera como entrada:
-      - Evento S3 (archivos HL7 en texto plano), o
-      - Invocación directa con 'hl7_message' en el body.
-    """
-    logger.info("HL7 adapter started")
-    logger.info("Event: %s", json.dumps(event))
-
-    # 1) Obtener el texto HL7
-    hl7_text = extract_hl7_from_event(event)
-
-    # 2) Parsear HL7 a un dict normalizado
-    normalized = parse_hl7_to_json(hl7_text)
-
-    # 3) Invocar lambda Ingest con el JSON
-    response = lambda_client.invoke(
-        FunctionName=INGEST_FUNCTION_NAME,
-        InvocationType="Event",  # async, no esperamos la respuesta completa
-        Payload=json.dumps(normalized).encode("utf-8"),
-    )
-
-    logger.info(
-        "Invoked ingest function: %s, response: %s",
-        INGEST_FUNCTION_NAME,
-        response,
-    )
-
-    return {
-        "statusCode": 202,
-        "body": json.dumps(
-            {
-                "status": "accepted",
-                "message": "HL7 received, normalized and sent to ingest",
-                "ingest_function": INGEST_FUNCTION_NAME,
-            }
-        ),
-    }
+class HL7Parser(ParserPlugin):
+    """Un resultado por mensaje ORU^R01 (archivo simple o batch FHS/BHS)"""
+
+    source_format = "HL7"
+    inline_key = "hl7_message"
+    empty_warning = "No HL7 messages (MSH) found in input"
+
+    def parse(self, stream: TextIO) -> Iterator[Dict[str, Any]]:
+        return iter_hl7_results(stream)
+
 
+# Evento, lectura de S3, lotes, concurrencia, reintentos y métricas (layer lab_ingest)
+runtime = AdapterRuntime(HL7Parser())
 
-def extract_hl7_from_event(event: Dict[str, Any]) -> str:
+
+def lambda_handler(event, context):
     """
+    Adapter HL7 -> JSON canónico, escrito directo en S3 + SQS.
     Soporta:
-      - Evento S3 (Records -> bucket/key)
-      - Invocación directa con {'hl7_message': 'MSH|...'}
+      - Evento S3 con uno o varios archivos HL7 (se procesan todos los Records)
+      - Invocación directa con {"hl7_message": "MSH|..."}
     """
-    # Caso invocación directa desde consola / tests
-    if "hl7_message" in event:
-        return event["hl7_message"]
-
-    # Caso evento S3
-    if "Records" in event and event["Records"]:
-        record = event["Records"][0]
-        bucket = record["s3"]["bucket"]["name"]
-        key = record["s3"]["object"]["key"]
+    return runtime.handle(event)
 
-        s3 = boto3.client("s3")
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        body = obj["Body"].read().decode("utf-8")
-        logger.info("Read HL7 file from s3://%s/%s", bucket, key)
-        return body
 
-    raise ValueError("No HL7 message found in event")
+def iter_hl7_results(stream: TextIO) -> Iterator[Dict[str, Any]]:
+    """Un resultado normalizado por cada mensaje del stream"""
+    for message in iter_messages(stream):
+        yield normalize_hl7_message(message)
 
 
 def parse_hl7_to_json(hl7_text: str) -> Dict[str, Any]:
+    """Normaliza el primer mensaje de un texto HL7 (compatibilidad)"""
+    for normalized in iter_hl7_results(io.StringIO(hl7_text)):
+        return normalized
+    raise ValueError("No HL7 message (MSH) found")
+
+
+def parse_hl7_datetime(value: str) -> str | None:
+    """20240115103000[.SSSS][+ZZZZ] -> ISO 8601 (UTC asumido)"""
+    digits = value.split("+", 1)[0].split("-", 1)[0].split(".", 1)[0]
+    for fmt in ("%Y%m%d%H%M%S", "%Y%m%d%H%M", "%Y%m%d"):
+        try:
+            return datetime.strptime(digits, fmt).isoformat() + "Z"
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_hl7_message(segments: List[Segment]) -> Dict[str, Any]:
     r"""
-    Parseo MUY simple para el ejemplo:
+    Normaliza un mensaje ORU^R01:
 
     MSH|^~\&|LABCORP|LAB002|PORTAL|SYSTEM|20240115103000||ORU^R01|MSG001|P|2.5
     PID|1||P234567||Smith^John^A||19850315|M
     OBR|1||20240115-001|CBC^Complete Blood Count
     OBX|1|NM|WBC^White Blood Cell Count||7.5|10^3/uL|4.5-11.0|N|||F
+
+    Con varios OBR, el tipo de test sale del primero y se juntan los OBX de
+    todos. Los campos con repeticiones (PID-3, PID-5) usan la primera.
     """
-    lines = [line.strip() for line in hl7_text.splitlines() if line.strip()]
-    segments = {line.split("|")[0]: line.split("|") for line in lines}
+    msh = segments[0]
+    pid = obr = None
+    obx_segments: List[Segment] = []
+    for segment in segments[1:]:
+        if segment.name == "PID" and pid is None:
+            pid = segment
+        elif segment.name == "OBR" and obr is None:
+            obr = segment
+        elif segment.name == "OBX":
+            obx_segments.append(segment)
 
     # --- MSH ---
-    msh = segments.get("MSH", [])
-    sending_app = msh[2] if len(msh) > 2 else ""
-    sending_fac = msh[3] if len(msh) > 3 else LAB_ID_DEFAULT
-    ts_str = msh[6] if len(msh) > 6 else ""  # 20240115103000
-
-    test_datetime_iso: str | None = None
-    if ts_str:
-        try:
-            dt = datetime.strptime(ts_str, "%Y%m%d%H%M%S")
-            test_datetime_iso = dt.isoformat() + "Z"
-        except ValueError:
-            test_datetime_iso = None
+    sending_app = msh.value(3)
+    sending_fac = msh.value(4) or LAB_ID_DEFAULT
+    test_datetime_iso = parse_hl7_datetime(msh.value(7))
+    control_id = msh.value(10)
 
     # --- PID ---
-    pid = segments.get("PID", [])
-    patient_id = pid[3] if len(pid) > 3 else "UNKNOWN"
-    patient_name_field = pid[5] if len(pid) > 5 else ""
+    patient_id = (pid.value(3) if pid else "") or "UNKNOWN"
     # Smith^John^A
-    name_parts = patient_name_field.split("^")
-    last_name = name_parts[0] if len(name_parts) > 0 else ""
-    first_name = name_parts[1] if len(name_parts) > 1 else ""
+    last_name = pid.component(5, 1) if pid else ""
+    first_name = pid.component(5, 2) if pid else ""
     patient_name = f"{first_name} {last_name}".strip()
 
     # --- OBR ---
-    obr = segments.get("OBR", [])
-    test_type_code = ""
-    test_type_name = ""
-    if len(obr) > 4:
-        # CBC^Complete Blood Count
-        parts = obr[4].split("^")
-        test_type_code = parts[0]
-        test_type_name = parts[1] if len(parts) > 1 else ""
-
+    # CBC^Complete Blood Count
+    test_type_code = obr.component(4, 1) if obr else ""
+    test_type_name = obr.component(4, 2) if obr else ""
     test_type = test_type_name or test_type_code or "Unknown"
 
     # --- OBX (puede haber varios) ---
     results: List[Dict[str, Any]] = []
-    for line in lines:
-        if not line.startswith("OBX|"):
-            continue
-        fields = line.split("|")
+    for obx in obx_segments:
         # OBX|1|NM|WBC^White Blood Cell Count||7.5|10^3/uL|4.5-11.0|N|||F
-        observation_id = fields[3] if len(fields) > 3 else ""
-        value = fields[5] if len(fields) > 5 else ""
-        unit = fields[6] if len(fields) > 6 else ""
-        ref_range = fields[7] if len(fields) > 7 else ""
-        flag = fields[8] if len(fields) > 8 else "N"
-
-        comp_parts = observation_id.split("^")
-        test_code = comp_parts[0]
-        test_name = comp_parts[1] if len(comp_parts) > 1 else test_code
-
-        is_abnormal = flag not in ("N", "", None)
-        severity = "normal"
-        if flag in ("H", "HH"):
-            severity = "high"
-        elif flag in ("L", "LL"):
-            severity = "low"
+        test_code = obx.component(3, 1)
+        test_name = obx.component(3, 2) or test_code
+        value = obx.value(5)
+        unit = obx.value(6)
+        ref_range = obx.value(7)
 
         try:
             numeric_value = float(value)
@@ -166,20 +129,23 @@ def parse_hl7_to_json(hl7_text: str) -> Dict[str, Any]:
                 "value": numeric_value,
                 "unit": unit,
                 "reference_range": ref_range,
-                "is_abnormal": is_abnormal,
-                "severity": severity,
+                **flag_fields(obx.value(8)),
             }
         )
 
     normalized: Dict[str, Any] = {
         "patient_id": patient_id,
         "patient_name": patient_name,
-        "lab_id": sending_fac or LAB_ID_DEFAULT,
+        "lab_id": sending_fac,
         "lab_name": LAB_NAME_DEFAULT or sending_app,
         "test_type": test_type,
         "test_date": test_datetime_iso or datetime.utcnow().isoformat() + "Z",
         "results": results,
     }
+    if control_id:
+        normalized["external_result_id"] = control_id
 
-    logger.info("Normalized HL7 to JSON: %s", json.dumps(normalized))
+    logger.debug("Normalized HL7 message %s with %d results", control_id, len(results))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Normalized payload: %s", json.dumps(normalized))
     return normalized
@@ -7,263 +7,208 @@ import json
 import logging
 import os
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 import boto3
 
+from lab_ingest import IngestWriter, build_idempotency_store, generate_ulid, get_header
+from uploads import create_upload, validate_upload_request
+
 # Configuración de logging
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
-# Clientes AWS
-s3_client = boto3.client("s3")
-sqs_client = boto3.client("sqs")
+# Clientes AWS: se crean en la primera invocación que los necesita y se
+# reutilizan mientras el contenedor siga caliente
+_s3_client = None
+_sqs_client = None
+_idempotency_store = None
+_writer = None
 
-# Variables de entorno (las mismas que ya usas)
+# Variables de entorno (las mismas que ya usas). La compresión del payload,
+# los shards de S3 y los TTL de idempotencia los lee IngestWriter.from_env
 S3_BUCKET = os.environ["S3_BUCKET"]
 SQS_QUEUE_URL = os.environ["SQS_QUEUE_URL"]
-ENVIRONMENT = os.environ.get("ENVIRONMENT", "dev")
-
-# NUEVO: metadatos de formato
-SOURCE_FORMAT = "JSON"  # otros adapters usarán "HL7", "XML", "CSV"
-PAYLOAD_SCHEMA_VERSION = "1.0"
-
 
-def lambda_handler(event, context):
-    """
-    Handler principal de Lambda
-    """
-    try:
-        logger.info("Lambda Ingest (JSON) iniciado")
-        logger.info("Event: %s", json.dumps(event))
+# Deduplicación de reintentos: tabla DynamoDB con TTL (vacío = store en memoria)
+IDEMPOTENCY_TABLE = os.environ.get("IDEMPOTENCY_TABLE", "")
 
-        # 1. Parsear el body
-        body = parse_body(event)
+# Uploads directos a S3 (POST /uploads): vigencia de las URLs presignadas
+UPLOAD_URL_TTL = int(os.environ.get("UPLOAD_URL_TTL", "900"))
 
-        # 2. Validar datos
-        validation_result = validate_lab_result(body)
-        if not validation_result["valid"]:
-            return error_response(400, validation_result["errors"])
+# Metadatos de formato (los adapters usan "HL7", "XML", "CSV")
+SOURCE_FORMAT = "JSON"
 
-        # 3. Generar ID único
-        result_id = generate_result_id(body)
 
-        # 4. Guardar en S3
-        s3_key = save_to_s3(body, result_id)
+def get_s3_client():
+    """Devuelve el cliente S3 cacheado (lo crea si no existe)"""
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client("s3")
+    return _s3_client
 
-        # 5. Enviar mensaje a SQS
-        message_id = send_to_sqs(s3_key, result_id, body)
 
-        # 6. Respuesta exitosa
-        logger.info("Procesamiento exitoso. Result ID: %s", result_id)
+def get_sqs_client():
+    """Devuelve el cliente SQS cacheado (lo crea si no existe)"""
+    global _sqs_client
+    if _sqs_client is None:
+        _sqs_client = boto3.client("sqs")
+    return _sqs_client
 
-        return success_response(
-            {
-                "result_id": result_id,
-                "message_id": message_id,
-                "s3_key": s3_key,
-                "status": "accepted",
-                "message": "Lab result received and queued for processing",
-            }
-        )
 
-    except Exception as exc:
-        logger.error("Error en lambda_handler: %s", str(exc), exc_info=True)
-        return error_response(500, f"Internal server error: {str(exc)}")
+def get_idempotency_store():
+    """DynamoDB si IDEMPOTENCY_TABLE está definido, si no un store en memoria"""
+    global _idempotency_store
+    if _idempotency_store is None:
+        _idempotency_store = build_idempotency_store(IDEMPOTENCY_TABLE)
+    return _idempotency_store
 
 
-def parse_body(event: Dict[str, Any]) -> Dict[str, Any]:
-    """Parsea el body del request"""
-    try:
-        if "body" in event:
-            if isinstance(event["body"], str):
-                return json.loads(event["body"])
-            return event["body"]
-        return event
-    except json.JSONDecodeError as exc:
-        raise ValueError(f"Invalid JSON in request body: {str(exc)}") from exc
+def get_writer() -> IngestWriter:
+    """IngestWriter cacheado (layer lab_ingest) con los clientes de este módulo"""
+    global _writer
+    if _writer is None:
+        _writer = IngestWriter.from_env(
+            get_s3_client(), get_sqs_client(), SOURCE_FORMAT, get_idempotency_store()
+        )
+    return _writer
 
 
-def validate_lab_result(data: Dict[str, Any]) -> Dict[str, Any]:
+def lambda_handler(event, context):
     """
-    Valida el formato del resultado de laboratorio
+    Handler principal de Lambda
     """
-    errors: list[str] = []
-
-    required_fields = [
-        "patient_id",
-        "lab_id",
-        "lab_name",
-        "test_type",
-        "test_date",
-        "results",
-    ]
-
-    for field in required_fields:
-        if field not in data:
-            errors.append(f"Missing required field: {field}")
-        elif not data[field]:
-            errors.append(f"Field '{field}' cannot be empty")
-
-    # results debe ser lista
-    if "results" in data:
-        if not isinstance(data["results"], list):
-            errors.append("Field 'results' must be a list")
-        elif len(data["results"]) == 0:
-            errors.append("Field 'results' cannot be empty")
-        else:
-            for idx, result in enumerate(data["results"]):
-                errors.extend(validate_test_result(result, idx))
-
-    # patient_id (ejemplo de regla simple)
-    if "patient_id" in data and data["patient_id"]:
-        if not str(data["patient_id"]).startswith("P"):
-            errors.append("patient_id must start with 'P'")
-
-    # test_date en ISO 8601
-    if "test_date" in data and data["test_date"]:
-        try:
-            datetime.fromisoformat(str(data["test_date"]).replace("Z", "+00:00"))
-        except (ValueError, AttributeError, TypeError):
-            errors.append("test_date must be in ISO 8601 format")
-
-    return {"valid": len(errors) == 0, "errors": errors}
+    try:
+        logger.info("Lambda Ingest (JSON) iniciado")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Event: %s", json.dumps(event))
 
+        if is_upload_request(event):
+            return handle_upload_request(event)
 
-def validate_test_result(result: Dict[str, Any], index: int) -> list[str]:
-    """Valida un resultado de test individual"""
-    errors: list[str] = []
-    prefix = f"results[{index}]"
+        # Lote de resultados enviado por un adapter (invocación directa)
+        if isinstance(event.get("batch"), list):
+            return handle_batch(event["batch"])
 
-    required = ["test_code", "test_name", "value", "unit"]
-    for field in required:
-        if field not in result:
-            errors.append(f"{prefix}: Missing field '{field}'")
+        # 1. Parsear el body
+        body = parse_body(event)
 
-    if "value" in result:
-        try:
-            float(result["value"])
-        except (ValueError, TypeError):
-            errors.append(f"{prefix}: 'value' must be numeric")
+        return ingest_lab_result(event, body)
 
-    return errors
+    except Exception as exc:
+        logger.error("Error en lambda_handler: %s", str(exc), exc_info=True)
+        return error_response(500, f"Internal server error: {str(exc)}")
 
 
-def generate_result_id(data: Dict[str, Any]) -> str:
-    """Genera un ID único para el resultado"""
-    timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
-    patient_id = data.get("patient_id", "UNKNOWN")
-    lab_id = data.get("lab_id", "LAB")
-    return f"{lab_id}-{patient_id}-{timestamp}"
+def ingest_lab_result(event: Dict[str, Any], body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida, deduplica, guarda en S3 y encola en SQS un resultado.
+    Devuelve la respuesta para API Gateway; los errores de AWS se propagan.
+    """
+    outcome = get_writer().ingest(body, get_header(event, "Idempotency-Key"))
+    return outcome_response(outcome)
 
 
-def save_to_s3(data: Dict[str, Any], result_id: str) -> str:
+def handle_batch(items: List[Any]) -> Dict[str, Any]:
     """
-    Guarda el JSON crudo en S3
+    Procesa un lote de resultados normalizados. Cada elemento pasa por el
+    mismo flujo que un POST (los mensajes se agrupan con SendMessageBatch);
+    un error en uno no frena al resto.
     """
-    try:
-        now = datetime.utcnow().isoformat()
-
-        data["ingested_at"] = now
-        data["result_id"] = result_id
-        data["environment"] = ENVIRONMENT
-        data["source_format"] = SOURCE_FORMAT
-        data["payload_schema_version"] = PAYLOAD_SCHEMA_VERSION
-
-        date_prefix = datetime.utcnow().strftime("%Y/%m/%d")
-        s3_key = f"incoming/{SOURCE_FORMAT.lower()}/{date_prefix}/{result_id}.json"
-
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key=s3_key,
-            Body=json.dumps(data, indent=2),
-            ContentType="application/json",
-            ServerSideEncryption="AES256",
-            Metadata={
-                "result-id": result_id,
-                "patient-id": str(data.get("patient_id", "")),
-                "lab-id": str(data.get("lab_id", "")),
-                "test-type": str(data.get("test_type", "")),
-                "source-format": SOURCE_FORMAT,
-                "ingested-at": now,
-            },
-        )
+    outcomes: List[Dict[str, Any]] = []
+    for index, outcome in enumerate(get_writer().ingest_many(items)):
+        if outcome["status_code"] < 300:
+            item = dict(outcome["body"])
+        else:
+            item = {"error": error_message(outcome["error"])}
+        outcomes.append({"index": index, **item, "statusCode": outcome["status_code"]})
+
+    failed = sum(1 for o in outcomes if o["statusCode"] >= 400)
+    logger.info("Batch procesado: %d resultados, %d con error", len(items), failed)
+    return success_response(
+        {
+            "status": "partial" if failed else "accepted",
+            "accepted": len(items) - failed,
+            "failed": failed,
+            "results": outcomes,
+        },
+        status_code=207 if failed else 202,
+    )
 
-        logger.info("Saved to S3: s3://%s/%s", S3_BUCKET, s3_key)
-        return s3_key
 
-    except Exception as exc:
-        logger.error("Error saving to S3: %s", str(exc))
-        raise
+def is_upload_request(event: Dict[str, Any]) -> bool:
+    """True si la request viene de POST /uploads (URLs presignadas)"""
+    path = event.get("resource") or event.get("path") or ""
+    return path.rstrip("/").endswith("/uploads")
 
 
-def send_to_sqs(s3_key: str, result_id: str, data: Dict[str, Any]) -> str:
+def handle_upload_request(event: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Envía mensaje a SQS para procesamiento
+    Devuelve URLs presignadas para subir un archivo HL7/CSV/XML directo a
+    uploads/<formato>/; el adapter correspondiente lo procesa por evento S3.
     """
     try:
-        message = {
-            "result_id": result_id,
-            "s3_bucket": S3_BUCKET,
-            "s3_key": s3_key,
-            "patient_id": data.get("patient_id"),
-            "test_type": data.get("test_type"),
-            "lab_id": data.get("lab_id"),
-            "lab_name": data.get("lab_name"),
-            "source_format": SOURCE_FORMAT,
-            "payload_schema_version": PAYLOAD_SCHEMA_VERSION,
-            "timestamp": datetime.utcnow().isoformat(),
-            "environment": ENVIRONMENT,
-        }
-
-        response = sqs_client.send_message(
-            QueueUrl=SQS_QUEUE_URL,
-            MessageBody=json.dumps(message),
-            MessageAttributes={
-                "result_id": {"StringValue": result_id, "DataType": "String"},
-                "patient_id": {
-                    "StringValue": str(data.get("patient_id", "")),
-                    "DataType": "String",
-                },
-                "test_type": {
-                    "StringValue": str(data.get("test_type", "")),
-                    "DataType": "String",
-                },
-                "lab_id": {
-                    "StringValue": str(data.get("lab_id", "")),
-                    "DataType": "String",
-                },
-                "source_format": {"StringValue": SOURCE_FORMAT, "DataType": "String"},
-            },
-        )
+        request = validate_upload_request(parse_body(event))
+    except (ValueError, AttributeError) as exc:
+        return error_response(400, exc)
+
+    upload = create_upload(
+        get_s3_client(), S3_BUCKET, request, generate_ulid(), UPLOAD_URL_TTL
+    )
+    logger.info(
+        "Upload presignado: s3://%s/%s (%s)",
+        S3_BUCKET,
+        upload["key"],
+        upload["method"],
+    )
+    return success_response(upload, status_code=201)
 
-        message_id = response["MessageId"]
-        logger.info("Sent to SQS: MessageId=%s", message_id)
-        return message_id
 
-    except Exception as exc:
-        logger.error("Error sending to SQS: %s", str(exc))
-        raise
+def parse_body(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Parsea el body del request"""
+    try:
+        if "body" in event:
+            if isinstance(event["body"], str):
+                return json.loads(event["body"])
+            return event["body"]
+        return event
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Invalid JSON in request body: {str(exc)}") from exc
 
 
-def success_response(data: Dict[str, Any]) -> Dict[str, Any]:
+def success_response(
+    data: Dict[str, Any], replayed: bool = False, status_code: int = 202
+) -> Dict[str, Any]:
     """Genera respuesta exitosa para API Gateway"""
+    headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",
+    }
+    if replayed:
+        headers["Idempotent-Replayed"] = "true"
     return {
-        "statusCode": 202,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-        },
+        "statusCode": status_code,
+        "headers": headers,
         "body": json.dumps(data),
     }
 
 
+def outcome_response(outcome: Dict[str, Any]) -> Dict[str, Any]:
+    """Traduce un outcome de IngestWriter a respuesta de API Gateway"""
+    if outcome["status_code"] >= 300:
+        return error_response(outcome["status_code"], outcome["error"])
+    return success_response(outcome["body"], replayed=outcome["replayed"])
+
+
+def error_message(message: Any) -> str:
+    if isinstance(message, list):
+        return "; ".join(map(str, message))
+    return str(message)
+
+
 def error_response(status_code: int, message: Any) -> Dict[str, Any]:
     """Genera respuesta de error para API Gateway"""
-    if isinstance(message, list):
-        error_msg = "; ".join(map(str, message))
-    else:
-        error_msg = str(message)
+    error_msg = error_message(message)
 
     return {
         "statusCode": status_code,
@@ -0,0 +1,174 @@
+"""
+Subida directa a S3 de archivos grandes (HL7 / CSV / XML)
+
+POST /api/v1/uploads devuelve URLs presignadas bajo uploads/<formato>/, el
+prefijo que dispara el adapter de cada formato por evento S3. Así los archivos
+batch no pasan por los límites de payload de API Gateway ni de Lambda.
+
+  - Archivos < MULTIPART_THRESHOLD: un único PUT presignado.
+  - Archivos mayores: multipart upload; una URL presignada por parte más las
+    URLs para completar o abortar el upload.
+"""
+
+import math
+import re
+from datetime import datetime
+from typing import Any, Dict, List
+
+UPLOAD_FORMATS = {
+    "hl7": "text/plain",
+    "csv": "text/csv",
+    "xml": "application/xml",
+}
+
+MB = 1024 * 1024
+MULTIPART_THRESHOLD = 100 * MB
+MIN_PART_SIZE = 8 * MB
+MAX_PARTS = 10000
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024 * MB  # 5 TB, límite de S3 multipart
+SINGLE_PUT_MAX_BYTES = 5 * 1024 * MB  # 5 GB, límite de un PUT
+
+_FILENAME_SAFE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class UploadRequestError(ValueError):
+    """Request de upload inválida (respuesta 400)"""
+
+
+def sanitize_filename(filename: str) -> str:
+    """Deja solo caracteres seguros para una key de S3 (sin URL-encoding)"""
+    name = _FILENAME_SAFE.sub("_", filename.rsplit("/", 1)[-1]).strip("._")
+    return name[:100] or "upload"
+
+
+def build_upload_key(fmt: str, upload_id: str, filename: str) -> str:
+    """uploads/<formato>/YYYY/MM/DD/<upload_id>-<filename>"""
+    date_prefix = datetime.utcnow().strftime("%Y/%m/%d")
+    return f"uploads/{fmt}/{date_prefix}/{upload_id}-{sanitize_filename(filename)}"
+
+
+def part_size_for(size_bytes: int) -> int:
+    """Tamaño de parte (múltiplo de MB) para no pasar de MAX_PARTS partes"""
+    needed = math.ceil(size_bytes / MAX_PARTS)
+    return max(MIN_PART_SIZE, math.ceil(needed / MB) * MB)
+
+
+def validate_upload_request(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Normaliza {format, filename, size_bytes, multipart} o lanza UploadRequestError"""
+    fmt = str(body.get("format", "")).lower()
+    if fmt not in UPLOAD_FORMATS:
+        raise UploadRequestError(
+            f"'format' must be one of: {', '.join(sorted(UPLOAD_FORMATS))}"
+        )
+
+    filename = str(body.get("filename") or f"upload.{fmt}")
+
+    try:
+        size_bytes = int(body.get("size_bytes", 0))
+    except (TypeError, ValueError) as exc:
+        raise UploadRequestError("'size_bytes' must be an integer") from exc
+    if size_bytes < 0 or size_bytes > MAX_UPLOAD_BYTES:
+        raise UploadRequestError("'size_bytes' is out of range")
+
+    multipart = body.get("multipart")
+    if multipart is None:
+        multipart = size_bytes >= MULTIPART_THRESHOLD
+    multipart = bool(multipart)
+
+    if multipart and size_bytes <= 0:
+        raise UploadRequestError("'size_bytes' is required for multipart uploads")
+    if not multipart and size_bytes > SINGLE_PUT_MAX_BYTES:
+        raise UploadRequestError("Files over 5 GB must use a multipart upload")
+
+    return {
+        "format": fmt,
+        "filename": filename,
+        "size_bytes": size_bytes,
+        "multipart": multipart,
+    }
+
+
+def create_upload(
+    s3_client, bucket: str, request: Dict[str, Any], upload_id: str, expires_in: int
+) -> Dict[str, Any]:
+    """Genera las URLs presignadas para una request ya validada"""
+    fmt = request["format"]
+    key = build_upload_key(fmt, upload_id, request["filename"])
+    content_type = UPLOAD_FORMATS[fmt]
+
+    response: Dict[str, Any] = {
+        "upload_id": upload_id,
+        "bucket": bucket,
+        "key": key,
+        "format": fmt,
+        "expires_in": expires_in,
+    }
+
+    if not request["multipart"]:
+        response["method"] = "PUT"
+        response["url"] = s3_client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": bucket,
+                "Key": key,
+                "ContentType": content_type,
+                "ServerSideEncryption": "AES256",
+            },
+            ExpiresIn=expires_in,
+        )
+        # Headers firmados: el cliente debe enviarlos tal cual en el PUT
+        response["headers"] = {
+            "Content-Type": content_type,
+            "x-amz-server-side-encryption": "AES256",
+        }
+        return response
+
+    multipart = s3_client.create_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        ContentType=content_type,
+        ServerSideEncryption="AES256",
+        Metadata={"upload-id": upload_id, "source-format": fmt.upper()},
+    )
+    s3_upload_id = multipart["UploadId"]
+
+    part_size = part_size_for(request["size_bytes"])
+    part_count = math.ceil(request["size_bytes"] / part_size)
+
+    parts: List[Dict[str, Any]] = [
+        {
+            "part_number": number,
+            "url": s3_client.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": bucket,
+                    "Key": key,
+                    "UploadId": s3_upload_id,
+                    "PartNumber": number,
+                },
+                ExpiresIn=expires_in,
+            ),
+        }
+        for number in range(1, part_count + 1)
+    ]
+
+    response.update(
+        {
+            "method": "MULTIPART",
+            "multipart_upload_id": s3_upload_id,
+            "part_size": part_size,
+            "parts": parts,
+            # POST con el XML <CompleteMultipartUpload> (PartNumber + ETag)
+            "complete_url": s3_client.generate_presigned_url(
+                "complete_multipart_upload",
+                Params={"Bucket": bucket, "Key": key, "UploadId": s3_upload_id},
+                ExpiresIn=expires_in,
+            ),
+            "abort_url": s3_client.generate_presigned_url(
+                "abort_multipart_upload",
+                Params={"Bucket": bucket, "Key": key, "UploadId": s3_upload_id},
+                ExpiresIn=expires_in,
+            ),
+        }
+    )
+    return response
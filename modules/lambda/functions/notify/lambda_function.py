@@ -10,19 +10,20 @@ from datetime import datetime
 from typing import Any, Dict
 
 import boto3
-import psycopg2
+from lab_db import ConnectionManager
 
 # --------------------------------------------------
 # LOGGING
 # --------------------------------------------------
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
 # --------------------------------------------------
-# CLIENTES AWS
+# CLIENTES AWS (creados bajo demanda y reutilizados)
 # --------------------------------------------------
-ses_client = boto3.client("ses")
-secrets_client = boto3.client("secretsmanager")
+_ses_client = None
+_secrets_client = None
+_db = None
 
 # --------------------------------------------------
 # VARIABLES DE ENTORNO
@@ -36,31 +37,32 @@ SES_CONFIG_SET = os.environ.get("SES_CONFIG_SET")  # opcional
 PORTAL_URL = os.environ.get("PORTAL_URL", "https://portal.example.com")
 
 
+def get_ses_client():
+    """Devuelve el cliente SES cacheado"""
+    global _ses_client
+    if _ses_client is None:
+        _ses_client = boto3.client("ses")
+    return _ses_client
+
+
+def get_secrets_client():
+    """Devuelve el cliente de Secrets Manager cacheado"""
+    global _secrets_client
+    if _secrets_client is None:
+        _secrets_client = boto3.client("secretsmanager")
+    return _secrets_client
+
+
 # --------------------------------------------------
-# HELPERS DB + SECRETS
+# CONEXIÓN A RDS (lab_db layer)
+#   Una conexión por contenedor para las tres queries de cada record
 # --------------------------------------------------
-def get_db_credentials() -> Dict[str, Any]:
-    """
-    Obtiene credenciales de la DB desde Secrets Manager.
-    El secret debe tener: username, password, host, port, dbname
-    """
-    resp = secrets_client.get_secret_value(SecretId=DB_SECRET_ARN)
-    return json.loads(resp["SecretString"])
-
-
-def get_db_connection():
-    """Crea una conexión psycopg2 usando el secret."""
-    creds = get_db_credentials()
-    conn = psycopg2.connect(
-        host=creds["host"],
-        port=creds.get("port", 5432),
-        database=creds["dbname"],
-        user=creds["username"],
-        password=creds["password"],
-        sslmode="require",
-        connect_timeout=5,
-    )
-    return conn
+def get_db() -> ConnectionManager:
+    """Devuelve el ConnectionManager del contenedor"""
+    global _db
+    if _db is None:
+        _db = ConnectionManager.from_env(secrets_client=get_secrets_client())
+    return _db
 
 
 # --------------------------------------------------
@@ -73,7 +75,8 @@ def lambda_handler(event, context):
     """
     try:
         logger.info("Lambda Notify iniciado")
-        logger.info("Event: %s", json.dumps(event))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Event: %s", json.dumps(event))
 
         records = parse_event(event)
 
@@ -87,6 +90,8 @@ def lambda_handler(event, context):
                 results.append({"success": False, "error": str(exc)})
 
         logger.info("Procesados %d registros", len(results))
+        if _db is not None:
+            logger.info("DB connection stats: %s", _db.stats)
 
         return {
             "statusCode": 200,
@@ -171,20 +176,15 @@ def process_notification(data: Dict[str, Any]) -> Dict[str, Any]:
 def get_patient_info(patient_id: str) -> Dict[str, Any] | None:
     """Obtiene información del paciente desde RDS"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         query = """
             SELECT patient_id, first_name, last_name, email
             FROM patients
             WHERE patient_id = %s AND deleted_at IS NULL
         """
 
-        cursor.execute(query, (patient_id,))
-        row = cursor.fetchone()
-
-        cursor.close()
-        conn.close()
+        with get_db().cursor() as cursor:
+            cursor.execute(query, (patient_id,))
+            row = cursor.fetchone()
 
         if not row:
             return None
@@ -204,20 +204,15 @@ def get_patient_info(patient_id: str) -> Dict[str, Any] | None:
 def get_result_info(result_id: str) -> Dict[str, Any]:
     """Obtiene información del resultado desde RDS"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         query = """
             SELECT result_id, test_type, test_date, lab_name
             FROM lab_results
             WHERE result_id = %s
         """
 
-        cursor.execute(query, (result_id,))
-        row = cursor.fetchone()
-
-        cursor.close()
-        conn.close()
+        with get_db().cursor() as cursor:
+            cursor.execute(query, (result_id,))
+            row = cursor.fetchone()
 
         if not row:
             return {
@@ -284,7 +279,7 @@ def send_email_with_template(
         if SES_CONFIG_SET:
             kwargs["ConfigurationSetName"] = SES_CONFIG_SET
 
-        response = ses_client.send_templated_email(**kwargs)
+        response = get_ses_client().send_templated_email(**kwargs)
 
         logger.info("Templated email sent. MessageId: %s", response["MessageId"])
         return response
@@ -372,7 +367,7 @@ Healthcare Lab Platform
 
     try:
         source_address = f'"Healthcare Lab Platform" <{SENDER_EMAIL}>'
-        response = ses_client.send_email(
+        response = get_ses_client().send_email(
             Source=source_address,
             Destination={"ToAddresses": [recipient]},
             Message={
@@ -402,9 +397,6 @@ def log_notification(
 ) -> None:
     """Registra la notificación en la base de datos (opcional)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         query = """
             INSERT INTO audit_log (
                 event_type, table_name, record_id,
@@ -415,24 +407,22 @@ def log_notification(
             )
         """
 
-        cursor.execute(
-            query,
-            (
-                str(result_id),
-                patient_id,
-                json.dumps(
-                    {
-                        "message_id": email_result.get("MessageId"),
-                        "status": "sent",
-                        "timestamp": datetime.utcnow().isoformat(),
-                    }
+        # cursor() hace commit al salir
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                query,
+                (
+                    str(result_id),
+                    patient_id,
+                    json.dumps(
+                        {
+                            "message_id": email_result.get("MessageId"),
+                            "status": "sent",
+                            "timestamp": datetime.utcnow().isoformat(),
+                        }
+                    ),
                 ),
-            ),
-        )
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+            )
 
         logger.info("Notification logged to database")
 
@@ -0,0 +1,189 @@
+"""
+Modo batch del PDF Generator (traspaso de historias clínicas, backoffice)
+
+Un evento {"result_ids": [...], "output": "individual" | "zip" | "combined"}
+genera los reportes de muchos resultados en una sola invocación:
+
+  - individual: un PDF por resultado en reports/<result_id>/<version>.pdf
+    (mismo cache que el modo simple)
+  - zip: todos los PDFs en reports/batches/<batch_id>.zip
+  - combined: un único PDF con un reporte por sección, en
+    reports/batches/<batch_id>.pdf
+
+Los archivos del batch se escriben con MultipartWriter: las partes se suben
+a S3 a medida que se completan, sin armar el archivo entero en memoria.
+"""
+
+import logging
+import uuid
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+MIN_PART_SIZE = 5 * MB  # mínimo de S3 para todas las partes menos la última
+
+OUTPUT_MODES = ("individual", "zip", "combined")
+
+
+class BatchRequestError(ValueError):
+    """Request batch inválido (se responde 400)"""
+
+
+def parse_batch_request(body: Dict[str, Any], max_results: int) -> Dict[str, Any]:
+    """Valida result_ids / output; devuelve ids únicos en el orden recibido"""
+    result_ids = body.get("result_ids")
+    if not isinstance(result_ids, list) or not result_ids:
+        raise BatchRequestError("result_ids must be a non-empty list")
+
+    try:
+        unique = list(dict.fromkeys(int(r) for r in result_ids))
+    except (TypeError, ValueError):
+        raise BatchRequestError("result_ids must be integers")
+
+    if len(unique) > max_results:
+        raise BatchRequestError(
+            f"Too many result_ids: {len(unique)} (max {max_results})"
+        )
+
+    output = body.get("output", "individual")
+    if output not in OUTPUT_MODES:
+        raise BatchRequestError(f"output must be one of {', '.join(OUTPUT_MODES)}")
+
+    return {"result_ids": unique, "output": output}
+
+
+def bounded_map(
+    pool: Executor, fn: Callable[[Any], Any], items: Iterable[Any], window: int
+) -> Iterator[Any]:
+    """
+    Como pool.map (resultados en orden), pero con a lo sumo `window` tareas
+    enviadas sin consumir. Executor.map envía todo de entrada y cada resultado
+    queda en memoria hasta que se lo consume: con PDFs, O(bytes del batch).
+    """
+    pending: deque = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(pool.submit(fn, item))
+    while pending:
+        yield pending.popleft().result()
+
+
+def batch_key(prefix: str, extension: str, batch_id: Optional[str] = None) -> str:
+    return f"{prefix}/batches/{batch_id or uuid.uuid4().hex}.{extension}"
+
+
+class MultipartWriter:
+    """
+    Archivo de solo escritura sobre un multipart upload de S3
+
+    Las partes de part_size bytes se suben en paralelo (a lo sumo
+    max_workers en vuelo, lo que acota la memoria); close() sube el resto y
+    completa el upload, abort() lo descarta. No es seekable: zipfile escribe
+    entonces data descriptors en lugar de volver a los headers.
+    """
+
+    def __init__(
+        self,
+        s3,
+        bucket: str,
+        key: str,
+        part_size: int = 8 * MB,
+        max_workers: int = 4,
+        **create_kwargs,
+    ):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.max_workers = max_workers
+        self.closed = False
+        self._buffer = bytearray()
+        self._position = 0
+        self._parts: List[Future] = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        response = s3.create_multipart_upload(Bucket=bucket, Key=key, **create_kwargs)
+        self.upload_id = response["UploadId"]
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed MultipartWriter")
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._submit(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+        return len(data)
+
+    def _submit(self, body: bytes) -> None:
+        # Backpressure: no más de max_workers partes en memoria
+        pending = [f for f in self._parts if not f.done()]
+        if len(pending) >= self.max_workers:
+            pending[0].result()
+        number = len(self._parts) + 1
+        self._parts.append(self._executor.submit(self._upload_part, number, body))
+
+    def _upload_part(self, number: int, body: bytes) -> Dict[str, Any]:
+        response = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=number,
+            Body=body,
+        )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._parts:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            parts = [future.result() for future in self._parts]
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+            logger.info(f"Multipart upload completed: {self.key} ({len(parts)} parts)")
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._executor.shutdown(wait=True)
+            self.closed = True
+
+    def abort(self) -> None:
+        """Descarta el upload (las partes ya subidas no quedan cobrando)"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.s3.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+        )
+        logger.warning(f"Multipart upload aborted: {self.key}")
+        self.closed = True
+
+    def __enter__(self) -> "MultipartWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and not self.closed:
+            self.abort()
+            return False
+        self.close()
+        return False
@@ -0,0 +1,177 @@
+"""
+Reporte histórico del paciente (modo history del PDF Generator)
+
+Un evento {"patient_id": "...", "report": "history"} genera un único PDF con
+todos los resultados completados del paciente y la tendencia de cada
+analito. En lugar de get_result_data() por resultado (N queries, N renders):
+
+  - HISTORY_QUERY trae todo el historial de test_values en una sola query,
+    agrupada por test_code (y unidad) con array_agg ordenado por fecha;
+    usa idx_lab_results_patient_date y idx_test_values_result
+  - cada serie se resume (build_series) y se reduce a max_points con LTTB
+    (downsample) antes de graficarla: el costo del render depende de la
+    cantidad de analitos, no de la cantidad de valores
+
+Los valores usan canonical_value / canonical_unit cuando el worker pudo
+normalizarlos, así una serie no mezcla unidades.
+
+La key del PDF (history_version) cambia cuando cambia el contenido: los
+triggers suben lab_results.report_version ante correcciones del resultado,
+sus test_values o los datos del paciente, y el digest de (result_id,
+report_version) detecta cambios en qué resultados entran (status) aunque
+MAX y COUNT queden iguales.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+HISTORY_MAX_POINTS = 120
+
+VERSION_QUERY = """
+    SELECT
+        MAX(report_version),
+        COUNT(*),
+        md5(string_agg(
+            result_id || '@' || COALESCE(report_version::text, '0'),
+            ',' ORDER BY result_id
+        ))
+    FROM lab_results
+    WHERE patient_id = %s
+      AND status = 'completed'
+"""
+
+PATIENT_QUERY = """
+    SELECT patient_id, first_name, last_name, date_of_birth
+    FROM patients
+    WHERE patient_id = %s
+"""
+
+HISTORY_QUERY = """
+    SELECT
+        tv.test_code,
+        MAX(tv.test_name) AS test_name,
+        COALESCE(tv.canonical_unit, tv.unit) AS unit,
+        (ARRAY_AGG(tv.reference_range ORDER BY lr.test_date DESC))[1] AS reference_range,
+        ARRAY_AGG(lr.test_date ORDER BY lr.test_date) AS dates,
+        ARRAY_AGG(COALESCE(tv.canonical_value, tv.value) ORDER BY lr.test_date) AS vals,
+        ARRAY_AGG(tv.is_abnormal ORDER BY lr.test_date) AS abnormal
+    FROM lab_results lr
+    JOIN test_values tv ON tv.result_id = lr.result_id
+    WHERE lr.patient_id = %s
+      AND lr.status = 'completed'
+    GROUP BY tv.test_code, COALESCE(tv.canonical_unit, tv.unit)
+    ORDER BY tv.test_code
+"""
+
+Point = Tuple[float, float]
+
+
+def history_version(
+    version: Optional[datetime], results: int, digest: Optional[str] = None
+) -> str:
+    """Cambia si se agrega, borra o modifica un resultado del paciente"""
+    stamp = version.strftime("%Y%m%dT%H%M%S%f") if version else "0"
+    if not digest:
+        return f"{stamp}-{results}"
+    return f"{stamp}-{results}-{digest[:12]}"
+
+
+def history_key(prefix: str, patient_id: str, version: str) -> str:
+    return f"{prefix}/history/{patient_id}/{version}.pdf"
+
+
+def downsample(points: Sequence[Point], max_points: int) -> List[Point]:
+    """
+    Largest-Triangle-Three-Buckets: conserva primer y último punto y, de
+    cada bucket, el que forma el triángulo más grande con sus vecinos. Mantiene
+    picos y valles que un promedio o un muestreo fijo perderían.
+    """
+    n = len(points)
+    if max_points >= n or max_points < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket = (n - 2) / (max_points - 2)
+    a = 0
+    for i in range(max_points - 2):
+        start = int(i * bucket) + 1
+        end = int((i + 1) * bucket) + 1
+
+        # Promedio del bucket siguiente (o el último punto)
+        next_start, next_end = end, min(int((i + 2) * bucket) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        avg_x = sum(p[0] for p in points[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(p[1] for p in points[next_start:next_end]) / (next_end - next_start)
+
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def slope_per_year(points: Sequence[Point]) -> Optional[float]:
+    """Pendiente por mínimos cuadrados (x en días) expresada por año"""
+    if len(points) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(p[0] for p in points) / n
+    mean_y = sum(p[1] for p in points) / n
+    sxx = sum((p[0] - mean_x) ** 2 for p in points)
+    if sxx == 0:
+        return None
+    sxy = sum((p[0] - mean_x) * (p[1] - mean_y) for p in points)
+    return sxy / sxx * 365.25
+
+
+def build_series(row: Dict[str, Any], max_points: int) -> Dict[str, Any]:
+    """Resumen y puntos (ya reducidos) de un analito"""
+    dates = row["dates"]
+    values = [float(v) for v in row["vals"]]
+    # x = día (ordinal) con fracción horaria, para graficar y ajustar la recta
+    xs = [
+        d.toordinal() + (d.hour * 3600 + d.minute * 60 + d.second) / 86400
+        for d in dates
+    ]
+    points = list(zip(xs, values))
+
+    return {
+        "test_code": row["test_code"],
+        "test_name": row["test_name"],
+        "unit": row["unit"],
+        "reference_range": row["reference_range"],
+        "count": len(values),
+        "abnormal_count": sum(1 for flag in row["abnormal"] if flag),
+        "first_date": dates[0],
+        "last_date": dates[-1],
+        "first_value": values[0],
+        "last_value": values[-1],
+        "min_value": min(values),
+        "max_value": max(values),
+        "mean_value": sum(values) / len(values),
+        "slope_per_year": slope_per_year(points),
+        "points": downsample(points, max_points),
+    }
+
+
+def fetch_history(
+    cursor, patient_id: str, max_points: int = HISTORY_MAX_POINTS
+) -> Optional[Dict[str, Any]]:
+    """Paciente + series por analito; None si el paciente no existe"""
+    cursor.execute(PATIENT_QUERY, (patient_id,))
+    patient = cursor.fetchone()
+    if not patient:
+        return None
+
+    cursor.execute(HISTORY_QUERY, (patient_id,))
+    series = [build_series(row, max_points) for row in cursor.fetchall()]
+
+    return {**patient, "series": series}
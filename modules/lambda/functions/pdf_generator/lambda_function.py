@@ -6,28 +6,48 @@ Genera reportes PDF de resultados de laboratorio
 import os
 import json
 import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from io import BytesIO
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
 import boto3
-import psycopg2
-import psycopg2.extras
 from botocore.client import Config
+from botocore.exceptions import ClientError
+from lab_db import (
+    ConnectionManager,
+    complete_report_job,
+    fail_report_job,
+    fetch_result,
+    fetch_results,
+    start_report_job,
+)
+
+from batch import (
+    BatchRequestError,
+    MultipartWriter,
+    batch_key,
+    bounded_map,
+    parse_batch_request,
+)
+from history import VERSION_QUERY, fetch_history, history_key, history_version
+
+# psycopg2 y reportlab se importan dentro de las funciones que los usan
+# para no pagar su carga en el cold start de invocaciones que no los necesitan
 
 # --------------------------------------------------
 # LOGGING
 # --------------------------------------------------
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
 # --------------------------------------------------
-# CLIENTES AWS
+# CLIENTES AWS (creados bajo demanda y reutilizados)
 # --------------------------------------------------
-s3_client = boto3.client(
-    "s3", config=Config(signature_version="s3v4")  # Forzar SigV4 para presigned URLs
-)
-secrets_client = boto3.client("secretsmanager")
+_s3_client = None
+_secrets_client = None
+_db = None
 
 # --------------------------------------------------
 # VARIABLES DE ENTORNO
@@ -37,34 +57,43 @@ S3_BUCKET = os.environ["S3_BUCKET"]
 DB_SECRET_ARN = os.environ["DB_SECRET_ARN"]  # definido en Terraform
 SIGNED_URL_TTL = int(os.environ.get("SIGNED_URL_TTL", "3600"))
 
+# Reportes cacheados por versión: reports/<result_id>/<report_version>.pdf
+REPORTS_PREFIX = "reports"
 
-# --------------------------------------------------
-# FUNCIONES DE DB - SECRETS MANAGER
-# --------------------------------------------------
-def get_db_credentials() -> Dict[str, Any]:
-    """
-    Lee las credenciales de la DB desde Secrets Manager.
-    El secret debe tener: username, password, host, port, dbname
-    """
-    response = secrets_client.get_secret_value(SecretId=DB_SECRET_ARN)
-    secret_str = response["SecretString"]
-    return json.loads(secret_str)
+# Modo batch: máximo de resultados por invocación y renders/uploads en paralelo
+BATCH_MAX_RESULTS = int(os.environ.get("BATCH_MAX_RESULTS", "500"))
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "8"))
 
+# Reporte histórico: puntos máximos por gráfico de tendencia (LTTB)
+HISTORY_MAX_POINTS = int(os.environ.get("HISTORY_MAX_POINTS", "120"))
+
+
+def get_s3_client():
+    """Devuelve el cliente S3 cacheado (SigV4 para presigned URLs)"""
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client("s3", config=Config(signature_version="s3v4"))
+    return _s3_client
 
-def get_db_connection():
-    """
-    Crea una conexión psycopg2 usando el secret de Secrets Manager.
-    """
-    creds = get_db_credentials()
-    conn = psycopg2.connect(
-        host=creds["host"],
-        port=creds.get("port", 5432),
-        database=creds["dbname"],
-        user=creds["username"],
-        password=creds["password"],
-        sslmode="require",
-    )
-    return conn
+
+def get_secrets_client():
+    """Devuelve el cliente de Secrets Manager cacheado"""
+    global _secrets_client
+    if _secrets_client is None:
+        _secrets_client = boto3.client("secretsmanager")
+    return _secrets_client
+
+
+# --------------------------------------------------
+# CONEXIÓN A RDS (lab_db layer)
+#   La conexión y el secret se reutilizan entre invocaciones calientes
+# --------------------------------------------------
+def get_db() -> ConnectionManager:
+    """Devuelve el ConnectionManager del contenedor"""
+    global _db
+    if _db is None:
+        _db = ConnectionManager.from_env(secrets_client=get_secrets_client())
+    return _db
 
 
 # --------------------------------------------------
@@ -73,11 +102,38 @@ def get_db_connection():
 def lambda_handler(event, context):
     """
     Handler principal
-    Genera PDF para un result_id específico
+    - Invocación directa / API: genera (o reutiliza) el PDF de un result_id
+      y devuelve la signed URL
+    - SNS result-ready: pre-genera el PDF en background para que la descarga
+      desde el portal lo encuentre en cache
+    - Batch ({"result_ids": [...]}): muchos reportes en una invocación
+    - Job del portal ({"job_id", "result_id"}, invocación asíncrona): genera
+      el PDF y deja el estado en report_jobs
+    - Histórico ({"patient_id", "report": "history"}): todos los resultados
+      del paciente con la tendencia de cada analito, en un PDF
     """
     try:
         logger.info("Lambda PDF Generator iniciado")
-        logger.info(f"Event: {json.dumps(event)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Event: %s", json.dumps(event))
+
+        if is_sns_event(event):
+            return pregenerate_reports(event)
+
+        if is_job_event(event):
+            return run_report_job(event["job_id"], event["result_id"])
+
+        history_body = extract_history_body(event)
+        if history_body is not None:
+            return history_report(history_body.get("patient_id"))
+
+        batch_body = extract_batch_body(event)
+        if batch_body is not None:
+            try:
+                request = parse_batch_request(batch_body, BATCH_MAX_RESULTS)
+            except BatchRequestError as e:
+                return error_response(400, str(e))
+            return success_response(generate_batch(**request))
 
         # Obtener result_id del evento
         result_id = extract_result_id(event)
@@ -87,40 +143,298 @@ def lambda_handler(event, context):
 
         logger.info(f"Generando PDF para result_id: {result_id}")
 
-        # 1. Obtener datos del resultado desde RDS
-        result_data = get_result_data(result_id)
-
-        if not result_data:
+        report = ensure_report(result_id)
+        if report is None:
             return error_response(404, f"Result not found: {result_id}")
 
-        # 2. Generar PDF
-        pdf_buffer = generate_pdf(result_data)
+        s3_key, cached = report
 
-        # 3. Guardar PDF en S3
-        s3_key = save_pdf_to_s3(pdf_buffer, result_id)
-
-        # 4. Generar signed URL
+        # Generar signed URL
         signed_url = generate_signed_url(s3_key, expiration=SIGNED_URL_TTL)
 
-        logger.info(f"PDF generado exitosamente: {s3_key}")
-
         return success_response(
             {
                 "result_id": result_id,
                 "s3_key": s3_key,
                 "signed_url": signed_url,
                 "expires_in": SIGNED_URL_TTL,
+                "cached": cached,
             }
         )
 
     except Exception as e:
         logger.error(f"Error en lambda_handler: {str(e)}", exc_info=True)
+        # Los eventos SNS se reintentan si la invocación falla
+        if is_sns_event(event):
+            raise
         return error_response(500, f"Internal server error: {str(e)}")
 
+    finally:
+        if _db is not None:
+            logger.info("DB connection stats: %s", _db.stats)
+
+
+def ensure_report(result_id) -> Optional[Tuple[str, bool]]:
+    """
+    Devuelve (s3_key, cached) del PDF de la versión actual del resultado,
+    renderizándolo si no está en S3. None si el resultado no existe.
+    """
+    # 1. Versión del resultado (report_version): si ya hay PDF, no se renderiza
+    version = get_result_version(result_id)
+    if version is None:
+        return None
+
+    s3_key = report_key(result_id, version)
+    if report_exists(s3_key):
+        logger.info(f"PDF en cache: {s3_key}")
+        return s3_key, True
+
+    # 2. Obtener datos del resultado desde RDS
+    result_data = get_result_data(result_id)
+    if not result_data:
+        return None
+
+    # 3. Generar PDF, guardarlo y borrar versiones anteriores
+    return render_and_store(result_data), False
+
+
+def render_and_store(data: Dict[str, Any]) -> str:
+    """Renderiza el reporte y lo guarda bajo la versión de los datos leídos"""
+    result_id = data["result_id"]
+    s3_key = report_key(result_id, report_version(data["report_version"]))
+
+    save_pdf_to_s3(generate_pdf(data), result_id, s3_key)
+    invalidate_stale_reports(result_id, keep=s3_key)
+
+    logger.info(f"PDF generado exitosamente: {s3_key}")
+    return s3_key
+
+
+def pregenerate_reports(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Renderiza los PDFs de los resultados anunciados en el topic result-ready"""
+    generated = []
+    for record in event["Records"]:
+        message = json.loads(record["Sns"]["Message"])
+        result_id = message.get("result_id")
+        if not result_id:
+            logger.warning("Mensaje SNS sin result_id, se ignora")
+            continue
+
+        report = ensure_report(result_id)
+        if report is None:
+            logger.warning(f"Result not found for pre-generation: {result_id}")
+            continue
+        generated.append({"result_id": result_id, "s3_key": report[0]})
+
+    logger.info(f"Pre-generados {len(generated)} reportes")
+    return {"statusCode": 200, "body": json.dumps({"reports": generated})}
+
+
+def run_report_job(job_id: int, result_id: int) -> Dict[str, Any]:
+    """
+    Job pedido por el portal: el portal no espera la respuesta (invocación
+    Event), consulta report_jobs. Los errores quedan en el job y no se
+    relanzan, así Lambda no reintenta y el portal puede re-enviarlo.
+    """
+    logger.info(f"Report job {job_id} para result_id: {result_id}")
+    with get_db().cursor() as cursor:
+        start_report_job(cursor, job_id)
+
+    try:
+        report = ensure_report(result_id)
+        if report is None:
+            raise LookupError(f"Result not found: {result_id}")
+    except Exception as e:
+        logger.error(f"Report job {job_id} failed: {str(e)}", exc_info=True)
+        with get_db().cursor() as cursor:
+            fail_report_job(cursor, job_id, str(e))
+        return error_response(500, f"Report job {job_id} failed: {str(e)}")
+
+    s3_key, cached = report
+    with get_db().cursor() as cursor:
+        complete_report_job(cursor, job_id, s3_key)
+
+    return success_response(
+        {"job_id": job_id, "result_id": result_id, "s3_key": s3_key, "cached": cached}
+    )
+
+
+# --------------------------------------------------
+# REPORTE HISTÓRICO
+# --------------------------------------------------
+def history_report(patient_id: Optional[str]) -> Dict[str, Any]:
+    if not patient_id:
+        return error_response(400, "Missing patient_id")
+
+    logger.info(f"Generando reporte histórico para patient_id: {patient_id}")
+    report = ensure_history_report(str(patient_id))
+    if report is None:
+        return error_response(404, f"No completed results for patient: {patient_id}")
+
+    s3_key, cached = report
+    return success_response(
+        {
+            "patient_id": patient_id,
+            "s3_key": s3_key,
+            "signed_url": generate_signed_url(s3_key, expiration=SIGNED_URL_TTL),
+            "expires_in": SIGNED_URL_TTL,
+            "cached": cached,
+        }
+    )
+
+
+def ensure_history_report(patient_id: str) -> Optional[Tuple[str, bool]]:
+    """
+    (s3_key, cached) del histórico del paciente. La versión cambia con cada
+    resultado nuevo o modificado; si ya está en S3 no se consulta el historial.
+    """
+    with get_db().cursor() as cursor:
+        cursor.execute(VERSION_QUERY, (patient_id,))
+        version, results, digest = cursor.fetchone()
+    if not results:
+        return None
+
+    s3_key = history_key(
+        REPORTS_PREFIX, patient_id, history_version(version, results, digest)
+    )
+    if report_exists(s3_key):
+        logger.info(f"PDF en cache: {s3_key}")
+        return s3_key, True
+
+    history = get_history_data(patient_id)
+    if not history or not history["series"]:
+        return None
+
+    save_pdf_to_s3(generate_history_pdf(history), patient_id, s3_key)
+    invalidate_stale_reports(patient_id, keep=s3_key)
+    return s3_key, False
+
+
+# --------------------------------------------------
+# MODO BATCH
+# --------------------------------------------------
+def generate_batch(result_ids: List[int], output: str) -> Dict[str, Any]:
+    """
+    Reportes de muchos resultados con dos queries en total; los renders y
+    uploads corren en BATCH_WORKERS threads de la misma invocación
+    """
+    results = get_results_data(result_ids)
+    found = [results[r] for r in result_ids if r in results]
+    response: Dict[str, Any] = {
+        "output": output,
+        "count": len(found),
+        "missing": [r for r in result_ids if r not in results],
+    }
+    if not found:
+        return response
+
+    if output == "individual":
+        # Cliente creado antes de abrir el pool (crearlos no es thread-safe)
+        get_s3_client()
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+            response["reports"] = list(pool.map(store_batch_report, found))
+    else:
+        s3_key = write_bundle(found, output)
+        response.update(
+            s3_key=s3_key,
+            signed_url=generate_signed_url(s3_key, expiration=SIGNED_URL_TTL),
+            expires_in=SIGNED_URL_TTL,
+        )
+
+    logger.info(f"Batch {output}: {len(found)} reportes")
+    return response
+
+
+def store_batch_report(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Modo individual: usa el cache por versión igual que el modo simple"""
+    s3_key = report_key(data["result_id"], report_version(data["report_version"]))
+    cached = report_exists(s3_key)
+    if not cached:
+        render_and_store(data)
+
+    return {
+        "result_id": data["result_id"],
+        "s3_key": s3_key,
+        "cached": cached,
+        "signed_url": generate_signed_url(s3_key, expiration=SIGNED_URL_TTL),
+    }
+
+
+def write_bundle(results: List[Dict[str, Any]], output: str) -> str:
+    """Zip o PDF combinado, escrito a S3 por multipart mientras se genera"""
+    extension, content_type = (
+        ("zip", "application/zip") if output == "zip" else ("pdf", "application/pdf")
+    )
+    s3_key = batch_key(REPORTS_PREFIX, extension)
+
+    with MultipartWriter(
+        get_s3_client(),
+        S3_BUCKET,
+        s3_key,
+        ContentType=content_type,
+        ServerSideEncryption="AES256",
+    ) as out:
+        if output == "zip":
+            # Los PDFs ya vienen comprimidos: ZIP_STORED no gasta CPU de más.
+            # Ventana de 2 x BATCH_WORKERS renders: cada PDF se escribe y se
+            # libera antes de enviar más, la memoria no crece con el batch
+            with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+                with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as bundle:
+                    pdfs = bounded_map(pool, generate_pdf, results, 2 * BATCH_WORKERS)
+                    for data, pdf in zip(results, pdfs):
+                        bundle.writestr(
+                            f"result_{data['result_id']}.pdf", pdf.getvalue()
+                        )
+                        pdf.close()
+        else:
+            generate_combined_pdf(results, out)
+
+    return s3_key
+
 
 # --------------------------------------------------
 # HELPERS PARA EVENTO
 # --------------------------------------------------
+def is_sns_event(event: Dict[str, Any]) -> bool:
+    records = event.get("Records") or []
+    return bool(records) and "Sns" in records[0]
+
+
+def is_job_event(event: Dict[str, Any]) -> bool:
+    return "job_id" in event and "result_id" in event
+
+
+def extract_batch_body(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Body del request batch (invocación directa o API), o None"""
+    if "result_ids" in event:
+        return event
+
+    body = event.get("body")
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return None
+    if isinstance(body, dict) and "result_ids" in body:
+        return body
+    return None
+
+
+def extract_history_body(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Body del pedido de reporte histórico (invocación directa o API), o None"""
+    body = event.get("body")
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            body = None
+
+    for candidate in (event, body):
+        if isinstance(candidate, dict) and candidate.get("report") == "history":
+            return candidate
+    return None
+
+
 def extract_result_id(event: Dict[str, Any]) -> str:
     """Extrae result_id del evento"""
 
@@ -151,69 +465,43 @@ def extract_result_id(event: Dict[str, Any]) -> str:
 # --------------------------------------------------
 # CONSULTAS A RDS
 # --------------------------------------------------
+def get_result_version(result_id: str) -> Optional[str]:
+    """Versión del resultado (lab_results.report_version); None si no existe"""
+    with get_db().cursor() as cursor:
+        cursor.execute(
+            "SELECT report_version FROM lab_results WHERE result_id = %s",
+            (result_id,),
+        )
+        row = cursor.fetchone()
+
+    if not row:
+        return None
+    return report_version(row[0])
+
+
 def get_result_data(result_id: str) -> Dict[str, Any]:
-    """Obtiene todos los datos del resultado desde RDS"""
+    """Obtiene todos los datos del resultado desde RDS (una sola query)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
-        # Query principal
-        query = """
-            SELECT
-                lr.result_id,
-                lr.patient_id,
-                p.first_name,
-                p.last_name,
-                p.date_of_birth,
-                lr.lab_name,
-                lr.test_type,
-                lr.test_date,
-                lr.physician_name,
-                lr.physician_npi,
-                lr.notes,
-                lr.created_at
-            FROM lab_results lr
-            JOIN patients p ON lr.patient_id = p.patient_id
-            WHERE lr.result_id = %s
-        """
-
-        cursor.execute(query, (result_id,))
-        result = cursor.fetchone()
-        if not result:
-            cursor.close()
-            conn.close()
-            return None
+        with get_db().cursor() as cursor:
+            return fetch_result(cursor, int(result_id))
 
-        result_data = dict(result)
+    except Exception as e:
+        logger.error(f"Error querying RDS: {str(e)}")
+        raise
 
-        # Query para obtener valores de tests
-        values_query = """
-            SELECT
-                test_code,
-                test_name,
-                value,
-                unit,
-                reference_range,
-                is_abnormal,
-                severity
-            FROM test_values
-            WHERE result_id = %s
-            ORDER BY test_code
-        """
 
-        cursor.execute(values_query, (result_id,))
-        test_values = cursor.fetchall()
+def get_results_data(result_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Datos de varios resultados (result_id -> datos) con una sola query"""
+    with get_db().cursor() as cursor:
+        return fetch_results(cursor, result_ids)
 
-        result_data["test_values"] = [dict(row) for row in test_values]
 
-        cursor.close()
-        conn.close()
+def get_history_data(patient_id: str) -> Optional[Dict[str, Any]]:
+    """Paciente + series por analito (todo el historial en una query)"""
+    import psycopg2.extras
 
-        return result_data
-
-    except Exception as e:
-        logger.error(f"Error querying RDS: {str(e)}")
-        raise
+    with get_db().cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+        return fetch_history(cursor, patient_id, HISTORY_MAX_POINTS)
 
 
 # --------------------------------------------------
@@ -224,24 +512,31 @@ def generate_pdf(data: Dict[str, Any]) -> BytesIO:
     Genera el PDF con los datos del resultado
     Usa ReportLab para crear el PDF
     """
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib import colors
-    from reportlab.lib.units import inch
-    from reportlab.platypus import (
-        SimpleDocTemplate,
-        Table,
-        TableStyle,
-        Paragraph,
-        Spacer,
-    )
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_CENTER
-
     buffer = BytesIO()
+    new_document(buffer).build(build_story(data))
+    buffer.seek(0)
+    return buffer
+
+
+def generate_combined_pdf(results: List[Dict[str, Any]], output) -> None:
+    """Un único PDF con el reporte de cada resultado, uno por página nueva"""
+    from reportlab.platypus import PageBreak
+
+    story = []
+    for data in results:
+        if story:
+            story.append(PageBreak())
+        story.extend(build_story(data))
+    new_document(output).build(story)
+
+
+def new_document(output):
+    """Documento ReportLab (carta, márgenes de 1") que escribe en output"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate
 
-    # Crear documento
-    doc = SimpleDocTemplate(
-        buffer,
+    return SimpleDocTemplate(
+        output,
         pagesize=letter,
         rightMargin=72,
         leftMargin=72,
@@ -249,35 +544,27 @@ def generate_pdf(data: Dict[str, Any]) -> BytesIO:
         bottomMargin=72,
     )
 
-    # Estilos
-    styles = getSampleStyleSheet()
 
-    title_style = ParagraphStyle(
-        "CustomTitle",
-        parent=styles["Heading1"],
-        fontSize=24,
-        textColor=colors.HexColor("#2c3e50"),
-        spaceAfter=30,
-        alignment=TA_CENTER,
-    )
+def build_story(data: Dict[str, Any]) -> list:
+    """Flowables del reporte de un resultado (estilos fijos en report_template)"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer, Table
 
-    heading_style = ParagraphStyle(
-        "CustomHeading",
-        parent=styles["Heading2"],
-        fontSize=14,
-        textColor=colors.HexColor("#34495e"),
-        spaceAfter=12,
+    from report_template import (
+        INFO_COL_WIDTHS,
+        RESULTS_COL_WIDTHS,
+        RESULTS_HEADER,
+        get_template,
     )
 
-    # Contenido del PDF
-    story = []
+    template = get_template()
+    generated_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC")
 
     # Header/Logo (opcional)
-    story.append(Paragraph("Healthcare Lab Results", title_style))
-    story.append(Spacer(1, 0.3 * inch))
+    story = template.header()
 
     # Información del paciente
-    story.append(Paragraph("Patient Information", heading_style))
+    story.append(template.heading("Patient Information"))
 
     patient_data = [
         ["Name:", f"{data['first_name']} {data['last_name']}"],
@@ -290,31 +577,17 @@ def generate_pdf(data: Dict[str, Any]) -> BytesIO:
                 else "N/A"
             ),
         ],
-        ["Report Generated:", datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC")],
+        ["Report Generated:", generated_at],
     ]
 
-    patient_table = Table(patient_data, colWidths=[2 * inch, 4 * inch])
-    patient_table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (0, -1), colors.HexColor("#ecf0f1")),
-                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
-                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                ("FONTNAME", (0, 0), (0, -1), "Helvetica-Bold"),
-                ("FONTNAME", (1, 0), (1, -1), "Helvetica"),
-                ("FONTSIZE", (0, 0), (-1, -1), 10),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 8),
-                ("TOPPADDING", (0, 0), (-1, -1), 8),
-                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-            ]
-        )
-    )
+    patient_table = Table(patient_data, colWidths=INFO_COL_WIDTHS)
+    patient_table.setStyle(template.info_table_style)
 
     story.append(patient_table)
     story.append(Spacer(1, 0.3 * inch))
 
     # Información del test
-    story.append(Paragraph("Test Information", heading_style))
+    story.append(template.heading("Test Information"))
 
     test_info_data = [
         ["Lab:", data["lab_name"]],
@@ -331,35 +604,20 @@ def generate_pdf(data: Dict[str, Any]) -> BytesIO:
         ["NPI:", data.get("physician_npi", "N/A")],
     ]
 
-    test_info_table = Table(test_info_data, colWidths=[2 * inch, 4 * inch])
-    test_info_table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (0, -1), colors.HexColor("#ecf0f1")),
-                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
-                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                ("FONTNAME", (0, 0), (0, -1), "Helvetica-Bold"),
-                ("FONTNAME", (1, 0), (1, -1), "Helvetica"),
-                ("FONTSIZE", (0, 0), (-1, -1), 10),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 8),
-                ("TOPPADDING", (0, 0), (-1, -1), 8),
-                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-            ]
-        )
-    )
+    test_info_table = Table(test_info_data, colWidths=INFO_COL_WIDTHS)
+    test_info_table.setStyle(template.info_table_style)
 
     story.append(test_info_table)
     story.append(Spacer(1, 0.4 * inch))
 
     # Resultados de tests
-    story.append(Paragraph("Test Results", heading_style))
-
-    # Header de la tabla de resultados
-    results_data = [["Test", "Result", "Unit", "Reference Range", "Status"]]
+    story.append(template.heading("Test Results"))
 
-    # Datos de los tests
-    for test in data["test_values"]:
-        status = "ABNORMAL" if test["is_abnormal"] else "Normal"
+    results_data = [RESULTS_HEADER]
+    abnormal_rows = []
+    for idx, test in enumerate(data["test_values"], start=1):
+        if test["is_abnormal"]:
+            abnormal_rows.extend(template.abnormal_row(idx))
 
         results_data.append(
             [
@@ -367,120 +625,229 @@ def generate_pdf(data: Dict[str, Any]) -> BytesIO:
                 str(test["value"]),
                 test["unit"],
                 test["reference_range"],
-                status,
+                "ABNORMAL" if test["is_abnormal"] else "Normal",
             ]
         )
 
-    results_table = Table(
-        results_data,
-        colWidths=[2.2 * inch, 0.9 * inch, 0.9 * inch, 1.3 * inch, 1 * inch],
-    )
-
-    # Estilo de la tabla de resultados
-    table_style = [
-        # Header
-        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#3498db")),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-        ("ALIGN", (0, 0), (-1, 0), "CENTER"),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("FONTSIZE", (0, 0), (-1, 0), 11),
-        ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-        # Body
-        ("TEXTCOLOR", (0, 1), (-1, -1), colors.black),
-        ("ALIGN", (1, 1), (3, -1), "CENTER"),
-        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
-        ("FONTSIZE", (0, 1), (-1, -1), 9),
-        ("BOTTOMPADDING", (0, 1), (-1, -1), 8),
-        ("TOPPADDING", (0, 1), (-1, -1), 8),
-        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-        # Alternar colores de fila
-        (
-            "ROWBACKGROUNDS",
-            (0, 1),
-            (-1, -1),
-            [colors.white, colors.HexColor("#f8f9fa")],
-        ),
-    ]
-
+    results_table = Table(results_data, colWidths=RESULTS_COL_WIDTHS)
+    results_table.setStyle(template.results_table_style)
     # Resaltar valores anormales
-    for idx, test in enumerate(data["test_values"], start=1):
-        if test["is_abnormal"]:
-            table_style.extend(
-                [
-                    ("BACKGROUND", (4, idx), (4, idx), colors.HexColor("#e74c3c")),
-                    ("TEXTCOLOR", (4, idx), (4, idx), colors.white),
-                    ("FONTNAME", (4, idx), (4, idx), "Helvetica-Bold"),
-                ]
-            )
+    if abnormal_rows:
+        results_table.setStyle(abnormal_rows)
 
-    results_table.setStyle(TableStyle(table_style))
     story.append(results_table)
     story.append(Spacer(1, 0.3 * inch))
 
     # Notas (si existen)
     if data.get("notes"):
-        story.append(Paragraph("Additional Notes", heading_style))
-        notes_style = ParagraphStyle(
-            "Notes",
-            parent=styles["Normal"],
-            fontSize=10,
-            leading=14,
-        )
-        story.append(Paragraph(data["notes"], notes_style))
+        story.append(template.heading("Additional Notes"))
+        story.append(Paragraph(data["notes"], template.notes_style))
         story.append(Spacer(1, 0.3 * inch))
 
     # Disclaimer
-    disclaimer_style = ParagraphStyle(
-        "Disclaimer",
-        parent=styles["Normal"],
-        fontSize=8,
-        textColor=colors.HexColor("#7f8c8d"),
-        leading=10,
+    story.extend(template.disclaimer())
+
+    # Footer
+    story.append(Spacer(1, 0.3 * inch))
+    story.append(
+        Paragraph(
+            f"Result ID: {data['result_id']} | Generated: {generated_at}",
+            template.footer_style,
+        )
     )
 
-    disclaimer_text = """
-    <b>Important Notice:</b> These results have been reviewed and released by your healthcare provider.
-    If you have any questions or concerns about your results, please contact your physician.
-    This report is confidential and intended only for the patient named above.
-    """
+    return story
 
-    story.append(Spacer(1, 0.2 * inch))
-    story.append(Paragraph(disclaimer_text, disclaimer_style))
 
-    # Footer
-    footer_style = ParagraphStyle(
-        "Footer",
-        parent=styles["Normal"],
-        fontSize=8,
-        textColor=colors.grey,
-        alignment=TA_CENTER,
+def generate_history_pdf(history: Dict[str, Any]) -> BytesIO:
+    """PDF del histórico del paciente (resumen + tendencia por analito)"""
+    buffer = BytesIO()
+    new_document(buffer).build(build_history_story(history))
+    buffer.seek(0)
+    return buffer
+
+
+def build_history_story(history: Dict[str, Any]) -> list:
+    """Flowables del reporte histórico: un gráfico por analito, ya reducido"""
+    from reportlab.lib.units import inch
+    from reportlab.platypus import KeepTogether, Paragraph, Spacer, Table
+
+    from report_template import (
+        HISTORY_COL_WIDTHS,
+        HISTORY_HEADER,
+        INFO_COL_WIDTHS,
+        get_template,
     )
 
+    template = get_template()
+    generated_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M UTC")
+    series = history["series"]
+
+    story = template.header()
+
+    # Información del paciente y período cubierto
+    story.append(template.heading("Patient Information"))
+    first = min(s["first_date"] for s in series)
+    last = max(s["last_date"] for s in series)
+    patient_data = [
+        ["Name:", f"{history['first_name']} {history['last_name']}"],
+        ["Patient ID:", history["patient_id"]],
+        [
+            "Date of Birth:",
+            (
+                history["date_of_birth"].strftime("%Y-%m-%d")
+                if history["date_of_birth"]
+                else "N/A"
+            ),
+        ],
+        ["Period:", f"{first:%Y-%m-%d} to {last:%Y-%m-%d}"],
+        ["Report Generated:", generated_at],
+    ]
+    patient_table = Table(patient_data, colWidths=INFO_COL_WIDTHS)
+    patient_table.setStyle(template.info_table_style)
+    story.append(patient_table)
+    story.append(Spacer(1, 0.4 * inch))
+
+    # Resumen: último valor y tendencia de cada analito
+    story.append(template.heading("Results Summary"))
+    summary_data = [HISTORY_HEADER]
+    for s in series:
+        slope = s["slope_per_year"]
+        summary_data.append(
+            [
+                s["test_name"],
+                f"{s['last_value']:g}",
+                s["unit"],
+                f"{s['min_value']:g} - {s['max_value']:g}",
+                f"{slope:+.2f}" if slope is not None else "-",
+                f"{s['abnormal_count']}/{s['count']}",
+            ]
+        )
+    summary_table = Table(summary_data, colWidths=HISTORY_COL_WIDTHS, repeatRows=1)
+    summary_table.setStyle(template.results_table_style)
+    story.append(summary_table)
+    story.append(Spacer(1, 0.4 * inch))
+
+    # Tendencias
+    story.append(template.heading("Trends"))
+    for s in series:
+        caption = (
+            f"<b>{s['test_name']}</b> ({s['test_code']}, {s['unit']}) - "
+            f"{s['count']} results, reference range {s['reference_range'] or 'N/A'}"
+        )
+        story.append(
+            KeepTogether(
+                [
+                    Paragraph(caption, template.notes_style),
+                    trend_chart(s["points"]),
+                    Spacer(1, 0.2 * inch),
+                ]
+            )
+        )
+
+    story.extend(template.disclaimer())
     story.append(Spacer(1, 0.3 * inch))
     story.append(
         Paragraph(
-            f"Result ID: {data['result_id']} | Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}",
-            footer_style,
+            f"Patient ID: {history['patient_id']} | Generated: {generated_at}",
+            template.footer_style,
         )
     )
+    return story
 
-    # Construir PDF
-    doc.build(story)
 
-    buffer.seek(0)
-    return buffer
+def trend_chart(points: List[Tuple[float, float]]):
+    """Gráfico de línea de una serie (x = día ordinal, y = valor)"""
+    from datetime import date
+
+    from reportlab.graphics.charts.lineplots import LinePlot
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.graphics.widgets.markers import makeMarker
+
+    from report_template import CHART_COLOR, CHART_SIZE
+
+    width, height = CHART_SIZE
+    drawing = Drawing(width, height)
+
+    plot = LinePlot()
+    plot.x, plot.y = 40, 20
+    plot.width, plot.height = width - 50, height - 30
+    plot.data = [list(points)]
+    plot.lines[0].strokeColor = CHART_COLOR
+    plot.lines[0].symbol = makeMarker("FilledCircle", size=2)
+
+    # Un solo punto (o valores iguales): abrir el rango para que haya escala
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    if min(xs) == max(xs):
+        plot.xValueAxis.valueMin, plot.xValueAxis.valueMax = xs[0] - 15, xs[0] + 15
+    if min(ys) == max(ys):
+        margin = abs(ys[0]) * 0.1 or 1
+        plot.yValueAxis.valueMin = ys[0] - margin
+        plot.yValueAxis.valueMax = ys[0] + margin
+
+    plot.xValueAxis.labelTextFormat = lambda x: date.fromordinal(int(x)).strftime(
+        "%b %Y"
+    )
+    plot.xValueAxis.labels.fontSize = 7
+    plot.yValueAxis.labels.fontSize = 7
+
+    drawing.add(plot)
+    return drawing
+
+
+# --------------------------------------------------
+# CACHE DE REPORTES
+# --------------------------------------------------
+def report_version(version: Optional[datetime]) -> str:
+    """
+    lab_results.report_version -> versión usada en la key ("0" si la fila no
+    la tiene). Los triggers la cambian cuando cambia algo que el reporte
+    muestra (el resultado, sus test_values o los datos del paciente), no en
+    updates de bookkeeping (s3_processed_key, ...).
+    """
+    if not version:
+        return "0"
+    return version.strftime("%Y%m%dT%H%M%S%f")
+
+
+def report_key(result_id: str, version: str) -> str:
+    return f"{REPORTS_PREFIX}/{result_id}/{version}.pdf"
+
+
+def report_exists(s3_key: str) -> bool:
+    """True si el PDF de esa versión ya está en S3"""
+    try:
+        get_s3_client().head_object(Bucket=S3_BUCKET, Key=s3_key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+def invalidate_stale_reports(result_id: str, keep: str) -> int:
+    """Borra las versiones anteriores del reporte (mismo directorio que keep)"""
+    s3 = get_s3_client()
+    response = s3.list_objects_v2(Bucket=S3_BUCKET, Prefix=keep.rsplit("/", 1)[0] + "/")
+    stale = [
+        {"Key": obj["Key"]}
+        for obj in response.get("Contents", [])
+        if obj["Key"] != keep
+    ]
+    if stale:
+        s3.delete_objects(Bucket=S3_BUCKET, Delete={"Objects": stale, "Quiet": True})
+        logger.info(f"Invalidated {len(stale)} stale reports for {result_id}")
+    return len(stale)
 
 
 # --------------------------------------------------
 # S3 + SIGNED URL
 # --------------------------------------------------
-def save_pdf_to_s3(pdf_buffer: BytesIO, result_id: str) -> str:
+def save_pdf_to_s3(pdf_buffer: BytesIO, result_id: str, s3_key: str) -> str:
     """Guarda el PDF en S3"""
     try:
-        timestamp = datetime.utcnow().strftime("%Y/%m/%d")
-        s3_key = f"reports/{timestamp}/{result_id}.pdf"
-
-        s3_client.put_object(
+        get_s3_client().put_object(
             Bucket=S3_BUCKET,
             Key=s3_key,
             Body=pdf_buffer.getvalue(),
@@ -503,7 +870,7 @@ def save_pdf_to_s3(pdf_buffer: BytesIO, result_id: str) -> str:
 def generate_signed_url(s3_key: str, expiration: int = 3600) -> str:
     """Genera una signed URL para descargar el PDF"""
     try:
-        url = s3_client.generate_presigned_url(
+        url = get_s3_client().generate_presigned_url(
             "get_object",
             Params={"Bucket": S3_BUCKET, "Key": s3_key},
             ExpiresIn=expiration,
@@ -0,0 +1,177 @@
+"""
+Plantilla del reporte PDF: estilos y fragmentos estáticos
+
+getSampleStyleSheet(), los ParagraphStyle / TableStyle y el parseo de los
+párrafos fijos (título, headings, disclaimer) no dependen del resultado, así
+que se construyen una sola vez por contenedor (get_template()) y cada render
+solo arma las tablas y párrafos con datos.
+
+Los párrafos fijos se entregan como copias (copy.copy): comparten el texto
+ya parseado pero no el estado de layout, así un mismo párrafo puede aparecer
+varias veces en un PDF combinado o en renders de threads distintos.
+"""
+
+import copy
+from typing import List, Optional
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, Spacer, TableStyle
+
+TITLE = "Healthcare Lab Results"
+
+DISCLAIMER = """
+<b>Important Notice:</b> These results have been reviewed and released by your healthcare provider.
+If you have any questions or concerns about your results, please contact your physician.
+This report is confidential and intended only for the patient named above.
+"""
+
+INFO_COL_WIDTHS = [2 * inch, 4 * inch]
+RESULTS_COL_WIDTHS = [2.2 * inch, 0.9 * inch, 0.9 * inch, 1.3 * inch, 1 * inch]
+RESULTS_HEADER = ["Test", "Result", "Unit", "Reference Range", "Status"]
+
+# Reporte histórico: resumen por analito y gráficos de tendencia
+HISTORY_COL_WIDTHS = [
+    2 * inch,
+    0.8 * inch,
+    0.8 * inch,
+    1.2 * inch,
+    0.8 * inch,
+    0.7 * inch,
+]
+HISTORY_HEADER = ["Test", "Latest", "Unit", "Min - Max", "Trend/yr", "Abnormal"]
+CHART_SIZE = (6.3 * inch, 1.5 * inch)
+CHART_COLOR = colors.HexColor("#3498db")
+
+ABNORMAL_COLOR = colors.HexColor("#e74c3c")
+
+
+class ReportTemplate:
+    """Estilos y flowables estáticos del reporte de resultados"""
+
+    def __init__(self):
+        styles = getSampleStyleSheet()
+
+        self.title_style = ParagraphStyle(
+            "CustomTitle",
+            parent=styles["Heading1"],
+            fontSize=24,
+            textColor=colors.HexColor("#2c3e50"),
+            spaceAfter=30,
+            alignment=TA_CENTER,
+        )
+        self.heading_style = ParagraphStyle(
+            "CustomHeading",
+            parent=styles["Heading2"],
+            fontSize=14,
+            textColor=colors.HexColor("#34495e"),
+            spaceAfter=12,
+        )
+        self.notes_style = ParagraphStyle(
+            "Notes",
+            parent=styles["Normal"],
+            fontSize=10,
+            leading=14,
+        )
+        self.disclaimer_style = ParagraphStyle(
+            "Disclaimer",
+            parent=styles["Normal"],
+            fontSize=8,
+            textColor=colors.HexColor("#7f8c8d"),
+            leading=10,
+        )
+        self.footer_style = ParagraphStyle(
+            "Footer",
+            parent=styles["Normal"],
+            fontSize=8,
+            textColor=colors.grey,
+            alignment=TA_CENTER,
+        )
+
+        # Tablas de paciente / test: etiqueta + valor
+        self.info_table_style = TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (0, -1), colors.HexColor("#ecf0f1")),
+                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+                ("FONTNAME", (0, 0), (0, -1), "Helvetica-Bold"),
+                ("FONTNAME", (1, 0), (1, -1), "Helvetica"),
+                ("FONTSIZE", (0, 0), (-1, -1), 10),
+                ("BOTTOMPADDING", (0, 0), (-1, -1), 8),
+                ("TOPPADDING", (0, 0), (-1, -1), 8),
+                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ]
+        )
+
+        # Tabla de resultados; las filas anormales se agregan por render
+        self.results_table_style = TableStyle(
+            [
+                # Header
+                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#3498db")),
+                ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+                ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                ("FONTSIZE", (0, 0), (-1, 0), 11),
+                ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
+                # Body
+                ("TEXTCOLOR", (0, 1), (-1, -1), colors.black),
+                ("ALIGN", (1, 1), (3, -1), "CENTER"),
+                ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+                ("FONTSIZE", (0, 1), (-1, -1), 9),
+                ("BOTTOMPADDING", (0, 1), (-1, -1), 8),
+                ("TOPPADDING", (0, 1), (-1, -1), 8),
+                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+                # Alternar colores de fila
+                (
+                    "ROWBACKGROUNDS",
+                    (0, 1),
+                    (-1, -1),
+                    [colors.white, colors.HexColor("#f8f9fa")],
+                ),
+            ]
+        )
+
+        # Párrafos fijos, parseados una vez
+        self._title = Paragraph(TITLE, self.title_style)
+        self._disclaimer = Paragraph(DISCLAIMER, self.disclaimer_style)
+        self._headings = {}
+
+    def header(self) -> List:
+        return [copy.copy(self._title), Spacer(1, 0.3 * inch)]
+
+    def heading(self, text: str) -> Paragraph:
+        paragraph = self._headings.get(text)
+        if paragraph is None:
+            paragraph = self._headings[text] = Paragraph(text, self.heading_style)
+        return copy.copy(paragraph)
+
+    def disclaimer(self) -> List:
+        return [Spacer(1, 0.2 * inch), copy.copy(self._disclaimer)]
+
+    @staticmethod
+    def abnormal_row(row: int) -> List[tuple]:
+        """Comandos que resaltan la columna Status de una fila anormal"""
+        return [
+            ("BACKGROUND", (4, row), (4, row), ABNORMAL_COLOR),
+            ("TEXTCOLOR", (4, row), (4, row), colors.white),
+            ("FONTNAME", (4, row), (4, row), "Helvetica-Bold"),
+        ]
+
+
+_template: Optional[ReportTemplate] = None
+
+
+def get_template() -> ReportTemplate:
+    """Plantilla del contenedor (se construye en el primer render)"""
+    global _template
+    if _template is None:
+        _template = ReportTemplate()
+    return _template
+
+
+def reset_template() -> None:
+    """Descarta la plantilla (benchmarks y tests)"""
+    global _template
+    _template = None
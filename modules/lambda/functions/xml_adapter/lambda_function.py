@@ -1,88 +1,85 @@
+import io
 import json
 import logging
 import os
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import IO, Any, Dict, Iterator, List
 import xml.etree.ElementTree as ET
 
-import boto3
+from lab_ingest.adapter import AdapterRuntime, ParserPlugin, flag_fields
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
-lambda_client = boto3.client("lambda")
-
-INGEST_FUNCTION_NAME = os.environ["INGEST_FUNCTION_NAME"]
 LAB_ID_DEFAULT = os.environ.get("LAB_ID", "HOSP001")
 LAB_NAME_DEFAULT = os.environ.get("LAB_NAME", "Hospital Lab")
 
 
+class XMLParser(ParserPlugin):
+    """Un resultado por <LabResult>; iterparse lee el StreamingBody en bytes"""
+
+    source_format = "XML"
+    inline_key = "xml_body"
+    binary = True  # respeta el encoding declarado en el documento
+    empty_warning = "No <LabResult> elements found in input"
+
+    def parse(self, source: IO) -> Iterator[Dict[str, Any]]:
+        return iter_xml_results(source)
+
+
+# Evento, lectura de S3, lotes, concurrencia, reintentos y métricas (layer lab_ingest)
+runtime = AdapterRuntime(XMLParser())
+
+
 def lambda_handler(event, context):
     """
-    Adapter XML -> JSON canónico para Lambda Ingest.
+    Adapter XML -> JSON canónico, escrito directo en S3 + SQS.
     Soporta:
-      - Evento S3 (archivo XML)
+      - Evento S3 con uno o varios archivos XML (se procesan todos los Records)
       - Invocación directa con {"xml_body": "<LabResult>...</LabResult>"}
     """
-    logger.info("XML adapter started")
-    logger.info("Event: %s", json.dumps(event))
-
-    # 1) Obtener XML como texto
-    xml_text = extract_xml_from_event(event)
-
-    # 2) Parsear XML a JSON normalizado
-    normalized = parse_xml_to_json(xml_text)
-
-    # 3) Invocar Lambda Ingest
-    response = lambda_client.invoke(
-        FunctionName=INGEST_FUNCTION_NAME,
-        InvocationType="Event",  # async
-        Payload=json.dumps(normalized).encode("utf-8"),
-    )
-
-    logger.info(
-        "Invoked ingest function: %s, response: %s",
-        INGEST_FUNCTION_NAME,
-        response,
-    )
-
-    return {
-        "statusCode": 202,
-        "body": json.dumps(
-            {
-                "status": "accepted",
-                "message": "XML received, normalized and sent to ingest",
-                "ingest_function": INGEST_FUNCTION_NAME,
-            }
-        ),
-    }
+    return runtime.handle(event)
 
 
-def extract_xml_from_event(event: Dict[str, Any]) -> str:
+def local_name(tag: str) -> str:
+    """Nombre del tag sin namespace: {urn:x}LabResult -> LabResult"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def iter_xml_results(source: IO) -> Iterator[Dict[str, Any]]:
     """
-    Si viene directo: {"xml_body": "<LabResult>...</LabResult>"}
-    Si viene de S3: Records[0].s3.bucket.name / object.key
+    Un resultado normalizado por cada <LabResult> del documento, sea la raíz
+    (un solo resultado) o esté envuelto en un export con muchos.
+
+    Usa iterparse: cada <LabResult> se normaliza al cerrarse y se quita de su
+    padre, así el árbol en memoria nunca pasa de un resultado.
     """
-    # Invocación directa para pruebas
-    if "xml_body" in event:
-        return event["xml_body"]
+    stack: List[ET.Element] = []
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
 
-    # Evento S3
-    if "Records" in event and event["Records"]:
-        record = event["Records"][0]
-        bucket = record["s3"]["bucket"]["name"]
-        key = record["s3"]["object"]["key"]
+        stack.pop()
+        if local_name(elem.tag) != "LabResult":
+            continue
 
-        s3 = boto3.client("s3")
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        body = obj["Body"].read().decode("utf-8")
-        logger.info("Read XML file from s3://%s/%s", bucket, key)
-        return body
+        yield normalize_lab_result(elem)
 
-    raise ValueError("No XML found in event")
+        # Liberar el elemento procesado (y sus hijos)
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
 
 
 def parse_xml_to_json(xml_text: str) -> Dict[str, Any]:
+    """Normaliza el primer <LabResult> de un documento (compatibilidad)"""
+    for normalized in iter_xml_results(io.StringIO(xml_text)):
+        return normalized
+    raise ValueError("No <LabResult> found in XML")
+
+
+def normalize_lab_result(root: ET.Element) -> Dict[str, Any]:
     """
     Ejemplo de XML:
 
@@ -100,22 +97,20 @@ def parse_xml_to_json(xml_text: str) -> Dict[str, Any]:
       </Tests>
     </LabResult>
     """
-    root = ET.fromstring(xml_text)
-
     # Lab info
-    lab_id_node = root.find("LabID")
+    lab_id_node = root.find("{*}LabID")
     lab_id = (lab_id_node.text if lab_id_node is not None else LAB_ID_DEFAULT).strip()
 
     # Paciente
-    patient_node = root.find("Patient")
+    patient_node = root.find("{*}Patient")
     patient_id = patient_node.get("ID") if patient_node is not None else "UNKNOWN"
 
-    name_node = patient_node.find("Name") if patient_node is not None else None
+    name_node = patient_node.find("{*}Name") if patient_node is not None else None
     patient_name = name_node.text.strip() if name_node is not None else ""
 
     # Tests
-    tests_node = root.find("Tests")
-    first_test_node = tests_node.find("Test") if tests_node is not None else None
+    tests_node = root.find("{*}Tests")
+    first_test_node = tests_node.find("{*}Test") if tests_node is not None else None
 
     test_type_code = ""
     test_type_name = ""
@@ -141,27 +136,19 @@ def parse_xml_to_json(xml_text: str) -> Dict[str, Any]:
     results: List[Dict[str, Any]] = []
 
     if tests_node is not None:
-        for test_node in tests_node.findall("Test"):
-            for comp in test_node.findall("Component"):
+        for test_node in tests_node.findall("{*}Test"):
+            for comp in test_node.findall("{*}Component"):
                 code = comp.get("code", "")
                 name = comp.get("name", "") or code
                 value_str = comp.get("value", "")
                 unit = comp.get("unit", "")
                 ref_range = comp.get("refRange", "")
-                flag = comp.get("flag", "N")
 
                 try:
                     value = float(value_str)
                 except (ValueError, TypeError):
                     value = None
 
-                is_abnormal = flag not in ("N", "", None)
-                severity = "normal"
-                if flag in ("H", "HH"):
-                    severity = "high"
-                elif flag in ("L", "LL"):
-                    severity = "low"
-
                 results.append(
                     {
                         "test_code": code,
@@ -169,8 +156,7 @@ def parse_xml_to_json(xml_text: str) -> Dict[str, Any]:
                         "value": value,
                         "unit": unit,
                         "reference_range": ref_range,
-                        "is_abnormal": is_abnormal,
-                        "severity": severity,
+                        **flag_fields(comp.get("flag")),
                     }
                 )
 
@@ -184,5 +170,7 @@ def parse_xml_to_json(xml_text: str) -> Dict[str, Any]:
         "results": results,
     }
 
-    logger.info("Normalized XML to JSON: %s", json.dumps(normalized))
+    logger.debug("Normalized <LabResult> with %d results", len(results))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Normalized payload: %s", json.dumps(normalized))
     return normalized
@@ -15,13 +15,21 @@ resource "aws_lambda_function" "hl7_adapter" {
   runtime          = var.lambda_runtime
   timeout          = 30
   memory_size      = 256
+  layers           = [aws_lambda_layer_version.lab_ingest.arn]
 
   environment {
     variables = {
-      INGEST_FUNCTION_NAME = aws_lambda_function.ingest.function_name
-      LAB_ID               = "LAB002"
-      LAB_NAME             = "LabCorp"
-      LOG_LEVEL            = "INFO"
+      S3_BUCKET               = var.s3_bucket_name
+      SQS_QUEUE_URL           = var.sqs_queue_url
+      ENVIRONMENT             = var.environment
+      PAYLOAD_COMPRESSION     = var.payload_compression
+      S3_KEY_SHARDS           = var.s3_key_shards
+      IDEMPOTENCY_TABLE       = aws_dynamodb_table.ingest_idempotency.name
+      IDEMPOTENCY_TTL_SECONDS = var.idempotency_ttl_seconds
+      LAB_ID                  = "LAB002"
+      LAB_NAME                = "LabCorp"
+      LOG_LEVEL               = "INFO"
+      RECORD_WORKERS          = 4
     }
   }
 
@@ -42,6 +50,7 @@ resource "aws_lambda_function" "hl7_adapter" {
   depends_on = [
     aws_cloudwatch_log_group.lambda_hl7,
     aws_iam_role_policy_attachment.lambda_logs,
-    aws_iam_role_policy_attachment.lambda_vpc
+    aws_iam_role_policy_attachment.lambda_vpc,
+    aws_iam_role_policy.lambda_idempotency
   ]
 }
@@ -0,0 +1,51 @@
+# DynamoDB table used by Lambda Ingest and the adapters to deduplicate retries
+resource "aws_dynamodb_table" "ingest_idempotency" {
+  name         = "${local.lambda_prefix}-ingest-idempotency"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "idempotency_key"
+
+  attribute {
+    name = "idempotency_key"
+    type = "S"
+  }
+
+  # Records expire on their own (in-progress claims and completed responses)
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = merge(
+    local.common_tags,
+    {
+      Name = "${local.lambda_prefix}-ingest-idempotency"
+      Type = "Idempotency"
+    }
+  )
+}
+
+# IAM policy for Lambda Ingest and the adapters to read/write idempotency records
+resource "aws_iam_role_policy" "lambda_idempotency" {
+  name = "${local.lambda_prefix}-idempotency-policy"
+  role = aws_iam_role.lambda_execution.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem",
+          "dynamodb:UpdateItem",
+          "dynamodb:DeleteItem"
+        ]
+        Resource = aws_dynamodb_table.ingest_idempotency.arn
+      }
+    ]
+  })
+}
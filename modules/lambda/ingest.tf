@@ -15,13 +15,19 @@ resource "aws_lambda_function" "ingest" {
   runtime          = var.lambda_runtime
   timeout          = var.lambda_timeout
   memory_size      = var.lambda_memory_size
+  layers           = [aws_lambda_layer_version.lab_ingest.arn]
 
   environment {
     variables = {
-      S3_BUCKET     = var.s3_bucket_name
-      SQS_QUEUE_URL = var.sqs_queue_url
-      ENVIRONMENT   = var.environment
-      LOG_LEVEL     = "INFO"
+      S3_BUCKET               = var.s3_bucket_name
+      SQS_QUEUE_URL           = var.sqs_queue_url
+      ENVIRONMENT             = var.environment
+      LOG_LEVEL               = "INFO"
+      PAYLOAD_COMPRESSION     = var.payload_compression
+      S3_KEY_SHARDS           = var.s3_key_shards
+      IDEMPOTENCY_TABLE       = aws_dynamodb_table.ingest_idempotency.name
+      IDEMPOTENCY_TTL_SECONDS = var.idempotency_ttl_seconds
+      UPLOAD_URL_TTL          = var.upload_url_ttl_seconds
     }
   }
 
@@ -42,7 +48,9 @@ resource "aws_lambda_function" "ingest" {
   depends_on = [
     aws_cloudwatch_log_group.lambda_ingest,
     aws_iam_role_policy_attachment.lambda_logs,
-    aws_iam_role_policy_attachment.lambda_vpc
+    aws_iam_role_policy_attachment.lambda_vpc,
+    aws_iam_role_policy.lambda_idempotency,
+    aws_iam_role_policy.lambda_uploads
   ]
 }
 
@@ -0,0 +1,18 @@
+"""
+Acceso a RDS compartido por las Lambdas PDF Generator y Notify (Lambda layer)
+
+Una conexión por contenedor, reutilizada entre invocaciones calientes, con el
+secret de Secrets Manager cacheado (lab_db.connection), y la lectura de un
+resultado con sus valores en una sola query (lab_db.results) y los jobs de PDF
+asíncronos (lab_db.jobs), que también usa el portal.
+"""
+
+from lab_db.connection import ConnectionManager, SecretCache  # noqa: F401
+from lab_db.results import fetch_result, fetch_results  # noqa: F401
+from lab_db.jobs import (  # noqa: F401
+    complete_report_job,
+    fail_report_job,
+    get_report_job,
+    start_report_job,
+    submit_report_job,
+)
@@ -0,0 +1,184 @@
+"""
+Conexión a RDS reutilizable entre invocaciones de una Lambda caliente
+
+Antes cada consulta leía el secret de Secrets Manager y abría una conexión
+SSL nueva (Notify lo hacía tres veces por record). ConnectionManager guarda a
+nivel de módulo:
+
+  - el secret, con TTL (DB_SECRET_TTL); se vuelve a leer antes si la DB
+    rechaza la contraseña (rotación del secret)
+  - una conexión psycopg2 que se reutiliza mientras siga viva; si estuvo
+    ociosa más de DB_VALIDATE_AFTER segundos se valida con SELECT 1
+  - contadores reused / reconnected / secret_fetches / auth_refreshes
+
+Cada cursor() termina su transacción (commit o rollback) para no dejar la
+conexión "idle in transaction" entre invocaciones.
+"""
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+# Mensajes de Postgres cuando el usuario / contraseña ya no son válidos
+AUTH_ERRORS = ("password authentication failed", "authentication failed")
+
+
+def is_auth_error(exc: BaseException) -> bool:
+    message = str(exc).lower()
+    return any(text in message for text in AUTH_ERRORS)
+
+
+class SecretCache:
+    """Secret JSON de Secrets Manager con TTL"""
+
+    def __init__(self, secret_arn: str, ttl: float = 300, client=None):
+        self.secret_arn = secret_arn
+        self.ttl = ttl
+        self._client = client
+        self._value: Optional[Dict[str, Any]] = None
+        self._fetched_at = 0.0
+        self.fetches = 0
+
+    def get(self, force: bool = False) -> Dict[str, Any]:
+        expired = time.monotonic() - self._fetched_at > self.ttl
+        if self._value is None or expired or force:
+            if self._client is None:
+                self._client = boto3.client("secretsmanager")
+            response = self._client.get_secret_value(SecretId=self.secret_arn)
+            self._value = json.loads(response["SecretString"])
+            self._fetched_at = time.monotonic()
+            self.fetches += 1
+        return self._value
+
+
+class ConnectionManager:
+    """Una conexión psycopg2 por contenedor de Lambda, validada y reutilizada"""
+
+    def __init__(
+        self,
+        secret_arn: str,
+        secret_ttl: float = 300,
+        validate_after: float = 30,
+        connect_timeout: int = 5,
+        secrets_client=None,
+    ):
+        self.secret = SecretCache(secret_arn, secret_ttl, secrets_client)
+        self.validate_after = validate_after
+        self.connect_timeout = connect_timeout
+        self._conn = None
+        self._last_used = 0.0
+        self.reused = 0
+        self.reconnected = 0
+        self.auth_refreshes = 0
+
+    @classmethod
+    def from_env(cls, secrets_client=None) -> "ConnectionManager":
+        return cls(
+            os.environ["DB_SECRET_ARN"],
+            secret_ttl=float(os.environ.get("DB_SECRET_TTL", "300")),
+            validate_after=float(os.environ.get("DB_VALIDATE_AFTER", "30")),
+            connect_timeout=int(os.environ.get("DB_CONNECT_TIMEOUT", "5")),
+            secrets_client=secrets_client,
+        )
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "reused": self.reused,
+            "reconnected": self.reconnected,
+            "secret_fetches": self.secret.fetches,
+            "auth_refreshes": self.auth_refreshes,
+        }
+
+    # --------------------------------------------------
+    # Conexión
+    # --------------------------------------------------
+    def _connect(self, creds: Dict[str, Any]):
+        import psycopg2
+
+        return psycopg2.connect(
+            host=creds["host"],
+            port=creds.get("port", 5432),
+            database=creds["dbname"],
+            user=creds["username"],
+            password=creds["password"],
+            sslmode="require",
+            connect_timeout=self.connect_timeout,
+        )
+
+    def connect(self):
+        """Conexión nueva; si la contraseña fue rotada, relee el secret una vez"""
+        import psycopg2
+
+        try:
+            conn = self._connect(self.secret.get())
+        except psycopg2.OperationalError as exc:
+            if not is_auth_error(exc):
+                raise
+            logger.warning("DB auth failed, refreshing secret")
+            self.auth_refreshes += 1
+            conn = self._connect(self.secret.get(force=True))
+        self.reconnected += 1
+        return conn
+
+    def _is_alive(self) -> bool:
+        if self._conn is None or self._conn.closed:
+            return False
+        if time.monotonic() - self._last_used < self.validate_after:
+            return True
+        try:
+            with self._conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            self._conn.rollback()
+            return True
+        except Exception as exc:  # noqa: BLE001 - cualquier fallo = reconectar
+            logger.info("Stale DB connection, reconnecting: %s", exc)
+            self.discard()
+            return False
+
+    def get_connection(self):
+        """Conexión viva (la cacheada o una nueva)"""
+        if self._is_alive():
+            self.reused += 1
+        else:
+            self._conn = self.connect()
+        self._last_used = time.monotonic()
+        return self._conn
+
+    def discard(self) -> None:
+        """Cierra y olvida la conexión (p.ej. tras un error de red)"""
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:  # noqa: BLE001
+                pass
+        self._conn = None
+
+    @contextmanager
+    def cursor(self, cursor_factory=None) -> Iterator[Any]:
+        """
+        Cursor sobre la conexión compartida. Commit al salir, rollback si
+        hay error; los errores de conexión descartan la conexión.
+        """
+        import psycopg2
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                yield cursor
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.discard()
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._last_used = time.monotonic()
@@ -0,0 +1,143 @@
+"""
+Jobs de generación de PDF (tabla report_jobs)
+
+El portal ya no espera a ReportLab: registra un job y dispara la Lambda PDF
+en modo asíncrono; la Lambda actualiza el estado y el navegador lo consulta.
+
+Un job por (result_id, versión del resultado): pedidos repetidos del mismo
+reporte se colapsan en el job existente gracias a la UNIQUE constraint y
+INSERT ... ON CONFLICT. Solo se vuelve a disparar un job que falló, uno que
+quedó colgado (sin avance en stale_after segundos) o uno completado cuyo PDF
+ya no está en S3 (el portal solo envía jobs cuando no encontró el PDF).
+Re-encolar reinicia attempt_count: cuenta los intentos del envío actual, no
+los de toda la vida del job.
+
+Funciona con cualquier cursor psycopg2 (tuplas o RealDictCursor).
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+JOB_COLUMNS = """
+    j.job_id,
+    j.result_id,
+    j.status,
+    j.s3_key,
+    j.error_message,
+    j.attempt_count,
+    j.created_at,
+    j.updated_at,
+    j.completed_at
+"""
+
+SUBMIT_QUERY = f"""
+    INSERT INTO report_jobs AS j (result_id, result_version)
+    VALUES (%(result_id)s, %(result_version)s)
+    ON CONFLICT (result_id, result_version) DO UPDATE
+        SET status = 'pending',
+            attempt_count = 0,
+            s3_key = NULL,
+            error_message = NULL,
+            completed_at = NULL
+        WHERE j.status IN ('failed', 'completed')
+           OR j.updated_at < CURRENT_TIMESTAMP - make_interval(secs => %(stale_after)s)
+    RETURNING {JOB_COLUMNS}
+"""
+
+EXISTING_QUERY = f"""
+    SELECT {JOB_COLUMNS}
+    FROM report_jobs j
+    WHERE j.result_id = %(result_id)s
+      AND j.result_version = %(result_version)s
+"""
+
+JOB_QUERY = f"""
+    SELECT {JOB_COLUMNS}
+    FROM report_jobs j
+    JOIN lab_results lr ON j.result_id = lr.result_id
+    JOIN patients p ON lr.patient_id = p.patient_id
+    WHERE j.job_id = %(job_id)s
+"""
+
+# El portal solo ve jobs de resultados del paciente logueado
+PATIENT_FILTER = " AND p.email = %(email)s"
+
+
+def _row(cursor, row) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return dict(row)
+    return dict(zip([column[0] for column in cursor.description], row))
+
+
+def submit_report_job(
+    cursor, result_id: int, result_version: datetime, stale_after: int = 600
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Job del reporte de esta versión del resultado.
+
+    Devuelve (job, created): created es True cuando el job es nuevo o se
+    re-encoló, y el caller debe disparar la Lambda; False si ya hay uno en
+    curso (pedido duplicado).
+    """
+    params = {
+        "result_id": result_id,
+        "result_version": result_version,
+        "stale_after": stale_after,
+    }
+    cursor.execute(SUBMIT_QUERY, params)
+    job = _row(cursor, cursor.fetchone())
+    if job is not None:
+        return job, True
+
+    cursor.execute(EXISTING_QUERY, params)
+    return _row(cursor, cursor.fetchone()), False
+
+
+def get_report_job(
+    cursor, job_id: int, email: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """Estado de un job, o None si no existe (o no es del email)"""
+    query = JOB_QUERY + (PATIENT_FILTER if email is not None else "")
+    cursor.execute(query, {"job_id": job_id, "email": email})
+    return _row(cursor, cursor.fetchone())
+
+
+def start_report_job(cursor, job_id: int) -> None:
+    cursor.execute(
+        """
+        UPDATE report_jobs
+        SET status = 'running', attempt_count = attempt_count + 1
+        WHERE job_id = %s
+        """,
+        (job_id,),
+    )
+
+
+def complete_report_job(cursor, job_id: int, s3_key: str) -> None:
+    cursor.execute(
+        """
+        UPDATE report_jobs
+        SET status = 'completed', s3_key = %s, error_message = NULL,
+            completed_at = CURRENT_TIMESTAMP
+        WHERE job_id = %s
+        """,
+        (s3_key, job_id),
+    )
+
+
+def fail_report_job(cursor, job_id: int, error: str) -> None:
+    cursor.execute(
+        """
+        UPDATE report_jobs
+        SET status = 'failed', error_message = %s
+        WHERE job_id = %s
+        """,
+        (error[:1000], job_id),
+    )
@@ -0,0 +1,91 @@
+"""
+Lectura de resultados con sus test_values en un solo round trip
+
+PDF Generator (reporte, modo batch) y el portal (detalle del resultado)
+leían el header (lab_results + patients) y después test_values: dos queries
+por resultado. RESULTS_QUERY trae ambos juntos; los valores vienen como un
+array JSON por resultado (json_agg, como v_complete_results) que se decodifica
+con un solo json.loads, con parse_float=Decimal para que value tenga el
+mismo tipo que leyendo la columna NUMERIC directamente.
+
+Funciona con cualquier cursor psycopg2 (tuplas o RealDictCursor).
+"""
+
+import json
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+RESULTS_QUERY = """
+    SELECT
+        lr.result_id,
+        lr.patient_id,
+        p.first_name,
+        p.last_name,
+        p.email,
+        p.date_of_birth,
+        lr.lab_name,
+        lr.test_type,
+        lr.test_date,
+        lr.status,
+        lr.physician_name,
+        lr.physician_npi,
+        lr.notes,
+        lr.created_at,
+        lr.updated_at,
+        lr.report_version,
+        COALESCE(tv.test_values, '[]') AS test_values
+    FROM lab_results lr
+    JOIN patients p ON lr.patient_id = p.patient_id
+    LEFT JOIN LATERAL (
+        SELECT json_agg(
+            json_build_object(
+                'test_code', v.test_code,
+                'test_name', v.test_name,
+                'value', v.value,
+                'unit', v.unit,
+                'reference_range', v.reference_range,
+                'is_abnormal', v.is_abnormal,
+                'severity', v.severity
+            ) ORDER BY v.test_code
+        )::text AS test_values
+        FROM test_values v
+        WHERE v.result_id = lr.result_id
+    ) tv ON TRUE
+    WHERE lr.result_id = ANY(%(result_ids)s)
+"""
+
+# El portal solo ve resultados del paciente logueado
+PATIENT_FILTER = " AND p.email = %(email)s"
+
+
+def decode_test_values(raw: Any) -> List[Dict[str, Any]]:
+    """Array JSON de test_values -> lista de dicts (value como Decimal)"""
+    if raw is None:
+        return []
+    if isinstance(raw, (list, tuple)):
+        return list(raw)
+    return json.loads(raw, parse_float=Decimal)
+
+
+def fetch_results(
+    cursor, result_ids: Iterable[int], email: Optional[str] = None
+) -> Dict[int, Dict[str, Any]]:
+    """result_id -> resultado con "test_values", en una sola query"""
+    query = RESULTS_QUERY + (PATIENT_FILTER if email is not None else "")
+    cursor.execute(query, {"result_ids": list(result_ids), "email": email})
+
+    results = {}
+    for row in cursor.fetchall():
+        if not isinstance(row, dict):
+            row = zip([column[0] for column in cursor.description], row)
+        result = dict(row)
+        result["test_values"] = decode_test_values(result["test_values"])
+        results[result["result_id"]] = result
+    return results
+
+
+def fetch_result(
+    cursor, result_id: int, email: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """Un resultado con sus test_values, o None si no existe (o no es del email)"""
+    return fetch_results(cursor, [result_id], email).get(result_id)
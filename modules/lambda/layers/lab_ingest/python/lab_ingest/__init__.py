@@ -0,0 +1,32 @@
+"""
+Librería compartida de ingesta (Lambda layer)
+
+La usan Lambda Ingest y los adapters HL7 / CSV / XML para validar, deduplicar
+y escribir resultados normalizados en S3 + SQS dentro del mismo proceso. Los
+adapters además comparten el runtime (lab_ingest.adapter): cada formato solo
+aporta un ParserPlugin.
+"""
+
+from lab_ingest.adapter import (  # noqa: F401
+    AdapterRuntime,
+    ParserPlugin,
+    flag_fields,
+    flag_severity,
+)
+from lab_ingest.idempotency import (  # noqa: F401
+    IdempotencyConflict,
+    IdempotencyKeyMismatch,
+    build_idempotency_store,
+    get_header,
+    payload_hash,
+)
+from lab_ingest.ids import generate_ulid  # noqa: F401
+from lab_ingest.metrics import emit_emf  # noqa: F401
+from lab_ingest.reference_ranges import (  # noqa: F401
+    classify_lab_results,
+    classify_results,
+    parse_reference_range,
+)
+from lab_ingest.storage import build_s3_key, encode_payload, shard_prefix  # noqa: F401
+from lab_ingest.validation import validate_lab_result  # noqa: F401
+from lab_ingest.writer import SQS_BATCH_SIZE, IngestWriter  # noqa: F401
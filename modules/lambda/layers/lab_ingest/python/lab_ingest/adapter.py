@@ -0,0 +1,308 @@
+"""
+Runtime común de los adapters de formato (HL7 / CSV / XML / ...)
+
+Un adapter solo aporta un ParserPlugin: cómo convertir un stream en
+resultados normalizados. AdapterRuntime se encarga del resto:
+
+  - decodificar el evento (invocación directa o Records de S3)
+  - abrir el objeto de S3 como stream (texto o bytes)
+  - procesar los Records en paralelo (RECORD_WORKERS hilos)
+  - escribir en S3 + SQS por lotes con IngestWriter (INGEST_BATCH_SIZE)
+  - reintentar un archivo ante errores transitorios (FILE_ATTEMPTS)
+  - métricas por archivo en el outcome y un resumen en formato EMF
+  - la respuesta 202 / 207 con failed_records
+
+Reintentar un archivo completo es seguro: los resultados ya encolados se
+deduplican por idempotencia.
+"""
+
+import codecs
+import io
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote_plus
+
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+
+from lab_ingest.idempotency import build_idempotency_store
+from lab_ingest.metrics import emit_emf
+from lab_ingest.writer import IngestWriter
+
+logger = logging.getLogger(__name__)
+
+METRICS_NAMESPACE = "LabPlatform/Adapters"
+
+# Errores de S3 / SQS que vale la pena reintentar (throttling, 5xx)
+TRANSIENT_ERROR_CODES = {
+    "InternalError",
+    "RequestTimeout",
+    "ServiceUnavailable",
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+}
+
+
+def flag_severity(flag: Optional[str]) -> Tuple[bool, str]:
+    """Flag de laboratorio (N, H, HH, L, LL, A...) -> (is_abnormal, severity)"""
+    flag = (flag or "N").strip().upper()
+    if flag in ("H", "HH"):
+        return True, "high"
+    if flag in ("L", "LL"):
+        return True, "low"
+    return flag not in ("N", ""), "normal"
+
+
+def flag_fields(flag: Optional[str]) -> Dict[str, Any]:
+    """
+    is_abnormal / severity de un test con flag del lab. Sin flag queda vacío:
+    IngestWriter lo clasifica con el reference_range.
+    """
+    if not (flag or "").strip():
+        return {}
+    is_abnormal, severity = flag_severity(flag)
+    return {"is_abnormal": is_abnormal, "severity": severity}
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True si el error es de red / throttling y el archivo puede reintentarse"""
+    if isinstance(exc, ClientError):
+        return exc.response.get("Error", {}).get("Code") in TRANSIENT_ERROR_CODES
+    return isinstance(exc, BotoCoreError)
+
+
+class ParserPlugin(ABC):
+    """
+    Parser de un formato. Las subclases definen los atributos y parse();
+    binary=True recibe el StreamingBody en bytes (p.ej. iterparse, que
+    respeta el encoding declarado en el documento).
+    """
+
+    source_format = ""
+    inline_key = ""
+    binary = False
+    encoding = "utf-8"
+    empty_warning = "No results found in input"
+
+    @abstractmethod
+    def parse(self, stream: IO) -> Iterator[Dict[str, Any]]:
+        """Resultados normalizados del stream, de a uno"""
+
+
+class AdapterRuntime:
+    """Handler, I/O, lotes, concurrencia, reintentos y métricas de un adapter"""
+
+    def __init__(self, parser: ParserPlugin):
+        self.parser = parser
+        self.record_workers = int(os.environ.get("RECORD_WORKERS", "4"))
+        # Resultados escritos por lote (los mensajes SQS salen de a 10 por llamada)
+        self.batch_size = int(os.environ.get("INGEST_BATCH_SIZE", "50"))
+        self.file_attempts = max(1, int(os.environ.get("FILE_ATTEMPTS", "2")))
+        self.retry_delay = float(os.environ.get("FILE_RETRY_DELAY", "0.5"))
+        self.idempotency_table = os.environ.get("IDEMPOTENCY_TABLE", "")
+        self.metrics_namespace = os.environ.get("METRICS_NAMESPACE", METRICS_NAMESPACE)
+        # Clientes AWS cacheados (se crean bajo demanda)
+        self._s3_client = None
+        self._sqs_client = None
+        self._writer: Optional[IngestWriter] = None
+
+    # --------------------------------------------------
+    # Clientes
+    # --------------------------------------------------
+    def get_s3_client(self):
+        """Devuelve el cliente S3 cacheado (lo crea si no existe)"""
+        if self._s3_client is None:
+            self._s3_client = boto3.client("s3")
+        return self._s3_client
+
+    def get_sqs_client(self):
+        """Devuelve el cliente SQS cacheado (lo crea si no existe)"""
+        if self._sqs_client is None:
+            self._sqs_client = boto3.client("sqs")
+        return self._sqs_client
+
+    def get_writer(self) -> IngestWriter:
+        """IngestWriter del formato (valida, deduplica, guarda y encola)"""
+        if self._writer is None:
+            self._writer = IngestWriter.from_env(
+                self.get_s3_client(),
+                self.get_sqs_client(),
+                self.parser.source_format,
+                build_idempotency_store(self.idempotency_table),
+            )
+        return self._writer
+
+    # --------------------------------------------------
+    # Handler
+    # --------------------------------------------------
+    def handle(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Soporta:
+          - Evento S3 con uno o varios archivos (se procesan todos los Records)
+          - Invocación directa con {<inline_key>: "<contenido>"}
+
+        La respuesta trae un outcome por archivo y, si alguno falló,
+        "failed_records" para reintentar solo esos con {"Records": ...}.
+        """
+        fmt = self.parser.source_format
+        logger.info("%s adapter started", fmt)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Event: %s", json.dumps(event))
+
+        started = time.perf_counter()
+        # Invocación directa desde consola / tests
+        if self.parser.inline_key in event:
+            outcome: Dict[str, Any] = {"source": "inline"}
+            counts = self.process_stream(io.StringIO(event[self.parser.inline_key]))
+            outcome.update(counts, status="error" if counts["failed"] else "ok")
+            outcomes = [outcome]
+        # Evento S3
+        elif event.get("Records"):
+            outcomes = self.process_s3_records(event["Records"])
+        else:
+            raise ValueError(f"No {fmt} found in event")
+
+        response = self.build_response(outcomes)
+        self.emit_metrics(outcomes, (time.perf_counter() - started) * 1000)
+        return response
+
+    def process_s3_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Procesa todos los Records con un pool acotado; un outcome por Record"""
+        # Clientes creados antes de abrir el pool (crearlos no es thread-safe)
+        self.get_writer()
+
+        workers = max(1, min(self.record_workers, len(records)))
+        if workers == 1:
+            return [self.process_s3_record(record) for record in records]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(self.process_s3_record, records))
+
+    def process_s3_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Lee, parsea y encola un archivo; un error queda en su outcome. Los
+        errores transitorios y los resultados sin encolar reintentan el archivo
+        (hasta FILE_ATTEMPTS veces).
+        """
+        bucket = record["s3"]["bucket"]["name"]
+        # Las keys llegan URL-encoded en el evento S3 (espacios como "+")
+        key = unquote_plus(record["s3"]["object"]["key"])
+        outcome: Dict[str, Any] = {"source": f"s3://{bucket}/{key}"}
+        started = time.perf_counter()
+
+        for attempt in range(1, self.file_attempts + 1):
+            for stale in ("results", "rejected", "failed", "error"):
+                outcome.pop(stale, None)
+            outcome["attempts"] = attempt
+            retry = False
+            try:
+                counts = self.process_s3_object(bucket, key)
+                outcome.update(counts, status="ok")
+                if counts["failed"]:
+                    outcome.update(
+                        status="error",
+                        error=f"{counts['failed']} results could not be queued",
+                    )
+                    retry = True
+            except Exception as exc:  # noqa: BLE001 - un archivo malo no frena al resto
+                logger.error(
+                    "Failed to process s3://%s/%s (attempt %d): %s",
+                    bucket,
+                    key,
+                    attempt,
+                    exc,
+                    exc_info=True,
+                )
+                outcome.update(status="error", error=str(exc))
+                retry = is_transient(exc)
+
+            if not retry or attempt == self.file_attempts:
+                break
+            time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+        outcome["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if outcome["status"] == "error":
+            outcome["record"] = record
+        return outcome
+
+    def process_s3_object(self, bucket: str, key: str) -> Dict[str, int]:
+        """Abre el objeto como stream y lo pasa por el parser"""
+        obj = self.get_s3_client().get_object(Bucket=bucket, Key=key)
+        logger.info(
+            "Reading %s file from s3://%s/%s", self.parser.source_format, bucket, key
+        )
+        body = obj["Body"]
+        if not self.parser.binary:
+            body = codecs.getreader(self.parser.encoding)(body, errors="replace")
+        return self.process_stream(body)
+
+    def process_stream(self, stream: IO) -> Dict[str, int]:
+        """
+        Normaliza cada resultado del stream y lo escribe en S3 + SQS en lotes
+        de INGEST_BATCH_SIZE; devuelve los conteos results / rejected / failed
+        """
+        counts = self.get_writer().ingest_stream(
+            self.parser.parse(stream), self.batch_size
+        )
+        if not any(counts.values()):
+            logger.warning(self.parser.empty_warning)
+        return counts
+
+    # --------------------------------------------------
+    # Respuesta y métricas
+    # --------------------------------------------------
+    def build_response(self, outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """202 si todos los archivos se procesaron, 207 si alguno falló"""
+        fmt = self.parser.source_format
+        failed_records = [o.pop("record") for o in outcomes if "record" in o]
+        sent = sum(o.get("results", 0) for o in outcomes)
+        rejected = sum(o.get("rejected", 0) for o in outcomes)
+
+        logger.info(
+            "Queued %d %s results (%d rejected) from %d files (%d failed)",
+            sent,
+            fmt,
+            rejected,
+            len(outcomes),
+            len(failed_records),
+        )
+
+        return {
+            "statusCode": 207 if failed_records else 202,
+            "body": json.dumps(
+                {
+                    "status": "partial" if failed_records else "accepted",
+                    "message": f"{fmt} received, normalized and queued for processing",
+                    "results": sent,
+                    "rejected": rejected,
+                    "records": outcomes,
+                    "failed_records": failed_records,
+                }
+            ),
+        }
+
+    def emit_metrics(self, outcomes: List[Dict[str, Any]], duration_ms: float) -> None:
+        """
+        Resumen de la invocación en CloudWatch Embedded Metric Format
+        (lab_ingest.metrics): una línea JSON que CloudWatch Logs convierte
+        en métricas, sin llamadas a PutMetricData.
+        """
+        metrics = {
+            "Files": len(outcomes),
+            "FailedFiles": sum(1 for o in outcomes if o.get("status") == "error"),
+            "Results": sum(o.get("results", 0) for o in outcomes),
+            "Rejected": sum(o.get("rejected", 0) for o in outcomes),
+            "Unqueued": sum(o.get("failed", 0) for o in outcomes),
+            "DurationMs": round(duration_ms, 1),
+        }
+        emit_emf(
+            self.metrics_namespace,
+            {"Format": self.parser.source_format},
+            metrics,
+            {"DurationMs": "Milliseconds"},
+        )
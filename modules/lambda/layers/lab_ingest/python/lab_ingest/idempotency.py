@@ -0,0 +1,198 @@
+"""
+Idempotencia de la ingesta
+
+Cada request se identifica por el header Idempotency-Key (por lab) o, si no
+viene, por el hash SHA-256 del payload canónico. El store guarda por cada key
+el estado ("in_progress" / "completed") y la respuesta original, con TTL:
+
+  - in_progress: reserva corta (IN_PROGRESS_TTL) mientras se escribe en S3/SQS;
+    si la Lambda muere, la reserva expira y un reintento puede tomarla.
+  - completed: result_id / message_id / s3_key originales durante RECORD_TTL.
+
+DynamoDBIdempotencyStore es el store real (tabla con TTL en expires_at);
+InMemoryIdempotencyStore es el sustituto local para tests y entornos sin tabla.
+Lo usan Lambda Ingest y los adapters (misma tabla, mismas keys).
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_COMPLETED = "completed"
+
+
+class IdempotencyConflict(Exception):
+    """La misma key está siendo procesada por otra invocación"""
+
+
+class IdempotencyKeyMismatch(Exception):
+    """El Idempotency-Key ya se usó con un payload distinto"""
+
+
+def payload_hash(data: Dict[str, Any]) -> str:
+    """SHA-256 del payload en forma canónica (keys ordenadas, sin espacios)"""
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Lee un header de API Gateway sin distinguir mayúsculas"""
+    headers = event.get("headers") or {}
+    wanted = name.lower()
+    for key, value in headers.items():
+        if key.lower() == wanted and value:
+            return str(value).strip()
+    return None
+
+
+def build_idempotency_key(
+    header_key: Optional[str], data: Dict[str, Any], body_hash: str
+) -> str:
+    """key:<lab_id>:<Idempotency-Key> o hash:<sha256 del payload>"""
+    if header_key:
+        return f"key:{data.get('lab_id', '')}:{header_key}"
+    return f"hash:{body_hash}"
+
+
+class InMemoryIdempotencyStore:
+    """Store en memoria del proceso (tests / desarrollo local)"""
+
+    def __init__(self):
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._records.get(key)
+            if record and record["expires_at"] <= time.time():
+                del self._records[key]
+                return None
+            return dict(record) if record else None
+
+    def claim(self, key: str, body_hash: str, ttl: int) -> bool:
+        """Reserva la key si no existe (o expiró). True si la reserva es nuestra."""
+        now = time.time()
+        with self._lock:
+            record = self._records.get(key)
+            if record and record["expires_at"] > now:
+                return False
+            self._records[key] = {
+                "status": STATUS_IN_PROGRESS,
+                "payload_hash": body_hash,
+                "expires_at": now + ttl,
+            }
+            return True
+
+    def complete(self, key: str, response: Dict[str, Any], ttl: int) -> None:
+        with self._lock:
+            record = self._records.setdefault(key, {})
+            record.update(
+                {
+                    "status": STATUS_COMPLETED,
+                    "response": dict(response),
+                    "expires_at": time.time() + ttl,
+                }
+            )
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._records.pop(key, None)
+
+
+class DynamoDBIdempotencyStore:
+    """
+    Tabla DynamoDB con hash key "idempotency_key" y TTL en "expires_at".
+    El TTL de DynamoDB borra con retraso, por eso se compara expires_at
+    también en lecturas y en la condición del PutItem.
+    """
+
+    def __init__(self, table_name: str, client):
+        self.table_name = table_name
+        self.client = client
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self.client.get_item(
+            TableName=self.table_name,
+            Key={"idempotency_key": {"S": key}},
+            ConsistentRead=True,
+        ).get("Item")
+        if not item or float(item["expires_at"]["N"]) <= time.time():
+            return None
+        record = {
+            "status": item["status"]["S"],
+            "payload_hash": item.get("payload_hash", {}).get("S"),
+            "expires_at": float(item["expires_at"]["N"]),
+        }
+        if "response" in item:
+            record["response"] = json.loads(item["response"]["S"])
+        return record
+
+    def claim(self, key: str, body_hash: str, ttl: int) -> bool:
+        now = int(time.time())
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "idempotency_key": {"S": key},
+                    "status": {"S": STATUS_IN_PROGRESS},
+                    "payload_hash": {"S": body_hash},
+                    "expires_at": {"N": str(now + ttl)},
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(idempotency_key) OR expires_at < :now"
+                ),
+                ExpressionAttributeValues={":now": {"N": str(now)}},
+            )
+            return True
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+    def complete(self, key: str, response: Dict[str, Any], ttl: int) -> None:
+        self.client.update_item(
+            TableName=self.table_name,
+            Key={"idempotency_key": {"S": key}},
+            UpdateExpression="SET #s = :s, #r = :r, expires_at = :e",
+            ExpressionAttributeNames={"#s": "status", "#r": "response"},
+            ExpressionAttributeValues={
+                ":s": {"S": STATUS_COMPLETED},
+                ":r": {"S": json.dumps(response)},
+                ":e": {"N": str(int(time.time()) + ttl)},
+            },
+        )
+
+    def release(self, key: str) -> None:
+        self.client.delete_item(
+            TableName=self.table_name, Key={"idempotency_key": {"S": key}}
+        )
+
+
+def build_idempotency_store(table_name: str, client=None):
+    """DynamoDB si hay tabla configurada, si no un store en memoria"""
+    if not table_name:
+        return InMemoryIdempotencyStore()
+    if client is None:
+        import boto3
+
+        client = boto3.client("dynamodb")
+    return DynamoDBIdempotencyStore(table_name, client)
+
+
+def check_existing(
+    store, key: str, body_hash: str, header_supplied: bool
+) -> Optional[Dict[str, Any]]:
+    """
+    Devuelve la respuesta original si la key ya se completó, None si no existe.
+    Lanza IdempotencyConflict si está en curso e IdempotencyKeyMismatch si el
+    Idempotency-Key se reutilizó con otro payload.
+    """
+    record = store.get(key)
+    if record is None:
+        return None
+    if header_supplied and record.get("payload_hash") not in (None, body_hash):
+        raise IdempotencyKeyMismatch(key)
+    if record["status"] == STATUS_COMPLETED:
+        return record.get("response")
+    raise IdempotencyConflict(key)
@@ -0,0 +1,45 @@
+"""
+IDs de resultado: ULID monotónico
+
+48 bits de timestamp (ms) + 80 bits aleatorios en base32 Crockford. Son
+ordenables por tiempo y no colisionan dentro del mismo contenedor: si dos IDs
+caen en el mismo ms, la parte aleatoria del segundo es la del primero + 1.
+"""
+
+import os
+import threading
+import time
+
+ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ULID_RANDOM_BITS = 80
+
+_ulid_lock = threading.Lock()
+_ulid_last_ms = -1
+_ulid_last_random = 0
+
+
+def generate_ulid() -> str:
+    """Genera un ULID monotónico (26 caracteres)"""
+    global _ulid_last_ms, _ulid_last_random
+
+    with _ulid_lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms <= _ulid_last_ms:
+            # Mismo ms (o reloj hacia atrás): seguimos la secuencia anterior
+            now_ms = _ulid_last_ms
+            random_part = _ulid_last_random + 1
+            if random_part >> ULID_RANDOM_BITS:
+                now_ms += 1
+                random_part = int.from_bytes(os.urandom(10), "big")
+        else:
+            random_part = int.from_bytes(os.urandom(10), "big")
+
+        _ulid_last_ms = now_ms
+        _ulid_last_random = random_part
+
+    value = (now_ms << ULID_RANDOM_BITS) | random_part
+    chars = []
+    for _ in range(26):
+        chars.append(ULID_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
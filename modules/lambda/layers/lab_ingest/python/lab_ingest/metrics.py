@@ -0,0 +1,54 @@
+"""
+Métricas en CloudWatch Embedded Metric Format (EMF)
+
+Cada llamada a emit_emf escribe una línea JSON en stdout que CloudWatch Logs
+convierte en métricas, sin llamadas a PutMetricData. Sale por un logger propio
+(lab_ingest.metrics) que no propaga al root: el formato del runtime de Lambda
+("[INFO] <timestamp> <request_id> ...") rompería el JSON, y LOG_LEVEL no
+apaga las métricas.
+"""
+
+import json
+import logging
+import sys
+import time
+from typing import Dict, Optional
+
+metrics_logger = logging.getLogger("lab_ingest.metrics")
+metrics_logger.setLevel(logging.INFO)
+metrics_logger.propagate = False
+
+_handler = logging.StreamHandler(sys.stdout)
+_handler.setFormatter(logging.Formatter("%(message)s"))
+metrics_logger.handlers = [_handler]
+
+
+def emit_emf(
+    namespace: str,
+    dimensions: Dict[str, str],
+    metrics: Dict[str, float],
+    units: Optional[Dict[str, str]] = None,
+) -> None:
+    """Una línea EMF: metrics con sus units ("Count" por defecto) por dimensions"""
+    units = units or {}
+    metrics_logger.info(
+        json.dumps(
+            {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": namespace,
+                            "Dimensions": [list(dimensions)],
+                            "Metrics": [
+                                {"Name": name, "Unit": units.get(name, "Count")}
+                                for name in metrics
+                            ],
+                        }
+                    ],
+                },
+                **dimensions,
+                **metrics,
+            }
+        )
+    )
@@ -0,0 +1,171 @@
+"""
+Motor de rangos de referencia: is_abnormal / severity a partir del valor
+
+Los labs que no mandan flag (CSV sin columna Flag, OBX-8 vacío, JSON sin
+severity) se clasifican comparando el valor con su reference_range:
+
+  "4.5-11.0"  -> [4.5, 11.0]
+  "<200"      -> por debajo de 200 (200 ya es alto); "<=200" lo incluye
+  ">40"       -> por encima de 40 (40 ya es bajo); ">=40" lo incluye
+
+Los rangos parseados se memorizan (los mismos pocos cientos de strings se
+repiten en todo un archivo). classify_results() clasifica un lote de tests de
+una vez; con numpy disponible y lotes grandes la comparación es vectorizada.
+"""
+
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# A partir de cuántos tests se usa numpy (si está instalado)
+VECTORIZE_MIN = int(os.environ.get("REFERENCE_RANGE_VECTORIZE_MIN", "512"))
+
+_NUMBER = r"[-+]?\d+(?:\.\d+)?|[-+]?\.\d+"
+# "4.5-11.0", "4.5 - 11.0", "4.5–11.0", "4.5 to 11.0", "-2.0-2.0"; texto
+# final (unidades) permitido
+_INTERVAL_RE = re.compile(
+    rf"^\s*({_NUMBER})\s*(?:-|–|to)\s*({_NUMBER})(?:\s+\S.*)?\s*$", re.IGNORECASE
+)
+# "<200", "<= 200", "≤200", ">40", ">=40", "≥40"
+_BOUND_RE = re.compile(rf"^\s*(<=?|>=?|≤|≥)\s*({_NUMBER})(?:\s+\S.*)?\s*$")
+
+
+class ReferenceRange(NamedTuple):
+    """Límites numéricos; None = sin límite de ese lado"""
+
+    low: Optional[float]
+    high: Optional[float]
+    low_inclusive: bool = True
+    high_inclusive: bool = True
+
+    def severity(self, value: float) -> str:
+        """ "low", "high" o "normal" para un valor"""
+        if self.low is not None and (
+            value < self.low or (value == self.low and not self.low_inclusive)
+        ):
+            return "low"
+        if self.high is not None and (
+            value > self.high or (value == self.high and not self.high_inclusive)
+        ):
+            return "high"
+        return "normal"
+
+
+@lru_cache(maxsize=2048)
+def parse_reference_range(text: Optional[str]) -> Optional[ReferenceRange]:
+    """Parsea un reference_range; None si no es numérico ("Negative", "")"""
+    if not text:
+        return None
+
+    match = _INTERVAL_RE.match(text)
+    if match:
+        low, high = float(match.group(1)), float(match.group(2))
+        if low > high:
+            return None
+        return ReferenceRange(low, high)
+
+    match = _BOUND_RE.match(text.replace("≤", "<=").replace("≥", ">="))
+    if match:
+        op, bound = match.group(1), float(match.group(2))
+        if op.startswith("<"):
+            return ReferenceRange(None, bound, high_inclusive=op == "<=")
+        return ReferenceRange(bound, None, low_inclusive=op == ">=")
+
+    return None
+
+
+def classify_value(value: Any, reference_range: Optional[str]) -> Optional[str]:
+    """Severity de un valor contra su rango; None si no se puede comparar"""
+    if not isinstance(reference_range, str):
+        return None
+    parsed = parse_reference_range(reference_range)
+    if parsed is None:
+        return None
+    try:
+        return parsed.severity(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _severities_scalar(values: List[float], ranges: List[ReferenceRange]) -> List[str]:
+    return [rng.severity(value) for value, rng in zip(values, ranges)]
+
+
+def _severities_vectorized(
+    values: List[float], ranges: List[ReferenceRange]
+) -> List[str]:
+    import numpy as np
+
+    value = np.asarray(values, dtype=float)
+    low = np.array([np.nan if r.low is None else r.low for r in ranges])
+    high = np.array([np.nan if r.high is None else r.high for r in ranges])
+    low_inclusive = np.array([r.low_inclusive for r in ranges])
+    high_inclusive = np.array([r.high_inclusive for r in ranges])
+
+    # Las comparaciones con NaN dan False: sin límite nunca es bajo / alto
+    below = (value < low) | ((value == low) & ~low_inclusive)
+    above = (value > high) | ((value == high) & ~high_inclusive)
+    return np.where(below, "low", np.where(above, "high", "normal")).tolist()
+
+
+def classify_results(
+    tests: Iterable[Dict[str, Any]], vectorize: Optional[bool] = None
+) -> int:
+    """
+    Completa is_abnormal / severity de los tests sin severity (el flag del lab
+    manda). is_abnormal=True que ya venía se respeta. Devuelve cuántos tests
+    se clasificaron por rango.
+    """
+    pending: List[Dict[str, Any]] = []
+    values: List[float] = []
+    ranges: List[ReferenceRange] = []
+
+    for test in tests:
+        if not isinstance(test, dict) or test.get("severity"):
+            continue
+        reference_range = test.get("reference_range")
+        if not isinstance(reference_range, str):
+            continue
+        parsed = parse_reference_range(reference_range)
+        if parsed is None:
+            continue
+        try:
+            value = float(test.get("value"))
+        except (TypeError, ValueError):
+            continue
+        pending.append(test)
+        values.append(value)
+        ranges.append(parsed)
+
+    if not pending:
+        return 0
+
+    if vectorize is None:
+        vectorize = len(pending) >= VECTORIZE_MIN
+    severities = None
+    if vectorize:
+        try:
+            severities = _severities_vectorized(values, ranges)
+        except ImportError:
+            logger.debug("numpy no está disponible, clasificando sin vectorizar")
+    if severities is None:
+        severities = _severities_scalar(values, ranges)
+
+    for test, severity in zip(pending, severities):
+        test["severity"] = severity
+        test["is_abnormal"] = bool(test.get("is_abnormal")) or severity != "normal"
+    return len(pending)
+
+
+def classify_lab_results(lab_results: Iterable[Dict[str, Any]]) -> int:
+    """classify_results() sobre los tests de varios resultados a la vez"""
+    return classify_results(
+        test
+        for lab_result in lab_results
+        if isinstance(lab_result, dict) and isinstance(lab_result.get("results"), list)
+        for test in lab_result["results"]
+    )
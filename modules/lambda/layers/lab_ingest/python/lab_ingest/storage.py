@@ -0,0 +1,63 @@
+"""
+Layout y codificación del payload crudo en S3
+
+  incoming/<formato>/<shard>/YYYY/MM/DD/<result_id>.json[.gz|.zst]
+
+El shard (hash estable del ID) va antes de la fecha para repartir la tasa de
+escritura entre particiones de S3; un rango de fechas se lista con un prefijo
+por shard (ver services/processor/replay.py).
+"""
+
+import gzip
+import json
+import logging
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def shard_prefix(result_id: str, shards: int) -> str:
+    """Prefijo hash estable (00..shards-1 en hex) derivado del ID"""
+    shard = zlib.crc32(result_id.encode("utf-8")) % shards
+    return f"{shard:02x}"
+
+
+def build_s3_key(
+    source_format: str, result_id: str, shards: int, extension: str = ""
+) -> str:
+    """incoming/<formato>/<shard>/YYYY/MM/DD/<result_id>.json[.gz|.zst]"""
+    date_prefix = datetime.utcnow().strftime("%Y/%m/%d")
+    return (
+        f"incoming/{source_format.lower()}/{shard_prefix(result_id, shards)}/"
+        f"{date_prefix}/{result_id}.json{extension}"
+    )
+
+
+def encode_payload(
+    data: Dict[str, Any], compression: str = "none"
+) -> Tuple[bytes, Optional[str]]:
+    """
+    Serializa el payload en JSON compacto y lo comprime según compression
+    ("none", "gzip" o "zstd"). Devuelve (bytes, content_encoding).
+    """
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            logger.warning("zstandard no está disponible, usando gzip")
+        else:
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body), "zstd"
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+
+    if compression == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+
+    return body, None
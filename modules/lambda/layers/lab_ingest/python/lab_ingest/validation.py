@@ -0,0 +1,74 @@
+"""
+Validación del JSON canónico de resultados de laboratorio
+
+Es la misma validación para un POST a /ingest que para lo que producen los
+adapters HL7 / CSV / XML.
+"""
+
+from datetime import datetime
+from typing import Any, Dict
+
+
+def validate_lab_result(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida el formato del resultado de laboratorio
+    """
+    errors: list[str] = []
+
+    required_fields = [
+        "patient_id",
+        "lab_id",
+        "lab_name",
+        "test_type",
+        "test_date",
+        "results",
+    ]
+
+    for field in required_fields:
+        if field not in data:
+            errors.append(f"Missing required field: {field}")
+        elif not data[field]:
+            errors.append(f"Field '{field}' cannot be empty")
+
+    # results debe ser lista
+    if "results" in data:
+        if not isinstance(data["results"], list):
+            errors.append("Field 'results' must be a list")
+        elif len(data["results"]) == 0:
+            errors.append("Field 'results' cannot be empty")
+        else:
+            for idx, result in enumerate(data["results"]):
+                errors.extend(validate_test_result(result, idx))
+
+    # patient_id (ejemplo de regla simple)
+    if "patient_id" in data and data["patient_id"]:
+        if not str(data["patient_id"]).startswith("P"):
+            errors.append("patient_id must start with 'P'")
+
+    # test_date en ISO 8601
+    if "test_date" in data and data["test_date"]:
+        try:
+            datetime.fromisoformat(str(data["test_date"]).replace("Z", "+00:00"))
+        except (ValueError, AttributeError, TypeError):
+            errors.append("test_date must be in ISO 8601 format")
+
+    return {"valid": len(errors) == 0, "errors": errors}
+
+
+def validate_test_result(result: Dict[str, Any], index: int) -> list[str]:
+    """Valida un resultado de test individual"""
+    errors: list[str] = []
+    prefix = f"results[{index}]"
+
+    required = ["test_code", "test_name", "value", "unit"]
+    for field in required:
+        if field not in result:
+            errors.append(f"{prefix}: Missing field '{field}'")
+
+    if "value" in result:
+        try:
+            float(result["value"])
+        except (ValueError, TypeError):
+            errors.append(f"{prefix}: 'value' must be numeric")
+
+    return errors
@@ -0,0 +1,424 @@
+"""
+Escritura de resultados normalizados: payload crudo en S3 + mensaje en SQS
+
+IngestWriter hace lo que antes solo hacía Lambda Ingest, para que los
+adapters HL7 / CSV / XML lo ejecuten en su propio proceso (sin invocar otra
+Lambda):
+
+  1. validar el JSON canónico
+  2. deduplicar (Idempotency-Key o hash del payload)
+  3. completar is_abnormal / severity según el reference_range (tests sin flag)
+  4. guardar el payload crudo en S3
+  5. encolar el mensaje para el worker en SQS
+
+ingest() procesa un resultado (POST /ingest). ingest_many() procesa un lote y
+agrupa los mensajes con SendMessageBatch (10 por llamada). Cada resultado
+devuelve un outcome: {"status_code", "body", "error", "replayed"}.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from lab_ingest.idempotency import (
+    IdempotencyConflict,
+    IdempotencyKeyMismatch,
+    InMemoryIdempotencyStore,
+    build_idempotency_key,
+    check_existing,
+    payload_hash,
+)
+from lab_ingest.ids import generate_ulid
+from lab_ingest.reference_ranges import classify_lab_results
+from lab_ingest.storage import COMPRESSION_EXTENSIONS, build_s3_key, encode_payload
+from lab_ingest.validation import validate_lab_result
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_SCHEMA_VERSION = "1.0"
+SQS_BATCH_SIZE = 10
+
+
+def outcome(
+    status_code: int,
+    body: Optional[Dict[str, Any]] = None,
+    error: Any = None,
+    replayed: bool = False,
+) -> Dict[str, Any]:
+    """Resultado de procesar un payload (se traduce a respuesta HTTP o conteo)"""
+    return {
+        "status_code": status_code,
+        "body": body or {},
+        "error": error,
+        "replayed": replayed,
+    }
+
+
+class IngestWriter:
+    """Valida, deduplica, guarda en S3 y encola en SQS resultados normalizados"""
+
+    def __init__(
+        self,
+        s3_client,
+        sqs_client,
+        bucket: str,
+        queue_url: str,
+        source_format: str,
+        environment: str = "dev",
+        compression: str = "none",
+        shards: int = 16,
+        store=None,
+        record_ttl: int = 86400,
+        in_progress_ttl: int = 120,
+    ):
+        self.s3_client = s3_client
+        self.sqs_client = sqs_client
+        self.bucket = bucket
+        self.queue_url = queue_url
+        self.source_format = source_format
+        self.environment = environment
+        self.compression = compression
+        self.shards = shards
+        self.store = store if store is not None else InMemoryIdempotencyStore()
+        self.record_ttl = record_ttl
+        self.in_progress_ttl = in_progress_ttl
+
+    @classmethod
+    def from_env(cls, s3_client, sqs_client, source_format: str, store=None):
+        """Configuración de las variables de entorno de la Lambda"""
+        return cls(
+            s3_client,
+            sqs_client,
+            bucket=os.environ["S3_BUCKET"],
+            queue_url=os.environ["SQS_QUEUE_URL"],
+            source_format=source_format,
+            environment=os.environ.get("ENVIRONMENT", "dev"),
+            compression=os.environ.get("PAYLOAD_COMPRESSION", "none").lower(),
+            shards=int(os.environ.get("S3_KEY_SHARDS", "16")),
+            store=store,
+            record_ttl=int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400")),
+            in_progress_ttl=int(os.environ.get("IDEMPOTENCY_IN_PROGRESS_TTL", "120")),
+        )
+
+    # --------------------------------------------------
+    # S3
+    # --------------------------------------------------
+    def build_s3_key(self, result_id: str, extension: str = "") -> str:
+        return build_s3_key(self.source_format, result_id, self.shards, extension)
+
+    def save_to_s3(self, data: Dict[str, Any], result_id: str) -> str:
+        """
+        Guarda el JSON crudo en S3 (comprimido si PAYLOAD_COMPRESSION lo indica)
+        """
+        now = datetime.utcnow().isoformat()
+
+        data["ingested_at"] = now
+        data["result_id"] = result_id
+        data["environment"] = self.environment
+        data["source_format"] = self.source_format
+        data["payload_schema_version"] = PAYLOAD_SCHEMA_VERSION
+
+        body, content_encoding = encode_payload(data, self.compression)
+        extension = COMPRESSION_EXTENSIONS.get(content_encoding, "")
+
+        s3_key = self.build_s3_key(result_id, extension)
+
+        metadata = {
+            "result-id": result_id,
+            "patient-id": str(data.get("patient_id", "")),
+            "lab-id": str(data.get("lab_id", "")),
+            "test-type": str(data.get("test_type", "")),
+            "source-format": self.source_format,
+            "ingested-at": now,
+        }
+        put_kwargs: Dict[str, Any] = {}
+        if content_encoding:
+            metadata["content-encoding"] = content_encoding
+            put_kwargs["ContentEncoding"] = content_encoding
+
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=s3_key,
+            Body=body,
+            ContentType="application/json",
+            ServerSideEncryption="AES256",
+            Metadata=metadata,
+            **put_kwargs,
+        )
+
+        logger.debug("Saved to S3: s3://%s/%s", self.bucket, s3_key)
+        return s3_key
+
+    # --------------------------------------------------
+    # SQS
+    # --------------------------------------------------
+    def build_message(
+        self, s3_key: str, result_id: str, data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Mensaje para el worker (mismo formato que replay.py)"""
+        return {
+            "result_id": result_id,
+            "s3_bucket": self.bucket,
+            "s3_key": s3_key,
+            "patient_id": data.get("patient_id"),
+            "test_type": data.get("test_type"),
+            "lab_id": data.get("lab_id"),
+            "lab_name": data.get("lab_name"),
+            "source_format": self.source_format,
+            "payload_schema_version": PAYLOAD_SCHEMA_VERSION,
+            "timestamp": datetime.utcnow().isoformat(),
+            "environment": self.environment,
+        }
+
+    def message_attributes(
+        self, result_id: str, data: Dict[str, Any]
+    ) -> Dict[str, Dict[str, str]]:
+        def attr(value: Any) -> Dict[str, str]:
+            return {"StringValue": str(value), "DataType": "String"}
+
+        attributes = {
+            "result_id": attr(result_id),
+            "patient_id": attr(data.get("patient_id", "")),
+            "test_type": attr(data.get("test_type", "")),
+            "lab_id": attr(data.get("lab_id", "")),
+            "source_format": attr(self.source_format),
+        }
+        # SQS rechaza atributos String vacíos
+        return {k: v for k, v in attributes.items() if v["StringValue"]}
+
+    def send_to_sqs(self, s3_key: str, result_id: str, data: Dict[str, Any]) -> str:
+        """Envía un mensaje (POST individual); devuelve el MessageId"""
+        response = self.sqs_client.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(self.build_message(s3_key, result_id, data)),
+            MessageAttributes=self.message_attributes(result_id, data),
+        )
+        message_id = response["MessageId"]
+        logger.info("Sent to SQS: MessageId=%s", message_id)
+        return message_id
+
+    def send_messages(
+        self, entries: List[Tuple[Dict[str, Any], Dict[str, Any]]]
+    ) -> List[Optional[str]]:
+        """
+        Envía (mensaje, atributos) con SendMessageBatch de a 10. Devuelve el
+        MessageId de cada entrada, o None si SQS la rechazó. Las entradas que
+        fallan por el lado del servicio (SenderFault=False) se reintentan una vez.
+        """
+        message_ids: List[Optional[str]] = [None] * len(entries)
+
+        for start in range(0, len(entries), SQS_BATCH_SIZE):
+            end = min(start + SQS_BATCH_SIZE, len(entries))
+            # Id de la entrada = índice en entries (único dentro de la llamada)
+            pending = {str(idx): idx for idx in range(start, end)}
+
+            for attempt in range(2):
+                response = self.sqs_client.send_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[
+                        {
+                            "Id": entry_id,
+                            "MessageBody": json.dumps(entries[idx][0]),
+                            "MessageAttributes": entries[idx][1],
+                        }
+                        for entry_id, idx in pending.items()
+                    ],
+                )
+                for success in response.get("Successful", []):
+                    message_ids[pending.pop(success["Id"])] = success["MessageId"]
+
+                retry = {}
+                for failure in response.get("Failed", []):
+                    idx = pending.pop(failure["Id"])
+                    logger.error("SQS rejected message %s: %s", idx, failure)
+                    if not failure.get("SenderFault") and attempt == 0:
+                        retry[failure["Id"]] = idx
+                if not retry:
+                    break
+                pending = retry
+
+        return message_ids
+
+    # --------------------------------------------------
+    # Flujo completo
+    # --------------------------------------------------
+    def _begin(
+        self, data: Dict[str, Any], key: str, body_hash: str, header_supplied: bool
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Valida y reserva la key de idempotencia. Devuelve un outcome final
+        (error o duplicado) o None si el resultado hay que escribirlo.
+        """
+        validation = validate_lab_result(data)
+        if not validation["valid"]:
+            return outcome(400, error=validation["errors"])
+
+        try:
+            previous = check_existing(self.store, key, body_hash, header_supplied)
+            if previous is None and not self.store.claim(
+                key, body_hash, self.in_progress_ttl
+            ):
+                # Otra invocación la reservó entre el get y el claim
+                previous = check_existing(self.store, key, body_hash, header_supplied)
+        except IdempotencyConflict:
+            return outcome(409, error="A request with this key is in progress")
+        except IdempotencyKeyMismatch:
+            return outcome(
+                422, error="Idempotency-Key was already used with a different payload"
+            )
+
+        if previous is not None:
+            logger.info("Duplicado detectado. Result ID: %s", previous["result_id"])
+            return outcome(202, {**previous, "duplicate": True}, replayed=True)
+        return None
+
+    def _accept(
+        self, key: str, result_id: str, message_id: str, s3_key: str
+    ) -> Dict[str, Any]:
+        response = {
+            "result_id": result_id,
+            "message_id": message_id,
+            "s3_key": s3_key,
+            "status": "accepted",
+            "message": "Lab result received and queued for processing",
+        }
+        self.store.complete(key, response, self.record_ttl)
+        return outcome(202, response)
+
+    def ingest(
+        self, data: Dict[str, Any], header_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Un resultado: S3 + SendMessage. Los errores de AWS se propagan."""
+        body_hash = payload_hash(data)
+        key = build_idempotency_key(header_key, data, body_hash)
+        final = self._begin(data, key, body_hash, header_key is not None)
+        if final is not None:
+            return final
+
+        classify_lab_results([data])
+        try:
+            result_id = generate_ulid()
+            s3_key = self.save_to_s3(data, result_id)
+            message_id = self.send_to_sqs(s3_key, result_id, data)
+        except Exception:
+            # Liberar la reserva para que el reintento del lab pueda procesar
+            self.store.release(key)
+            raise
+
+        logger.info("Procesamiento exitoso. Result ID: %s", result_id)
+        return self._accept(key, result_id, message_id, s3_key)
+
+    def ingest_many(self, items: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Un lote de resultados: un PutObject por resultado y los mensajes
+        agrupados con SendMessageBatch. Un error afecta solo a su elemento.
+        """
+        outcomes: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        accepted: List[Tuple[int, str, Dict[str, Any]]] = []
+        pending: List[Tuple[int, str, str, str]] = []
+        entries: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        first_by_key: Dict[str, int] = {}
+        repeated: List[Tuple[int, int]] = []
+
+        for index, data in enumerate(items):
+            if not isinstance(data, dict):
+                outcomes[index] = outcome(400, error="Batch item must be a JSON object")
+                continue
+
+            body_hash = payload_hash(data)
+            key = build_idempotency_key(None, data, body_hash)
+            if key in first_by_key:
+                # Repetido dentro del mismo lote: misma respuesta que el primero
+                repeated.append((index, first_by_key[key]))
+                continue
+            first_by_key[key] = index
+
+            final = self._begin(data, key, body_hash, False)
+            if final is not None:
+                outcomes[index] = final
+                continue
+            accepted.append((index, key, data))
+
+        # Rangos de referencia de todo el lote en una sola pasada
+        classify_lab_results(data for _, _, data in accepted)
+
+        for index, key, data in accepted:
+            try:
+                result_id = generate_ulid()
+                s3_key = self.save_to_s3(data, result_id)
+            except Exception as exc:  # noqa: BLE001 - se reporta por elemento
+                logger.error("Error saving batch[%d]: %s", index, exc, exc_info=True)
+                self.store.release(key)
+                outcomes[index] = outcome(500, error=str(exc))
+                continue
+
+            pending.append((index, key, result_id, s3_key))
+            entries.append(
+                (
+                    self.build_message(s3_key, result_id, data),
+                    self.message_attributes(result_id, data),
+                )
+            )
+
+        try:
+            message_ids = self.send_messages(entries)
+        except Exception as exc:  # noqa: BLE001 - se reporta por elemento
+            logger.error("Error sending batch to SQS: %s", exc, exc_info=True)
+            message_ids = [None] * len(entries)
+
+        for (index, key, result_id, s3_key), message_id in zip(pending, message_ids):
+            if message_id is None:
+                self.store.release(key)
+                outcomes[index] = outcome(500, error="Failed to enqueue message")
+            else:
+                outcomes[index] = self._accept(key, result_id, message_id, s3_key)
+
+        for index, first in repeated:
+            original = outcomes[first]
+            if original["status_code"] < 300:
+                outcomes[index] = outcome(
+                    202, {**original["body"], "duplicate": True}, replayed=True
+                )
+            else:
+                outcomes[index] = dict(original)
+
+        logger.info(
+            "Batch of %d results: %d queued, %d SQS calls",
+            len(items),
+            sum(1 for m in message_ids if m),
+            -(-len(entries) // SQS_BATCH_SIZE),
+        )
+        return outcomes
+
+    def ingest_stream(
+        self, results: Iterable[Dict[str, Any]], batch_size: int = 50
+    ) -> Dict[str, int]:
+        """
+        Escribe un iterable de resultados (un archivo de un adapter) en lotes
+        de batch_size. Devuelve cuántos se aceptaron, cuántos se rechazaron
+        (400/422, no tiene sentido reintentarlos) y cuántos fallaron.
+        """
+        counts = {"results": 0, "rejected": 0, "failed": 0}
+        batch: List[Dict[str, Any]] = []
+
+        def flush():
+            for result in self.ingest_many(batch):
+                code = result["status_code"]
+                if code < 300:
+                    counts["results"] += 1
+                elif code in (400, 422):
+                    counts["rejected"] += 1
+                    logger.warning("Rejected result: %s", result["error"])
+                else:
+                    counts["failed"] += 1
+            batch.clear()
+
+        for normalized in results:
+            batch.append(normalized)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        return counts
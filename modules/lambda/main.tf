@@ -46,7 +46,7 @@ resource "aws_iam_role_policy_attachment" "lambda_vpc" {
   policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaVPCAccessExecutionRole"
 }
 
-# Custom policy for S3, SQS, SES, SNS and Lambda invoke
+# Custom policy for S3, SQS, SES and SNS
 resource "aws_iam_role_policy" "lambda_permissions" {
   name = "${local.lambda_prefix}-lambda-permissions"
   role = aws_iam_role.lambda_execution.id
@@ -66,6 +66,13 @@ resource "aws_iam_role_policy" "lambda_permissions" {
           "${var.s3_bucket_arn}/*"
         ]
       },
+      {
+        # PDF Generator: borra versiones viejas de reports/<result_id>/ y
+        # aborta los multipart uploads de batches fallidos
+        Effect   = "Allow"
+        Action   = ["s3:DeleteObject", "s3:AbortMultipartUpload"]
+        Resource = "${var.s3_bucket_arn}/reports/*"
+      },
       {
         Effect = "Allow"
         Action = [
@@ -91,13 +98,6 @@ resource "aws_iam_role_policy" "lambda_permissions" {
           "sns:Publish"
         ]
         Resource = var.sns_topic_arn != "" ? var.sns_topic_arn : "*"
-      },
-      {
-        Effect = "Allow"
-        Action = [
-          "lambda:InvokeFunction"
-        ]
-        Resource = aws_lambda_function.ingest.arn
       }
     ]
   })
@@ -115,6 +115,40 @@ resource "aws_lambda_layer_version" "psycopg2" {
   }
 }
 
+# Package the shared ingest library (validation, idempotency, S3 + SQS writer)
+data "archive_file" "lab_ingest_layer" {
+  type        = "zip"
+  source_dir  = "${path.module}/layers/lab_ingest"
+  output_path = "${path.module}/builds/lab_ingest_layer.zip"
+  excludes    = ["**/__pycache__/**"]
+}
+
+# Lambda layer shared by Ingest and the HL7 / CSV / XML adapters
+resource "aws_lambda_layer_version" "lab_ingest" {
+  filename            = data.archive_file.lab_ingest_layer.output_path
+  layer_name          = "${local.lambda_prefix}-lab-ingest"
+  compatible_runtimes = [var.lambda_runtime]
+  source_code_hash    = data.archive_file.lab_ingest_layer.output_base64sha256
+  description         = "Shared lab result ingest library"
+}
+
+# Package the shared RDS access library (warm connection + cached DB secret)
+data "archive_file" "lab_db_layer" {
+  type        = "zip"
+  source_dir  = "${path.module}/layers/lab_db"
+  output_path = "${path.module}/builds/lab_db_layer.zip"
+  excludes    = ["**/__pycache__/**"]
+}
+
+# Lambda layer shared by PDF Generator and Notify
+resource "aws_lambda_layer_version" "lab_db" {
+  filename            = data.archive_file.lab_db_layer.output_path
+  layer_name          = "${local.lambda_prefix}-lab-db"
+  compatible_runtimes = [var.lambda_runtime]
+  source_code_hash    = data.archive_file.lab_db_layer.output_base64sha256
+  description         = "Shared RDS connection manager"
+}
+
 # Secrets Manager secret for DB credentials
 resource "aws_secretsmanager_secret" "db_credentials" {
   name = "${local.lambda_prefix}-db-credentials"
@@ -16,12 +16,13 @@ resource "aws_lambda_function" "notify" {
   timeout          = var.lambda_timeout
   memory_size      = var.lambda_memory_size
 
-  # psycopg2 layer
-  layers = [aws_lambda_layer_version.psycopg2.arn]
+  # psycopg2 + shared RDS connection manager
+  layers = [aws_lambda_layer_version.psycopg2.arn, aws_lambda_layer_version.lab_db.arn]
 
   environment {
     variables = {
       DB_SECRET_ARN     = aws_secretsmanager_secret.db_credentials.arn
+      DB_SECRET_TTL     = "300"
       SENDER_EMAIL      = var.ses_email_identity
       PORTAL_URL        = var.portal_url
       SES_TEMPLATE_NAME = "${var.project_name}-${var.environment}-result-ready"
@@ -14,6 +14,11 @@ output "ingest_invoke_arn" {
   value       = aws_lambda_function.ingest.invoke_arn
 }
 
+output "ingest_idempotency_table_name" {
+  description = "Tabla DynamoDB de idempotencia de Lambda Ingest"
+  value       = aws_dynamodb_table.ingest_idempotency.name
+}
+
 # Lambda Notify outputs
 output "notify_function_name" {
   description = "Nombre de Lambda Notify"
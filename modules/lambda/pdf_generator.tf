@@ -16,14 +16,18 @@ resource "aws_lambda_function" "pdf_generator" {
   timeout          = 300  # 5 minutes
   memory_size      = 1024 # 1 GB for PDF generation
 
-  layers = [aws_lambda_layer_version.psycopg2.arn]
+  layers = [aws_lambda_layer_version.psycopg2.arn, aws_lambda_layer_version.lab_db.arn]
 
   environment {
     variables = {
-      S3_BUCKET     = var.s3_bucket_name
-      DB_SECRET_ARN = aws_secretsmanager_secret.db_credentials.arn
-      ENVIRONMENT   = var.environment
-      LOG_LEVEL     = "INFO"
+      S3_BUCKET          = var.s3_bucket_name
+      DB_SECRET_ARN      = aws_secretsmanager_secret.db_credentials.arn
+      DB_SECRET_TTL      = "300"
+      BATCH_MAX_RESULTS  = "500"
+      BATCH_WORKERS      = "8"
+      HISTORY_MAX_POINTS = "120"
+      ENVIRONMENT        = var.environment
+      LOG_LEVEL          = "INFO"
     }
   }
 
@@ -0,0 +1,56 @@
+# Direct-to-S3 uploads: Lambda Ingest hands out presigned URLs under
+# uploads/<format>/ and each adapter is triggered by the S3 event
+locals {
+  upload_adapters = {
+    hl7 = aws_lambda_function.hl7_adapter
+    csv = aws_lambda_function.csv_adapter
+    xml = aws_lambda_function.xml_adapter
+  }
+}
+
+# Allow S3 to invoke each adapter
+resource "aws_lambda_permission" "allow_s3_uploads" {
+  for_each = local.upload_adapters
+
+  statement_id  = "AllowS3Uploads"
+  action        = "lambda:InvokeFunction"
+  function_name = each.value.function_name
+  principal     = "s3.amazonaws.com"
+  source_arn    = var.s3_bucket_arn
+}
+
+# S3 event notifications: uploads/<format>/ -> <format> adapter
+resource "aws_s3_bucket_notification" "uploads" {
+  bucket = var.s3_bucket_name
+
+  dynamic "lambda_function" {
+    for_each = local.upload_adapters
+    content {
+      lambda_function_arn = lambda_function.value.arn
+      events              = ["s3:ObjectCreated:*"]
+      filter_prefix       = "uploads/${lambda_function.key}/"
+    }
+  }
+
+  depends_on = [aws_lambda_permission.allow_s3_uploads]
+}
+
+# Multipart uploads created by Ingest may need to be aborted/inspected
+resource "aws_iam_role_policy" "lambda_uploads" {
+  name = "${local.lambda_prefix}-uploads-policy"
+  role = aws_iam_role.lambda_execution.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:AbortMultipartUpload",
+          "s3:ListMultipartUploadParts"
+        ]
+        Resource = "${var.s3_bucket_arn}/uploads/*"
+      }
+    ]
+  })
+}
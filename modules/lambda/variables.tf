@@ -106,6 +106,35 @@ variable "lambda_memory_size" {
   default     = 512
 }
 
+variable "payload_compression" {
+  description = "Compresión del payload crudo en S3 (none, gzip, zstd)"
+  type        = string
+  default     = "none"
+
+  validation {
+    condition     = contains(["none", "gzip", "zstd"], var.payload_compression)
+    error_message = "payload_compression debe ser none, gzip o zstd."
+  }
+}
+
+variable "s3_key_shards" {
+  description = "Número de prefijos hash para las keys de incoming/ en S3"
+  type        = number
+  default     = 16
+}
+
+variable "idempotency_ttl_seconds" {
+  description = "Tiempo que Ingest recuerda una request para deduplicar reintentos"
+  type        = number
+  default     = 86400
+}
+
+variable "upload_url_ttl_seconds" {
+  description = "Vigencia de las URLs presignadas de POST /uploads"
+  type        = number
+  default     = 900
+}
+
 # Logging configuration
 variable "log_retention_days" {
   description = "Días de retención de logs"
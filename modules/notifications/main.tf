@@ -88,6 +88,27 @@ resource "aws_lambda_permission" "sns_notify" {
   source_arn    = aws_sns_topic.result_ready.arn
 }
 
+# SNS subscription to Lambda PDF Generator: pre-generates the report so the
+# portal download only has to sign a URL
+resource "aws_sns_topic_subscription" "lambda_pdf" {
+  topic_arn = aws_sns_topic.result_ready.arn
+  protocol  = "lambda"
+  endpoint  = var.lambda_pdf_function_arn
+
+  filter_policy = jsonencode({
+    event_type = ["result_completed"]
+  })
+}
+
+# Permission for SNS to invoke Lambda PDF Generator
+resource "aws_lambda_permission" "sns_pdf" {
+  statement_id  = "AllowExecutionFromSNS"
+  action        = "lambda:InvokeFunction"
+  function_name = var.lambda_pdf_function_name
+  principal     = "sns.amazonaws.com"
+  source_arn    = aws_sns_topic.result_ready.arn
+}
+
 # SES email identity (FROM address)
 resource "aws_ses_email_identity" "sender" {
   email = var.ses_email_identity
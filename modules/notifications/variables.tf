@@ -25,6 +25,17 @@ variable "lambda_notify_function_name" {
   type        = string
 }
 
+# Lambda PDF Generator (pre-generación de reportes)
+variable "lambda_pdf_function_arn" {
+  description = "ARN de Lambda PDF Generator"
+  type        = string
+}
+
+variable "lambda_pdf_function_name" {
+  description = "Nombre de Lambda PDF Generator"
+  type        = string
+}
+
 # SES configuration
 variable "ses_email_identity" {
   description = "Email verificado en SES (from address)"
@@ -228,6 +228,26 @@ resource "aws_s3_bucket_lifecycle_configuration" "data" {
     }
   }
 
+  # Rule for direct uploads under uploads/ (presigned PUT / multipart)
+  rule {
+    id     = "uploads-lifecycle"
+    status = "Enabled"
+
+    filter {
+      prefix = "uploads/"
+    }
+
+    # Clean up multipart uploads that were never completed or aborted
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 7
+    }
+
+    transition {
+      days          = var.days_to_transition_ia
+      storage_class = "STANDARD_IA"
+    }
+  }
+
   # Rule for processed data under processed/
   rule {
     id     = "processed-lifecycle"
@@ -295,12 +315,15 @@ resource "aws_s3_bucket_policy" "data" {
         }
       },
       # Deny uploads without SSE
+      # uploads/ is excluded: multipart UploadPart requests cannot carry the
+      # SSE header, and parts inherit the encryption set on
+      # CreateMultipartUpload (default bucket encryption covers the rest)
       {
-        Sid       = "DenyUnencryptedObjectUploads"
-        Effect    = "Deny"
-        Principal = "*"
-        Action    = "s3:PutObject"
-        Resource  = "${aws_s3_bucket.data.arn}/*"
+        Sid         = "DenyUnencryptedObjectUploads"
+        Effect      = "Deny"
+        Principal   = "*"
+        Action      = "s3:PutObject"
+        NotResource = "${aws_s3_bucket.data.arn}/uploads/*"
         Condition = {
           StringNotEquals = {
             "s3:x-amz-server-side-encryption" = ["AES256", "aws:kms"]
@@ -317,7 +340,7 @@ resource "aws_s3_bucket_cors_configuration" "data" {
 
   cors_rule {
     allowed_headers = ["*"]
-    allowed_methods = ["GET", "HEAD"]
+    allowed_methods = ["GET", "HEAD", "PUT", "POST"]
     allowed_origins = [
       "https://${var.project_name}-${var.environment}.example.com"
     ]
@@ -113,8 +113,8 @@ echo -e "${YELLOW}Building Docker image...${NC}"
 echo -e "${BLUE}This may take a few minutes...${NC}"
 echo ""
 
-cd "$SERVICE_DIR"
-docker build -t "$ECR_REPO_NAME:latest" .
+# Contexto = raíz del repo: la imagen incluye el layer lab_db (queries compartidas)
+docker build -f "$SERVICE_DIR/Dockerfile" -t "$ECR_REPO_NAME:latest" .
 
 echo ""
 echo -e "${GREEN}✓ Docker image built${NC}"
@@ -148,8 +148,6 @@ echo ""
 echo -e "${GREEN}✓ Image pushed to ECR${NC}"
 echo ""
 
-cd - > /dev/null
-
 # ==============================
 # 9. (Opcional) Forzar deploy ECS
 # ==============================
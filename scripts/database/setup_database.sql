@@ -78,6 +78,9 @@ CREATE TABLE IF NOT EXISTS lab_results (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
+    -- Versión del reporte PDF: solo cambia con el contenido (trigger abajo)
+    report_version TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
     -- Foreign Keys
     CONSTRAINT fk_patient 
         FOREIGN KEY (patient_id) 
@@ -96,6 +99,9 @@ CREATE INDEX idx_lab_results_status ON lab_results(status);
 CREATE INDEX idx_lab_results_test_date ON lab_results(test_date DESC);
 CREATE INDEX idx_lab_results_test_type ON lab_results(test_type);
 CREATE INDEX idx_lab_results_created ON lab_results(created_at DESC);
+-- Reporte histórico del paciente (PDF Generator, modo history)
+CREATE INDEX IF NOT EXISTS idx_lab_results_patient_date ON lab_results(patient_id, test_date)
+    WHERE status = 'completed';
 
 -- Full-text search
 CREATE INDEX idx_lab_results_search ON lab_results 
@@ -104,8 +110,15 @@ CREATE INDEX idx_lab_results_search ON lab_results
         coalesce(notes, '')
     ));
 
+-- Bases creadas antes de report_version: se parte de updated_at, así los
+-- PDFs ya cacheados (reports/<result_id>/<updated_at>.pdf) siguen valiendo
+ALTER TABLE lab_results ADD COLUMN IF NOT EXISTS report_version TIMESTAMP;
+UPDATE lab_results SET report_version = updated_at WHERE report_version IS NULL;
+ALTER TABLE lab_results ALTER COLUMN report_version SET DEFAULT CURRENT_TIMESTAMP;
+
 COMMENT ON TABLE lab_results IS 'Resultados de laboratorio';
 COMMENT ON COLUMN lab_results.status IS 'Estado: pending, processing, completed, failed, archived';
+COMMENT ON COLUMN lab_results.report_version IS 'Versión del contenido del reporte (key del PDF cacheado)';
 
 -- ============================================
 -- TABLA: test_values
@@ -124,6 +137,11 @@ CREATE TABLE IF NOT EXISTS test_values (
     reference_range VARCHAR(100),
     is_abnormal BOOLEAN DEFAULT FALSE,
     
+    -- Valor en la unidad canónica del test_code (worker, units.py);
+    -- NULL si la unidad reportada no está en la tabla de conversión
+    canonical_value DECIMAL(14,4),
+    canonical_unit VARCHAR(50),
+    
     -- Flags adicionales
     severity VARCHAR(20),  -- low, high, critical
     alert_flag BOOLEAN DEFAULT FALSE,
@@ -149,6 +167,13 @@ CREATE INDEX idx_test_values_code ON test_values(test_code);
 CREATE INDEX idx_test_values_abnormal ON test_values(is_abnormal) WHERE is_abnormal = TRUE;
 CREATE INDEX idx_test_values_alert ON test_values(alert_flag) WHERE alert_flag = TRUE;
 
+-- Bases creadas antes de canonical_value / canonical_unit
+ALTER TABLE test_values ADD COLUMN IF NOT EXISTS canonical_value DECIMAL(14,4);
+ALTER TABLE test_values ADD COLUMN IF NOT EXISTS canonical_unit VARCHAR(50);
+-- Tendencias y cohortes por test sin convertir unidades al leer
+CREATE INDEX IF NOT EXISTS idx_test_values_canonical ON test_values(test_code, canonical_value)
+    WHERE canonical_value IS NOT NULL;
+
 COMMENT ON TABLE test_values IS 'Valores individuales de cada test en un resultado';
 
 -- ============================================
@@ -238,6 +263,43 @@ CREATE INDEX idx_queue_status_created ON processing_queue_status(created_at DESC
 
 COMMENT ON TABLE processing_queue_status IS 'Estado de procesamiento de mensajes SQS';
 
+-- ============================================
+-- TABLA: report_jobs (PDF asíncronos del portal)
+-- ============================================
+CREATE TABLE IF NOT EXISTS report_jobs (
+    job_id SERIAL PRIMARY KEY,
+    
+    -- Reporte pedido: resultado + versión (lab_results.report_version)
+    result_id INTEGER NOT NULL,
+    result_version TIMESTAMP NOT NULL,
+    
+    -- Status
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    s3_key VARCHAR(512),
+    attempt_count INTEGER DEFAULT 0,
+    error_message TEXT,
+    
+    -- Timestamps
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP,
+    
+    -- Foreign Keys
+    CONSTRAINT fk_report_job_result 
+        FOREIGN KEY (result_id) 
+        REFERENCES lab_results(result_id)
+        ON DELETE CASCADE,
+    
+    -- Un job por versión: pedidos duplicados se colapsan (ON CONFLICT)
+    CONSTRAINT unique_report_job_version 
+        UNIQUE (result_id, result_version),
+    
+    CONSTRAINT valid_report_job_status 
+        CHECK (status IN ('pending', 'running', 'completed', 'failed'))
+);
+
+COMMENT ON TABLE report_jobs IS 'Jobs de generación de PDF pedidos desde el portal';
+
 -- ============================================
 -- FUNCIONES: Triggers para updated_at
 -- ============================================
@@ -266,6 +328,94 @@ CREATE TRIGGER update_queue_status_updated_at
     FOR EACH ROW 
     EXECUTE FUNCTION update_updated_at_column();
 
+CREATE TRIGGER update_report_jobs_updated_at 
+    BEFORE UPDATE ON report_jobs
+    FOR EACH ROW 
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- report_version solo cambia si cambia algo que el PDF muestra: updates de
+-- bookkeeping (s3_processed_key, status, error_message, ...) tocan updated_at
+-- pero no invalidan los reportes cacheados
+CREATE OR REPLACE FUNCTION update_report_version_column()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF (NEW.patient_id, NEW.lab_name, NEW.test_type, NEW.test_date,
+        NEW.physician_name, NEW.physician_npi, NEW.notes)
+       IS DISTINCT FROM
+       (OLD.patient_id, OLD.lab_name, OLD.test_type, OLD.test_date,
+        OLD.physician_name, OLD.physician_npi, OLD.notes) THEN
+        NEW.report_version = CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER update_lab_results_report_version 
+    BEFORE UPDATE ON lab_results
+    FOR EACH ROW 
+    EXECUTE FUNCTION update_report_version_column();
+
+-- El PDF también muestra los test_values del resultado (el histórico, sus
+-- valores canónicos) y el nombre / fecha de nacimiento del paciente: corregirlos sube report_version de los
+-- resultados afectados. El filtro "IS DISTINCT FROM CURRENT_TIMESTAMP" deja
+-- en no-op los INSERT de test_values del worker (misma transacción que el
+-- resultado, que ya tiene report_version = CURRENT_TIMESTAMP) y los cambios
+-- repetidos dentro de una transacción
+CREATE OR REPLACE FUNCTION bump_result_report_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF (TG_OP <> 'INSERT') THEN
+        UPDATE lab_results
+        SET report_version = CURRENT_TIMESTAMP
+        WHERE result_id = OLD.result_id
+          AND report_version IS DISTINCT FROM CURRENT_TIMESTAMP;
+    END IF;
+    IF (TG_OP <> 'DELETE') THEN
+        UPDATE lab_results
+        SET report_version = CURRENT_TIMESTAMP
+        WHERE result_id = NEW.result_id
+          AND report_version IS DISTINCT FROM CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER test_values_report_version 
+    AFTER INSERT OR DELETE ON test_values
+    FOR EACH ROW 
+    EXECUTE FUNCTION bump_result_report_version();
+
+CREATE TRIGGER test_values_report_version_update 
+    AFTER UPDATE ON test_values
+    FOR EACH ROW 
+    WHEN ((OLD.result_id, OLD.test_code, OLD.test_name, OLD.value, OLD.unit,
+           OLD.reference_range, OLD.is_abnormal, OLD.severity,
+           OLD.canonical_value, OLD.canonical_unit)
+          IS DISTINCT FROM
+          (NEW.result_id, NEW.test_code, NEW.test_name, NEW.value, NEW.unit,
+           NEW.reference_range, NEW.is_abnormal, NEW.severity,
+           NEW.canonical_value, NEW.canonical_unit))
+    EXECUTE FUNCTION bump_result_report_version();
+
+CREATE OR REPLACE FUNCTION bump_patient_report_versions()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE lab_results
+    SET report_version = CURRENT_TIMESTAMP
+    WHERE patient_id = NEW.patient_id
+      AND report_version IS DISTINCT FROM CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE TRIGGER patients_report_version 
+    AFTER UPDATE OF first_name, last_name, date_of_birth ON patients
+    FOR EACH ROW 
+    WHEN ((OLD.first_name, OLD.last_name, OLD.date_of_birth)
+          IS DISTINCT FROM
+          (NEW.first_name, NEW.last_name, NEW.date_of_birth))
+    EXECUTE FUNCTION bump_patient_report_versions();
+
 -- ============================================
 -- FUNCIONES: Audit Logging
 -- ============================================
@@ -444,6 +594,8 @@ COMMENT ON FUNCTION get_processing_stats IS 'Estadísticas de procesamiento por
 -- GRANT USAGE ON SCHEMA public TO healthcare_app;
 -- GRANT SELECT, INSERT, UPDATE ON patients, lab_results, test_values TO healthcare_app;
 -- GRANT SELECT, INSERT, UPDATE ON processing_queue_status TO healthcare_app;
+-- GRANT SELECT, INSERT, UPDATE ON report_jobs TO healthcare_app;
+-- GRANT USAGE ON SEQUENCE report_jobs_job_id_seq TO healthcare_app;
 -- GRANT SELECT ON audit_log TO healthcare_app;
 
 
@@ -19,10 +19,16 @@ from urllib.parse import urlencode
 import psycopg2
 import os
 import json
+import threading
+import time
 import boto3
 import requests
+from botocore.client import Config
+from botocore.exceptions import ClientError
+from collections import OrderedDict
 from functools import wraps
 from jose import jwt
+from lab_db import fail_report_job, fetch_result, get_report_job, submit_report_job
 
 
 app = Flask(__name__)
@@ -54,6 +60,27 @@ AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
 
 lambda_client = boto3.client("lambda", region_name=AWS_REGION)
 
+# Reportes pre-generados por la Lambda PDF: reports/<result_id>/<report_version>.pdf
+S3_BUCKET = os.environ.get("S3_BUCKET")
+REPORTS_PREFIX = "reports"
+SIGNED_URL_TTL = int(os.environ.get("SIGNED_URL_TTL", "3600"))
+# Signed URLs reutilizadas entre descargas: como máximo SIGNED_URL_CACHE_TTL
+# segundos después de firmarlas (las credenciales del task role que las firman
+# pueden vencer antes que ExpiresIn), y siempre con al menos
+# SIGNED_URL_MIN_REMAINING segundos de validez al entregarlas
+SIGNED_URL_CACHE_TTL = int(os.environ.get("SIGNED_URL_CACHE_TTL", "300"))
+SIGNED_URL_MIN_REMAINING = int(os.environ.get("SIGNED_URL_MIN_REMAINING", "120"))
+SIGNED_URL_CACHE_SIZE = int(os.environ.get("SIGNED_URL_CACHE_SIZE", "1024"))
+# Jobs sin avance en este tiempo (Lambda caída, evento perdido) se re-envían
+REPORT_JOB_STALE_AFTER = int(os.environ.get("REPORT_JOB_STALE_AFTER", "600"))
+# Lo único que ve el paciente de un job fallido; el detalle queda en el log
+# y en report_jobs.error_message para operaciones
+REPORT_JOB_ERROR = "We could not generate your report. Please try again later."
+
+s3_client = boto3.client(
+    "s3", region_name=AWS_REGION, config=Config(signature_version="s3v4")
+)
+
 
 # ======================================================
 # DB helper
@@ -69,6 +96,177 @@ def get_db_connection():
     )
 
 
+# ======================================================
+# PDF cache helpers
+# ======================================================
+def report_key(result_id, report_version):
+    """Misma key que usa la Lambda PDF para la versión actual del resultado"""
+    version = report_version.strftime("%Y%m%dT%H%M%S%f") if report_version else "0"
+    return f"{REPORTS_PREFIX}/{result_id}/{version}.pdf"
+
+
+class SignedUrlCache:
+    """
+    Signed URLs por reporte, en memoria del proceso (TTL + LRU acotado).
+    La key es la key de S3, que ya identifica (result_id, versión): una
+    versión nueva del resultado nunca reutiliza la URL de la anterior.
+    La pertenencia del resultado se valida antes de consultar el cache.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            url, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return url
+
+    def put(self, key, url):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (url, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+report_url_cache = SignedUrlCache(
+    ttl=min(SIGNED_URL_CACHE_TTL, SIGNED_URL_TTL - SIGNED_URL_MIN_REMAINING),
+    max_entries=SIGNED_URL_CACHE_SIZE,
+)
+
+
+def signed_report_url(key):
+    """Signed URL del reporte, reutilizando una firmada hace poco"""
+    url = report_url_cache.get(key)
+    if url is None:
+        url = s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": S3_BUCKET, "Key": key},
+            ExpiresIn=SIGNED_URL_TTL,
+        )
+        report_url_cache.put(key, url)
+    return url
+
+
+def cached_report_url(result_id, report_version):
+    """
+    Signed URL del PDF ya generado para esta versión del resultado,
+    o None si todavía no existe (hay que generarlo con un job).
+    """
+    if not S3_BUCKET:
+        return None
+
+    key = report_key(result_id, report_version)
+    # Firmada hace poco: el PDF existe, no hace falta head_object ni firmar
+    url = report_url_cache.get(key)
+    if url:
+        return url
+
+    try:
+        s3_client.head_object(Bucket=S3_BUCKET, Key=key)
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code")
+        if code not in ("404", "NoSuchKey", "NotFound"):
+            current_app.logger.warning(f"Report cache lookup failed for {key}: {e}")
+        return None
+
+    return signed_report_url(key)
+
+
+def submit_report(conn, result_id, report_version):
+    """
+    Registra el job del reporte y dispara la Lambda PDF de forma asíncrona
+    (InvocationType=Event): el thread del portal no espera el render.
+    Si ya hay un job en curso para esta versión, se devuelve ese.
+    """
+    cursor = conn.cursor()
+    job, created = submit_report_job(
+        cursor, result_id, report_version, stale_after=REPORT_JOB_STALE_AFTER
+    )
+    # Commit antes de invocar: la Lambda actualiza esta fila
+    conn.commit()
+
+    if created:
+        try:
+            lambda_client.invoke(
+                FunctionName=PDF_LAMBDA_NAME,
+                InvocationType="Event",
+                Payload=json.dumps(
+                    {"job_id": job["job_id"], "result_id": result_id}
+                ).encode("utf-8"),
+            )
+        except Exception as e:
+            current_app.logger.exception(f"Could not start report job {job['job_id']}")
+            fail_report_job(cursor, job["job_id"], str(e))
+            conn.commit()
+            job = {**job, "status": "failed", "error_message": str(e)}
+
+    cursor.close()
+    return job
+
+
+def request_report(result_id, user_email):
+    """
+    Signed URL del PDF si ya existe, o el job que lo está generando.
+    None si el resultado no es del paciente logueado.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT lr.report_version
+            FROM lab_results lr
+            JOIN patients p ON lr.patient_id = p.patient_id
+            WHERE lr.result_id = %s
+              AND p.email = %s
+            """,
+            (result_id, user_email),
+        )
+        row = cursor.fetchone()
+        cursor.close()
+        if not row:
+            return None
+
+        # PDF pre-generado: solo firmar la URL
+        signed_url = cached_report_url(result_id, row[0])
+        if signed_url:
+            return {"status": "completed", "download_url": signed_url}
+
+        if not PDF_LAMBDA_NAME:
+            raise RuntimeError("PDF_LAMBDA_NAME is not configured in the environment.")
+        return job_status(submit_report(conn, result_id, row[0]))
+    finally:
+        conn.close()
+
+
+def job_status(job):
+    """Respuesta JSON del estado de un job"""
+    status = {
+        "job_id": job["job_id"],
+        "result_id": job["result_id"],
+        "status": job["status"],
+        "status_url": url_for("report_job_status", job_id=job["job_id"]),
+    }
+    if job["status"] == "completed":
+        status["download_url"] = url_for("report_job_download", job_id=job["job_id"])
+    elif job["status"] == "failed":
+        status["error"] = REPORT_JOB_ERROR
+    return status
+
+
 # ======================================================
 # AUTH helpers
 # ======================================================
@@ -1303,6 +1501,71 @@ RESULT_DETAIL_TEMPLATE = """
 </html>
 """
 
+# Página de espera mientras la Lambda genera el PDF: consulta el job y
+# redirige a la descarga cuando está listo
+REPORT_PENDING_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Preparing Report - Healthcare Lab Portal</title>
+    <style>
+        body {
+            font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif;
+            background: #0a0a0a;
+            color: #fafafa;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            min-height: 100vh;
+            margin: 0;
+        }
+        .card {
+            background: #141414;
+            border: 1px solid #262626;
+            border-radius: 12px;
+            padding: 2rem 2.5rem;
+            text-align: center;
+            max-width: 420px;
+        }
+        p { color: #a1a1aa; }
+        a { color: #14b8a6; }
+        .error { color: #ef4444; }
+    </style>
+</head>
+<body>
+    <div class="card">
+        <h1>Preparing your report</h1>
+        <p id="message">Your PDF for result #{{ job.result_id }} is being generated. The download will start automatically.</p>
+        <a href="/">← Back to Dashboard</a>
+    </div>
+    <script>
+        const statusUrl = {{ job.status_url | tojson }};
+        const message = document.getElementById("message");
+
+        function poll() {
+            fetch(statusUrl, { credentials: "same-origin" })
+                .then((response) => response.json())
+                .then((job) => {
+                    if (job.status === "completed") {
+                        window.location = job.download_url;
+                    } else if (job.status === "failed") {
+                        message.textContent = "We could not generate your report. Please try again later.";
+                        message.className = "error";
+                    } else {
+                        setTimeout(poll, 2000);
+                    }
+                })
+                .catch(() => setTimeout(poll, 5000));
+        }
+
+        poll();
+    </script>
+</body>
+</html>
+"""
+
 
 # ROUTES
 # ======================================================
@@ -1464,34 +1727,14 @@ def result_detail(result_id):
         if not user_email:
             return redirect(url_for("logout"))
 
+        # Resultado + valores en una sola query (lab_db, compartido con la Lambda PDF)
         conn = get_db_connection()
         cursor = conn.cursor()
+        result = fetch_result(cursor, result_id, email=user_email)
+        cursor.close()
+        conn.close()
 
-        # Datos generales del resultado
-        cursor.execute(
-            """
-            SELECT
-                lr.result_id,
-                p.first_name,
-                p.last_name,
-                p.email,
-                lr.lab_name,
-                lr.test_type,
-                lr.test_date,
-                lr.status,
-                lr.physician_name
-            FROM lab_results lr
-            JOIN patients p ON lr.patient_id = p.patient_id
-            WHERE lr.result_id = %s
-              AND p.email = %s
-        """,
-            (result_id, user_email),
-        )
-        row = cursor.fetchone()
-
-        if not row:
-            cursor.close()
-            conn.close()
+        if not result:
             return (
                 """
                 <h1 style="color: #ef4444;">Access Denied</h1>
@@ -1501,59 +1744,20 @@ def result_detail(result_id):
                 403,
             )
 
-        (
-            _r_id,
-            first_name,
-            last_name,
-            email,
-            lab_name,
-            test_type,
-            test_date,
-            status,
-            physician_name,
-        ) = row
-
-        # Valores individuales de la prueba
-        cursor.execute(
-            """
-            SELECT
-                test_code,
-                test_name,
-                value,
-                unit,
-                reference_range,
-                is_abnormal,
-                severity
-            FROM test_values
-            WHERE result_id = %s
-            ORDER BY test_code
-        """,
-            (result_id,),
-        )
-        rows = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
         lab_data = [
             {
-                "test_code": r[0],
-                "test_name": r[1],
-                "value": float(r[2]) if r[2] is not None else None,
-                "unit": r[3],
-                "reference_range": r[4],
-                "is_abnormal": r[5],
-                "severity": r[6],
+                **value,
+                "value": float(value["value"]) if value["value"] is not None else None,
             }
-            for r in rows
+            for value in result["test_values"]
         ]
 
         return render_template_string(
             RESULT_DETAIL_TEMPLATE,
-            patient_name=f"{first_name} {last_name}",
-            patient_email=email,
-            created_at=test_date.strftime("%B %d, %Y at %H:%M"),
-            status=status,
+            patient_name=f"{result['first_name']} {result['last_name']}",
+            patient_email=result["email"],
+            created_at=result["test_date"].strftime("%B %d, %Y at %H:%M"),
+            status=result["status"],
             lab_data_json=json.dumps(lab_data, indent=2),
         )
     except Exception as e:
@@ -1564,76 +1768,108 @@ def result_detail(result_id):
 @login_required
 def result_download(result_id):
     """
-    Valida que el resultado pertenece al paciente logueado
-    Invoca la Lambda PDF y redirige a la signed URL
+    Valida que el resultado pertenece al paciente logueado y redirige a la
+    signed URL del PDF. Normalmente el PDF ya fue pre-generado al publicarse
+    el resultado; si no, se envía un job y se muestra una página que espera
+    a que termine (el request no queda bloqueado en el render).
     """
     try:
         user_email = get_user_email_from_token()
         if not user_email:
             return redirect(url_for("logout"))
 
-        # Validar que el resultado es del usuario logueado
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT lr.result_id
-            FROM lab_results lr
-            JOIN patients p ON lr.patient_id = p.patient_id
-            WHERE lr.result_id = %s
-              AND p.email = %s
-            """,
-            (result_id, user_email),
-        )
-        row = cursor.fetchone()
-        cursor.close()
-        conn.close()
-
-        if not row:
+        report = request_report(result_id, user_email)
+        if report is None:
             return ("You don't have permission to download this result.", 403)
 
-        if not PDF_LAMBDA_NAME:
-            return (
-                "PDF_LAMBDA_NAME is not configured in the environment.",
-                500,
-            )
+        if report["status"] == "completed":
+            return redirect(report["download_url"])
 
-        # Invocar la Lambda para generar el PDF y obtener la signed URL
-        lambda_payload = {"result_id": result_id}
+        return render_template_string(REPORT_PENDING_TEMPLATE, job=report), 202
 
-        response = lambda_client.invoke(
-            FunctionName=PDF_LAMBDA_NAME,
-            InvocationType="RequestResponse",
-            Payload=json.dumps(lambda_payload).encode("utf-8"),
-        )
+    except Exception:
+        current_app.logger.exception("Error generating/downloading PDF")
+        return (REPORT_JOB_ERROR, 500)
 
-        raw_payload = response["Payload"].read()
-        lambda_result = json.loads(raw_payload or "{}")
 
-        status_code = lambda_result.get("statusCode", 500)
-        if status_code != 200:
-            # Devolvemos el cuerpo de la lambda (error) para debug
-            return (
-                f"Error generating PDF (Lambda status {status_code}): "
-                f"{lambda_result.get('body')}",
-                500,
-            )
+@app.route("/results/<int:result_id>/report", methods=["POST"])
+@login_required
+def result_report_submit(result_id):
+    """
+    API: pide el PDF de un resultado. 200 con download_url si ya existe,
+    202 con el job (status_url para consultar) si se está generando.
+    Pedidos repetidos devuelven el mismo job.
+    """
+    try:
+        user_email = get_user_email_from_token()
+        if not user_email:
+            return jsonify({"error": "Unauthorized"}), 401
 
-        body = json.loads(lambda_result.get("body", "{}"))
-        signed_url = body.get("signed_url")
+        report = request_report(result_id, user_email)
+        if report is None:
+            return jsonify({"error": "Result not found"}), 404
 
-        if not signed_url:
-            return (
-                "PDF service did not return a signed_url.",
-                500,
-            )
+        return jsonify(report), 200 if report["status"] == "completed" else 202
 
-        # Redirigimos al navegador directamente a la signed URL de S3
-        return redirect(signed_url)
+    except Exception:
+        current_app.logger.exception("Error submitting report job")
+        return jsonify({"error": REPORT_JOB_ERROR}), 500
 
-    except Exception as e:
-        current_app.logger.exception("Error generating/downloading PDF")
-        return (f"Unexpected error generating PDF: {str(e)}", 500)
+
+@app.route("/report-jobs/<int:job_id>")
+@login_required
+def report_job_status(job_id):
+    """API: estado de un job (pending, running, completed, failed)"""
+    user_email = get_user_email_from_token()
+    if not user_email:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        job = get_report_job(cursor, job_id, email=user_email)
+        cursor.close()
+    finally:
+        conn.close()
+
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_status(job)), 200
+
+
+@app.route("/report-jobs/<int:job_id>/download")
+@login_required
+def report_job_download(job_id):
+    """
+    Redirige a la signed URL del PDF actual del resultado de un job completado.
+    El s3_key del job puede ser de una versión anterior o de un PDF ya borrado
+    (invalidate_stale_reports): se vuelve a buscar el de la versión actual y,
+    si no está, se envía un job nuevo y se muestra la página de espera.
+    """
+    user_email = get_user_email_from_token()
+    if not user_email:
+        return redirect(url_for("logout"))
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        job = get_report_job(cursor, job_id, email=user_email)
+        cursor.close()
+    finally:
+        conn.close()
+
+    if not job:
+        return ("You don't have permission to download this report.", 403)
+    if job["status"] != "completed":
+        return (f"Report is not ready yet (status: {job['status']}).", 409)
+
+    report = request_report(job["result_id"], user_email)
+    if report is None:
+        return ("You don't have permission to download this report.", 403)
+    if report["status"] == "completed":
+        return redirect(report["download_url"])
+
+    return render_template_string(REPORT_PENDING_TEMPLATE, job=report), 202
 
 
 # ======================================================
@@ -0,0 +1,240 @@
+"""
+Critical-value and delta-check rules evaluated while a result is stored.
+
+Rules are keyed by test_code and compiled once into a dict of tuples, so
+evaluating a result is a dict lookup and a few float comparisons per test:
+
+  - critical: value at or beyond critical_low / critical_high
+  - delta:    change against the patient's previous value of the same test
+              (absolute and/or percent) within delta_window_days
+
+The previous values come from a per-patient LRU cache. On a miss the worker
+loads the latest value of every test for that patient with one query; after
+the transaction commits, the stored values replace the cached ones. Entries
+expire cache_ttl seconds after they were loaded: other worker tasks and
+corrections in the database are picked up on the next load.
+
+ALERT_RULES_JSON can override or add rules without a new image:
+  {"K": {"critical_high": 6.5}, "LACT": {"critical_high": 4.0, "unit": "mmol/L"}}
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AlertRule(NamedTuple):
+    critical_low: Optional[float] = None
+    critical_high: Optional[float] = None
+    delta_abs: Optional[float] = None
+    delta_pct: Optional[float] = None
+    delta_window_days: float = 30
+    # Rule only applies to values in this unit (None = any)
+    unit: Optional[str] = None
+
+
+# Critical limits in the canonical unit of units.py (typical adult values)
+DEFAULT_RULES: Dict[str, AlertRule] = {
+    "K": AlertRule(2.8, 6.2, delta_abs=1.0, unit="mmol/L"),
+    "NA": AlertRule(120, 160, delta_abs=10, unit="mmol/L"),
+    "GLU": AlertRule(40, 450, unit="mg/dL"),
+    "CREAT": AlertRule(critical_high=5.0, delta_pct=50, unit="mg/dL"),
+    "BUN": AlertRule(critical_high=100, unit="mg/dL"),
+    "HGB": AlertRule(7.0, 20.0, delta_abs=2.0, delta_window_days=7, unit="g/dL"),
+    "HCT": AlertRule(20, 60, unit="%"),
+    "WBC": AlertRule(2.0, 30.0, unit="10^3/uL"),
+    "PLT": AlertRule(20, 1000, delta_pct=50, delta_window_days=7, unit="10^3/uL"),
+    "TSH": AlertRule(critical_high=50, unit="uIU/mL"),
+}
+
+# Previous values of one patient: {test_code: (value, test_date)}
+LastValues = Dict[str, Tuple[float, datetime]]
+
+
+def compile_rules(overrides: Optional[str] = None) -> Dict[str, AlertRule]:
+    """DEFAULT_RULES plus the JSON overrides, keyed by upper-case test_code"""
+    rules = {code.upper(): rule for code, rule in DEFAULT_RULES.items()}
+    if overrides:
+        for code, fields in json.loads(overrides).items():
+            base = rules.get(code.upper(), AlertRule())
+            rules[code.upper()] = base._replace(**fields)
+    return rules
+
+
+def to_naive_utc(value: Any) -> Optional[datetime]:
+    """ISO string or datetime -> naive UTC datetime (None if unparseable)"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def comparable_value(test: Dict[str, Any]) -> Tuple[Optional[float], str]:
+    """Canonical value and unit when units.py could convert it, else as reported"""
+    if test.get("canonical_value") is not None:
+        return float(test["canonical_value"]), str(test.get("canonical_unit") or "")
+    try:
+        return float(test["value"]), str(test.get("unit") or "")
+    except (KeyError, TypeError, ValueError):
+        return None, ""
+
+
+class AlertEngine:
+    """Evaluates critical and delta rules with a bounded last-value cache"""
+
+    def __init__(
+        self,
+        rules: Dict[str, AlertRule],
+        cache_size: int = 10000,
+        cache_ttl: float = 300,
+    ):
+        self.rules = rules
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        # patient_id -> (loaded_at, values); loaded_at is time.monotonic()
+        self._last: "OrderedDict[str, Tuple[float, LastValues]]" = OrderedDict()
+
+    def _cached(self, patient_id: str) -> Optional[LastValues]:
+        """Cached values, or None if missing or loaded over cache_ttl ago"""
+        entry = self._last.get(patient_id)
+        if entry is None:
+            return None
+        loaded_at, values = entry
+        if time.monotonic() - loaded_at >= self.cache_ttl:
+            del self._last[patient_id]
+            return None
+        return values
+
+    def last_values(
+        self, patient_id: str, loader: Callable[[str], LastValues]
+    ) -> LastValues:
+        """Previous value per test_code for a patient (cache, then loader)"""
+        cached = self._cached(patient_id)
+        if cached is not None:
+            self._last.move_to_end(patient_id)
+            return cached
+        cached = loader(patient_id)
+        self._store(patient_id, cached)
+        return cached
+
+    def _store(self, patient_id: str, values: LastValues) -> None:
+        self._last[patient_id] = (time.monotonic(), values)
+        self._last.move_to_end(patient_id)
+        while len(self._last) > self.cache_size:
+            self._last.popitem(last=False)
+
+    def evaluate(
+        self, data: Dict[str, Any], loader: Callable[[str], LastValues]
+    ) -> List[Dict[str, Any]]:
+        """
+        Flags the tests of one lab result in place (alert_flag, and
+        severity="critical" for critical values) and returns the alerts.
+        The previous values are only loaded if some test has a delta rule.
+        """
+        alerts: List[Dict[str, Any]] = []
+        test_date = to_naive_utc(data.get("test_date"))
+        previous: Optional[LastValues] = None
+
+        for test in data["results"]:
+            rule = self.rules.get(str(test.get("test_code", "")).upper())
+            if rule is None:
+                continue
+            value, unit = comparable_value(test)
+            if value is None:
+                continue
+            if rule.unit and unit.lower() != rule.unit.lower():
+                continue
+
+            alert = None
+            if rule.critical_low is not None and value <= rule.critical_low:
+                alert = {"type": "critical_low", "limit": rule.critical_low}
+            elif rule.critical_high is not None and value >= rule.critical_high:
+                alert = {"type": "critical_high", "limit": rule.critical_high}
+            elif rule.delta_abs is not None or rule.delta_pct is not None:
+                if previous is None:
+                    try:
+                        previous = self.last_values(data["patient_id"], loader)
+                    except Exception as e:
+                        # Without history only the critical limits are checked
+                        logger.error(f"Could not load previous values: {e}")
+                        previous = {}
+                alert = self.delta_alert(
+                    rule, value, test_date, previous.get(test["test_code"])
+                )
+
+            if alert is None:
+                continue
+            if alert["type"].startswith("critical"):
+                test["severity"] = "critical"
+                test["is_abnormal"] = True
+            test["alert_flag"] = True
+            alerts.append({"test_code": test["test_code"], "value": value, **alert})
+
+        return alerts
+
+    @staticmethod
+    def delta_alert(
+        rule: AlertRule,
+        value: float,
+        test_date: Optional[datetime],
+        previous: Optional[Tuple[float, datetime]],
+    ) -> Optional[Dict[str, Any]]:
+        if previous is None:
+            return None
+        previous_value, previous_date = previous
+        if test_date is not None and previous_date is not None:
+            age_days = (test_date - previous_date).total_seconds() / 86400
+            # Older results (or backfills) are not a delta reference
+            if age_days < 0 or age_days > rule.delta_window_days:
+                return None
+
+        change = value - previous_value
+        if rule.delta_abs is not None and abs(change) >= rule.delta_abs:
+            return {"type": "delta", "previous": previous_value, "change": change}
+        if rule.delta_pct is not None and previous_value:
+            pct = abs(change) / abs(previous_value) * 100
+            if pct >= rule.delta_pct:
+                return {"type": "delta", "previous": previous_value, "change": change}
+        return None
+
+    def remember(self, data: Dict[str, Any]) -> None:
+        """After commit: the stored values become the patient's last values"""
+        patient_id = data["patient_id"]
+        # Updated in place: loaded_at stays, so the entry still expires
+        cached = self._cached(patient_id)
+        if cached is None:
+            # Not cached: the next result loads them from the database
+            return
+        test_date = to_naive_utc(data.get("test_date"))
+        for test in data["results"]:
+            code = test.get("test_code")
+            rule = self.rules.get(str(code).upper())
+            if rule is None or (rule.delta_abs is None and rule.delta_pct is None):
+                continue
+            value, unit = comparable_value(test)
+            if value is None:
+                continue
+            # Same unit filter as evaluate(): never a reference in another unit
+            if rule.unit and unit.lower() != rule.unit.lower():
+                continue
+            current = cached.get(code)
+            # A backfilled (older) result does not replace a newer value
+            if (
+                current is None
+                or test_date is None
+                or current[1] is None
+                or test_date >= current[1]
+            ):
+                cached[code] = (value, test_date)
+        self._last.move_to_end(patient_id)
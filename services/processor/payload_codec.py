@@ -0,0 +1,51 @@
+"""
+Decoding of raw lab payloads stored in S3.
+
+Lambda Ingest may store payloads as plain JSON, gzip or zstd
+(PAYLOAD_COMPRESSION). The encoding is recorded in the object's
+Content-Encoding; when it is missing (older objects, copies made without
+metadata) the format is detected from the magic bytes.
+"""
+
+import gzip
+import json
+from typing import Dict, Optional
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def detect_encoding(
+    raw: bytes, content_encoding: Optional[str] = None
+) -> Optional[str]:
+    """Return 'gzip', 'zstd' or None for plain JSON"""
+    if content_encoding:
+        encoding = content_encoding.strip().lower()
+        if encoding in ("gzip", "zstd"):
+            return encoding
+    if raw.startswith(GZIP_MAGIC):
+        return "gzip"
+    if raw.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def decompress(raw: bytes, content_encoding: Optional[str] = None) -> bytes:
+    """Return the uncompressed bytes of a stored payload"""
+    encoding = detect_encoding(raw, content_encoding)
+
+    if encoding == "gzip":
+        return gzip.decompress(raw)
+
+    if encoding == "zstd":
+        import zstandard
+
+        # Frames written by ZstdCompressor.compress() carry the content size
+        return zstandard.ZstdDecompressor().decompress(raw)
+
+    return raw
+
+
+def decode_payload(raw: bytes, content_encoding: Optional[str] = None) -> Dict:
+    """Decompress (if needed) and parse a stored JSON payload"""
+    return json.loads(decompress(raw, content_encoding))
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Replay raw lab payloads from S3 into the processing queue.
+
+Lists the raw objects written by Lambda Ingest for a date range, reads each
+payload (plain, gzip or zstd) and sends the same SQS message Ingest would
+have sent, so the worker processes them again.
+
+Ingest writes keys as <prefix>/<shard>/YYYY/MM/DD/<result_id>.json, so a day
+is listed with one request per shard (run concurrently). The legacy unsharded
+layout <prefix>/YYYY/MM/DD/ is listed as well.
+
+Usage:
+  python replay.py --bucket BUCKET --queue-url URL --from-date 2024-01-15
+  python replay.py --bucket BUCKET --queue-url URL --from-date 2024-01-15 \\
+      --to-date 2024-01-20 --prefix incoming/json --shards 16 --dry-run
+"""
+
+import argparse
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List
+
+import boto3
+
+from payload_codec import decode_payload
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)],
+)
+logger = logging.getLogger("replay")
+
+SQS_BATCH_SIZE = 10
+LIST_WORKERS = 16
+
+
+def iter_dates(start: date, end: date) -> Iterator[date]:
+    """Yield every day between start and end (inclusive)"""
+    current = start
+    while current <= end:
+        yield current
+        current += timedelta(days=1)
+
+
+def day_prefixes(prefix: str, day: date, shards: int) -> List[str]:
+    """Every prefix that may hold payloads for one day (sharded + legacy)"""
+    base = prefix.rstrip("/")
+    day_path = day.strftime("%Y/%m/%d")
+    prefixes = [f"{base}/{shard:02x}/{day_path}/" for shard in range(shards)]
+    prefixes.append(f"{base}/{day_path}/")
+    return prefixes
+
+
+def list_prefix(s3, bucket: str, prefix: str) -> List[str]:
+    """List every key under a prefix"""
+    keys = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+def list_day_keys(
+    s3, bucket: str, prefix: str, day: date, shards: int
+) -> Iterator[str]:
+    """List raw payload keys for one day, in time order (ULID keys sort by time)"""
+    with ThreadPoolExecutor(max_workers=LIST_WORKERS) as pool:
+        listings = pool.map(
+            lambda p: list_prefix(s3, bucket, p), day_prefixes(prefix, day, shards)
+        )
+        keys = [key for listing in listings for key in listing]
+    yield from sorted(keys, key=lambda k: k.rsplit("/", 1)[-1])
+
+
+def build_message(bucket: str, key: str, data: Dict) -> Dict:
+    """Same message shape Lambda Ingest sends to SQS"""
+    return {
+        "result_id": data.get("result_id"),
+        "s3_bucket": bucket,
+        "s3_key": key,
+        "patient_id": data.get("patient_id"),
+        "test_type": data.get("test_type"),
+        "lab_id": data.get("lab_id"),
+        "lab_name": data.get("lab_name"),
+        "source_format": data.get("source_format"),
+        "payload_schema_version": data.get("payload_schema_version"),
+        "timestamp": datetime.utcnow().isoformat(),
+        "environment": data.get("environment"),
+        "replayed": True,
+    }
+
+
+def send_batch(sqs, queue_url: str, messages: List[Dict]) -> int:
+    """Send up to 10 messages with a single SendMessageBatch call"""
+    if not messages:
+        return 0
+    response = sqs.send_message_batch(
+        QueueUrl=queue_url,
+        Entries=[
+            {"Id": str(idx), "MessageBody": json.dumps(message)}
+            for idx, message in enumerate(messages)
+        ],
+    )
+    for failure in response.get("Failed", []):
+        logger.error(f"Failed to enqueue message {failure['Id']}: {failure}")
+    return len(response.get("Successful", []))
+
+
+def replay(args) -> int:
+    s3 = boto3.client("s3")
+    sqs = boto3.client("sqs")
+
+    start = datetime.strptime(args.from_date, "%Y-%m-%d").date()
+    end = datetime.strptime(args.to_date or args.from_date, "%Y-%m-%d").date()
+
+    pending: List[Dict] = []
+    found = sent = 0
+
+    for day in iter_dates(start, end):
+        for key in list_day_keys(s3, args.bucket, args.prefix, day, args.shards):
+            found += 1
+            response = s3.get_object(Bucket=args.bucket, Key=key)
+            data = decode_payload(
+                response["Body"].read(), response.get("ContentEncoding")
+            )
+            message = build_message(args.bucket, key, data)
+
+            if args.dry_run:
+                logger.info(f"[dry-run] would replay {key}")
+                continue
+
+            pending.append(message)
+            if len(pending) == SQS_BATCH_SIZE:
+                sent += send_batch(sqs, args.queue_url, pending)
+                pending = []
+
+    sent += send_batch(sqs, args.queue_url, pending)
+    logger.info(f"Found {found} payloads, replayed {sent}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay raw lab payloads to SQS")
+    parser.add_argument("--bucket", required=True, help="Data bucket name")
+    parser.add_argument("--queue-url", required=True, help="Processing queue URL")
+    parser.add_argument("--from-date", required=True, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--to-date", help="Last day (YYYY-MM-DD, default from-date)")
+    parser.add_argument(
+        "--prefix", default="incoming/json", help="Raw payload prefix in S3"
+    )
+    parser.add_argument(
+        "--shards", type=int, default=16, help="S3_KEY_SHARDS used by Ingest"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="List payloads without sending"
+    )
+    return replay(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Unit normalization of test values to one canonical unit per test_code.
+
+Labs report the same analyte in different units (glucose in mg/dL or
+mmol/L, creatinine in mg/dL or umol/L...). The worker stores the value as
+reported and, next to it, the value in the canonical unit, so trend and
+cohort queries can compare test_values.canonical_value directly.
+
+The conversion table is built once at import: (test_code, unit key) ->
+(canonical unit, factor), canonical value = value * factor. Unit strings are
+reduced to a key (case, spaces, "µ"/"mc" spellings) before the lookup.
+Tests whose code or unit is not in the table get no canonical value.
+"""
+
+import logging
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# test_code -> (canonical unit, {other unit: factor to canonical})
+UNIT_DEFINITIONS: Dict[str, Tuple[str, Dict[str, float]]] = {
+    # Chemistry (mmol/L -> mg/dL uses the analyte's molar mass)
+    "GLU": ("mg/dL", {"mmol/L": 18.016, "g/L": 100}),
+    "BUN": ("mg/dL", {"mmol/L": 2.801}),
+    "CREAT": ("mg/dL", {"umol/L": 1 / 88.42, "mmol/L": 1000 / 88.42}),
+    "CHOL": ("mg/dL", {"mmol/L": 38.67}),
+    "HDL": ("mg/dL", {"mmol/L": 38.67}),
+    "LDL": ("mg/dL", {"mmol/L": 38.67}),
+    "TRIG": ("mg/dL", {"mmol/L": 88.57}),
+    "CA": ("mg/dL", {"mmol/L": 4.008}),
+    "NA": ("mmol/L", {"mEq/L": 1}),
+    "K": ("mmol/L", {"mEq/L": 1}),
+    # Hematology
+    "HGB": ("g/dL", {"g/L": 0.1, "mmol/L": 1.611}),
+    "HCT": ("%", {"L/L": 100}),
+    "WBC": ("10^3/uL", {"10^9/L": 1, "K/uL": 1, "/uL": 0.001}),
+    "PLT": ("10^3/uL", {"10^9/L": 1, "K/uL": 1, "/uL": 0.001}),
+    "RBC": ("10^6/uL", {"10^12/L": 1, "M/uL": 1}),
+    # Thyroid
+    "TSH": ("uIU/mL", {"mIU/L": 1, "mU/L": 1}),
+    "T4": ("ug/dL", {"nmol/L": 1 / 12.87}),
+    "T3": ("ng/dL", {"nmol/L": 65.1, "ng/mL": 100}),
+}
+
+
+def unit_key(unit: Optional[str]) -> str:
+    """Comparable form of a unit string ("µmol/L" == "umol/l" == "mcmol/L")"""
+    key = (unit or "").strip().lower().replace(" ", "")
+    for micro in ("µ", "μ", "mc"):
+        key = key.replace(micro, "u")
+    return key.replace("x10", "10").replace("10e", "10^").replace("*", "")
+
+
+def build_conversion_table(
+    definitions: Dict[str, Tuple[str, Dict[str, float]]] = UNIT_DEFINITIONS,
+) -> Dict[Tuple[str, str], Tuple[str, float]]:
+    """(TEST_CODE, unit key) -> (canonical unit, factor)"""
+    table: Dict[Tuple[str, str], Tuple[str, float]] = {}
+    for code, (canonical, others) in definitions.items():
+        table[(code.upper(), unit_key(canonical))] = (canonical, 1.0)
+        for unit, factor in others.items():
+            table[(code.upper(), unit_key(unit))] = (canonical, factor)
+    return table
+
+
+CONVERSIONS = build_conversion_table()
+
+
+@lru_cache(maxsize=1024)
+def lookup(test_code: str, unit: str) -> Optional[Tuple[str, float]]:
+    return CONVERSIONS.get((test_code.upper(), unit_key(unit)))
+
+
+def canonical_value(
+    test_code: Any, value: Any, unit: Any
+) -> Optional[Tuple[float, str]]:
+    """(value, unit) in the canonical unit of test_code, or None if unknown"""
+    conversion = lookup(str(test_code or ""), str(unit or ""))
+    if conversion is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    canonical, factor = conversion
+    return round(number * factor, 4), canonical
+
+
+def normalize_results(tests: Iterable[Dict[str, Any]]) -> int:
+    """
+    Adds canonical_value / canonical_unit to each test that can be
+    converted; returns how many tests could not be.
+    """
+    unknown = 0
+    for test in tests:
+        converted = canonical_value(
+            test.get("test_code"), test.get("value"), test.get("unit")
+        )
+        if converted is None:
+            unknown += 1
+            logger.debug(
+                f"No canonical unit for {test.get('test_code')} in {test.get('unit')}"
+            )
+            continue
+        test["canonical_value"], test["canonical_unit"] = converted
+    return unknown
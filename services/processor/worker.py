@@ -18,6 +18,10 @@ import psycopg2
 from psycopg2.extras import RealDictCursor  # noqa: F401  # si no lo usas todavía
 from botocore.exceptions import ClientError
 
+from alert_rules import AlertEngine, compile_rules
+from payload_codec import decode_payload
+from units import normalize_results
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -66,6 +70,14 @@ class LabResultsProcessor:
         self.s3 = boto3.client("s3")
         self.sns = boto3.client("sns") if self.sns_topic_arn else None
 
+        # Critical-value / delta rules with a per-patient last-value cache
+        self.alert_engine = AlertEngine(
+            compile_rules(os.environ.get("ALERT_RULES_JSON")),
+            cache_size=int(os.environ.get("ALERT_CACHE_PATIENTS", 10000)),
+            # Seconds before a patient's last values are reloaded from the DB
+            cache_ttl=float(os.environ.get("ALERT_CACHE_TTL", 300)),
+        )
+
         # Database connection
         self.db_conn = None
         self.connect_database()
@@ -126,7 +138,7 @@ class LabResultsProcessor:
             return []
 
     def download_from_s3(self, s3_key: str) -> Optional[Dict]:
-        """Download JSON file from S3"""
+        """Download JSON file from S3 (plain, gzip or zstd)"""
         try:
             logger.info(f"Downloading from S3: s3://{self.s3_bucket}/{s3_key}")
 
@@ -135,8 +147,10 @@ class LabResultsProcessor:
                 Key=s3_key,
             )
 
-            content = response["Body"].read().decode("utf-8")
-            data = json.loads(content)
+            # Payloads may be stored gzip/zstd compressed (Content-Encoding)
+            data = decode_payload(
+                response["Body"].read(), response.get("ContentEncoding")
+            )
 
             logger.info("Successfully downloaded and parsed S3 object")
             return data
@@ -147,6 +161,9 @@ class LabResultsProcessor:
         except json.JSONDecodeError as e:
             logger.error(f"Error parsing JSON from S3: {e}")
             return None
+        except (OSError, ImportError, ValueError) as e:
+            logger.error(f"Error decompressing payload from S3: {e}")
+            return None
 
     def validate_lab_result(self, data: Dict) -> bool:
         """Validate lab result data structure"""
@@ -183,6 +200,47 @@ class LabResultsProcessor:
 
         return True
 
+    def fetch_last_values(self, patient_id: str) -> Dict:
+        """
+        Latest stored value of each test for a patient (delta checks).
+        Only canonical values: a legacy or unconvertible value is in whatever
+        unit the lab reported and can't be compared with the rule's unit.
+        """
+        try:
+            with self.db_conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT DISTINCT ON (tv.test_code)
+                        tv.test_code,
+                        tv.canonical_value,
+                        lr.test_date
+                    FROM lab_results lr
+                    JOIN test_values tv ON tv.result_id = lr.result_id
+                    WHERE lr.patient_id = %s
+                      AND tv.canonical_value IS NOT NULL
+                    ORDER BY tv.test_code, lr.test_date DESC
+                    """,
+                    (patient_id,),
+                )
+                return {
+                    code: (float(value), test_date)
+                    for code, value, test_date in cursor.fetchall()
+                }
+        except Exception:
+            self.db_conn.rollback()
+            raise
+
+    def evaluate_alerts(self, data: Dict) -> List[Dict]:
+        """Flags critical values and deltas in data; returns the alerts"""
+        self.ensure_database_connection()
+        alerts = self.alert_engine.evaluate(data, self.fetch_last_values)
+        for alert in alerts:
+            logger.warning(
+                f"ALERT {alert['type']} for patient {data['patient_id']}: "
+                f"{alert['test_code']}={alert['value']}"
+            )
+        return alerts
+
     def store_lab_result(self, data: Dict, s3_key: str) -> Optional[int]:
         """Store lab result in PostgreSQL database"""
         try:
@@ -222,8 +280,9 @@ class LabResultsProcessor:
                         """
                         INSERT INTO test_values (
                             result_id, test_code, test_name, value, unit,
-                            reference_range, is_abnormal
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                            reference_range, is_abnormal, severity, alert_flag,
+                            canonical_value, canonical_unit
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                         """,
                         (
                             result_id,
@@ -233,6 +292,13 @@ class LabResultsProcessor:
                             test["unit"],
                             test["reference_range"],
                             test.get("is_abnormal", False),
+                            # Flag del lab o rango de referencia (IngestWriter);
+                            # "critical" y alert_flag vienen de alert_rules
+                            test.get("severity"),
+                            test.get("alert_flag", False),
+                            # Valor en la unidad canónica del test_code (units.py)
+                            test.get("canonical_value"),
+                            test.get("canonical_unit"),
                         ),
                     )
 
@@ -294,8 +360,10 @@ class LabResultsProcessor:
             logger.error(f"Error moving file in S3: {e}")
             return None
 
-    def publish_notification(self, result_id: int, patient_id: str):
-        """Publish notification to SNS topic"""
+    def publish_notification(
+        self, result_id: int, patient_id: str, alerts: Optional[List[Dict]] = None
+    ):
+        """Publish notification to SNS topic (critical results carry their alerts)"""
         if not self.sns or not self.sns_topic_arn:
             logger.warning("SNS not configured, skipping notification")
             return
@@ -307,17 +375,24 @@ class LabResultsProcessor:
                 "timestamp": datetime.utcnow().isoformat(),
                 "event_type": "lab_result_ready",
             }
+            attributes = {
+                "event_type": {
+                    "DataType": "String",
+                    "StringValue": "result_completed",
+                },
+                "priority": {"DataType": "String", "StringValue": "routine"},
+            }
+            subject = "Lab Result Ready for Patient"
+            if alerts:
+                message.update(event_type="critical_result", alerts=alerts)
+                attributes["priority"]["StringValue"] = "critical"
+                subject = "CRITICAL Lab Result for Patient"
 
             self.sns.publish(
                 TopicArn=self.sns_topic_arn,
-                Message=json.dumps(message),
-                Subject="Lab Result Ready for Patient",
-                MessageAttributes={
-                    "event_type": {
-                        "DataType": "String",
-                        "StringValue": "result_completed",
-                    }
-                },
+                Message=json.dumps(message, default=str),
+                Subject=subject,
+                MessageAttributes=attributes,
             )
 
             logger.info(f"Published notification for result {result_id}")
@@ -357,11 +432,27 @@ class LabResultsProcessor:
                 logger.error("Lab result validation failed")
                 return False
 
+            # Canonical unit per test_code (original value is kept)
+            unknown_units = normalize_results(data["results"])
+            if unknown_units:
+                logger.info(f"{unknown_units} test values without a canonical unit")
+
+            # Critical values and delta checks (sets alert_flag / severity)
+            alerts = self.evaluate_alerts(data)
+
             # Store in database
             result_id = self.store_lab_result(data, s3_key)
             if not result_id:
                 logger.error("Failed to store lab result in database")
                 return False
+            self.alert_engine.remember(data)
+
+            # Fast path: flagged results are announced before the S3 move.
+            # The s3_processed_key write below doesn't change report_version
+            # (lab_results trigger), so a PDF pre-generated from this event
+            # keeps the key the portal will ask for
+            if alerts:
+                self.publish_notification(result_id, patient_id, alerts)
 
             # Move file to processed/
             processed_key = self.move_to_processed(s3_key)
@@ -382,7 +473,8 @@ class LabResultsProcessor:
                     logger.error(f"Failed to update processed key: {e}")
 
             # Publish notification
-            self.publish_notification(result_id, patient_id)
+            if not alerts:
+                self.publish_notification(result_id, patient_id)
 
             # Delete message from queue
             self.delete_message(message["ReceiptHandle"])
@@ -6,14 +6,10 @@ Tests the complete flow: API Gateway → Lambda → S3 → SQS → ECS Worker 
 
 import json
 import sys
-import requests
 import argparse
 from datetime import datetime, timedelta
 import random
 
-# DEBUG: para confirmar que el script se está ejecutando
-print("✅ send_test_message.py: script started")
-
 # Test data
 PATIENT_IDS = ["P234567","P123456","P345678"]
 
@@ -114,6 +110,9 @@ def generate_lab_result():
 
 def send_to_api(api_url, api_key, data):
     """Send lab result to API"""
+    # Importado aquí: tests/performance/corpus.py reutiliza los templates sin requests
+    import requests
+
     headers = {
         "Content-Type": "application/json",
         "x-api-key": api_key,
@@ -186,4 +185,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # DEBUG: para confirmar que el script se está ejecutando
+    print("✅ send_test_message.py: script started")
     main()
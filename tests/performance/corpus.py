@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Synthetic HL7 / CSV / XML corpus for the adapter parsers
+
+Builds lab results from the panel templates used by
+tests/integration/worker/send_test_message.py (same tests, units, reference
+ranges, labs and physicians) and writes them in the three file formats the
+adapters accept:
+  - hl7: FHS/BHS batch of ORU^R01 messages (one message per result, units
+         with "^" escaped as \\S\\)
+  - csv: one row per test, grouped by PatientID / TestDate / OrderID
+  - xml: <LabResults> export with one <LabResult> per result
+
+The corpus is deterministic for a given --seed. Size is controlled by the
+number of patients and results per patient, or by a target file size.
+
+Usage:
+  python tests/performance/corpus.py --out /tmp/corpus --patients 1000
+  python tests/performance/corpus.py --out /tmp/corpus --size-mb 50 --formats hl7
+  python tests/performance/corpus.py --out /tmp/corpus --panels lipid_panel --results-per-patient 4
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape, quoteattr
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(REPO_ROOT, "tests", "integration", "worker"))
+
+from send_test_message import (  # noqa: E402
+    LAB_SYSTEMS,
+    PHYSICIANS,
+    TEST_TEMPLATES,
+    generate_result,
+)
+
+FORMATS = ("hl7", "csv", "xml")
+EXTENSIONS = {"hl7": ".hl7", "csv": ".csv", "xml": ".xml"}
+
+FIRST_NAMES = ["John", "Maria", "Wei", "Aisha", "Carlos", "Emma", "Ravi", "Sofia"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Khan", "Lopez", "Brown", "Patel", "Rossi"]
+
+CSV_HEADER = (
+    "PatientID,LabID,TestDate,TestCode,TestName,Value,Unit,RefRange,OrderID,Flag"
+)
+
+BASE_DATE = datetime(2024, 1, 15, 8, 0, 0)
+
+
+def flag_for(template, result):
+    """H / L according to the template range (the templates only say abnormal)"""
+    if not result["is_abnormal"]:
+        return "N"
+    low, high = template["range"]
+    if result["value"] > high:
+        return "H"
+    if result["value"] < low:
+        return "L"
+    return "A"
+
+
+def iter_lab_results(patients=None, results_per_patient=1, panels=None, seed=42):
+    """
+    Canonical lab results, patient by patient. patients=None never stops
+    (the writers cut at a target size).
+    """
+    rng = random.Random(seed)
+    # generate_result() uses the module-level random; seed it for repeatability
+    random.seed(seed)
+    panels = panels or sorted(TEST_TEMPLATES)
+    counter = itertools.count() if patients is None else range(patients)
+
+    for idx in counter:
+        patient_id = f"P{idx:06d}"
+        name = (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+        for seq in range(results_per_patient):
+            panel = panels[(idx + seq) % len(panels)]
+            lab = rng.choice(LAB_SYSTEMS)
+            templates = TEST_TEMPLATES[panel]
+            results = []
+            for template in templates:
+                result = generate_result(template)
+                result["flag"] = flag_for(template, result)
+                results.append(result)
+            yield {
+                "patient_id": patient_id,
+                "patient_name": name,
+                "lab_id": lab["lab_id"],
+                "lab_name": lab["lab_name"],
+                "physician": rng.choice(PHYSICIANS),
+                "test_type": panel,
+                "test_date": BASE_DATE + timedelta(days=seq, minutes=idx % 600),
+                "order_id": f"ORD{idx:06d}{seq:02d}",
+                "results": results,
+            }
+
+
+# --------------------------------------------------
+# FORMATTERS
+# --------------------------------------------------
+def hl7_escape(value):
+    return (
+        str(value)
+        .replace("\\", "\\E\\")
+        .replace("|", "\\F\\")
+        .replace("^", "\\S\\")
+        .replace("&", "\\T\\")
+        .replace("~", "\\R\\")
+    )
+
+
+def to_hl7(lab_result, control_id):
+    first, last = lab_result["patient_name"]
+    stamp = lab_result["test_date"].strftime("%Y%m%d%H%M%S")
+    panel = lab_result["test_type"]
+    segments = [
+        f"MSH|^~\\&|SYNTH|{lab_result['lab_id']}|PORTAL|SYSTEM|{stamp}||ORU^R01|"
+        f"{control_id}|P|2.5",
+        f"PID|1||{lab_result['patient_id']}^^^MRN||{last}^{first}||19800101|U",
+        f"OBR|1||{lab_result['order_id']}|{panel}^{panel.replace('_', ' ').title()}",
+    ]
+    for idx, r in enumerate(lab_result["results"], start=1):
+        segments.append(
+            f"OBX|{idx}|NM|{r['test_code']}^{hl7_escape(r['test_name'])}||"
+            f"{r['value']}|{hl7_escape(r['unit'])}|{hl7_escape(r['reference_range'])}|"
+            f"{r['flag']}|||F"
+        )
+    return "\r".join(segments) + "\r"
+
+
+def to_csv_rows(lab_result):
+    date = lab_result["test_date"].strftime("%Y-%m-%d")
+    for r in lab_result["results"]:
+        yield ",".join(
+            [
+                lab_result["patient_id"],
+                lab_result["lab_id"],
+                date,
+                r["test_code"],
+                r["test_name"].replace(",", " "),
+                str(r["value"]),
+                r["unit"],
+                r["reference_range"],
+                lab_result["order_id"],
+                r["flag"],
+            ]
+        )
+
+
+def to_xml(lab_result):
+    first, last = lab_result["patient_name"]
+    panel = lab_result["test_type"]
+    components = "".join(
+        f"<Component code={quoteattr(r['test_code'])} name={quoteattr(r['test_name'])} "
+        f"value={quoteattr(str(r['value']))} unit={quoteattr(r['unit'])} "
+        f"refRange={quoteattr(r['reference_range'])} flag={quoteattr(r['flag'])}/>"
+        for r in lab_result["results"]
+    )
+    return (
+        f"  <LabResult><LabID>{escape(lab_result['lab_id'])}</LabID>"
+        f"<Patient ID={quoteattr(lab_result['patient_id'])}>"
+        f"<Name>{escape(f'{first} {last}')}</Name></Patient>"
+        f"<Tests><Test code={quoteattr(panel)} name={quoteattr(panel)} "
+        f"date=\"{lab_result['test_date'].isoformat()}Z\">{components}</Test></Tests>"
+        f"</LabResult>\n"
+    )
+
+
+# --------------------------------------------------
+# WRITERS
+# --------------------------------------------------
+def write_file(path, fmt, lab_results, max_bytes=None):
+    """
+    Writes lab_results in `fmt` to path, stopping at max_bytes if given.
+    Returns how many lab results (adapter outputs) the file holds.
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if fmt == "hl7":
+            f.write("FHS|^~\\&|SYNTH|CORPUS\rBHS|^~\\&|SYNTH|CORPUS\r")
+        elif fmt == "csv":
+            f.write(CSV_HEADER + "\n")
+        else:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<LabResults>\n')
+
+        for lab_result in lab_results:
+            if max_bytes is not None and f.tell() >= max_bytes:
+                break
+            if fmt == "hl7":
+                f.write(to_hl7(lab_result, f"SYN{count:08d}"))
+            elif fmt == "csv":
+                f.write("\n".join(to_csv_rows(lab_result)) + "\n")
+            else:
+                f.write(to_xml(lab_result))
+            count += 1
+
+        if fmt == "hl7":
+            f.write(f"BTS|{count}\rFTS|1\r")
+        elif fmt == "xml":
+            f.write("</LabResults>\n")
+    return count
+
+
+def write_corpus(
+    out_dir,
+    formats=FORMATS,
+    patients=1000,
+    results_per_patient=1,
+    panels=None,
+    size_mb=None,
+    seed=42,
+):
+    """One file per format; returns {fmt: (path, results)}"""
+    os.makedirs(out_dir, exist_ok=True)
+    max_bytes = int(size_mb * 1024 * 1024) if size_mb else None
+    corpus = {}
+    for fmt in formats:
+        path = os.path.join(out_dir, f"corpus{EXTENSIONS[fmt]}")
+        lab_results = iter_lab_results(
+            None if max_bytes else patients, results_per_patient, panels, seed
+        )
+        corpus[fmt] = (path, write_file(path, fmt, lab_results, max_bytes))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic adapter corpus")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--formats", nargs="*", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--results-per-patient", type=int, default=1)
+    parser.add_argument(
+        "--panels",
+        nargs="*",
+        choices=sorted(TEST_TEMPLATES),
+        help="Panels to cycle through (default: all)",
+    )
+    parser.add_argument(
+        "--size-mb", type=float, help="Target size per file (overrides --patients)"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    corpus = write_corpus(
+        args.out,
+        args.formats,
+        args.patients,
+        args.results_per_patient,
+        args.panels,
+        args.size_mb,
+        args.seed,
+    )
+    for fmt, (path, results) in corpus.items():
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"{fmt:<4} {results:>8} results {size_mb:>8.1f} MB  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Cold-start harness for the Lambda functions under modules/lambda/functions/
+
+For each function it spawns a fresh interpreter (so nothing is cached between
+runs) and measures:
+  - import_ms: time to import lambda_function (module init phase)
+  - first_invoke_ms: first call to lambda_handler (lazy clients, lazy imports)
+  - warm_invoke_ms: second call to lambda_handler (warm container)
+
+AWS calls never leave the process: real boto3 clients are built (their
+construction cost is part of the cold start) but their API calls return canned
+responses. DB access is answered by an in-memory fake connection.
+
+Install the function's requirements.txt before measuring it; a function whose
+dependencies are missing is reported as an error and the others still run.
+
+Usage:
+  python tests/performance/lambda_cold_start.py --runs 5
+  python tests/performance/lambda_cold_start.py --output cold_start.json
+  python tests/performance/lambda_cold_start.py --baseline cold_start.json --tolerance 0.25
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+FUNCTIONS_DIR = os.path.join(REPO_ROOT, "modules", "lambda", "functions")
+# Layer lab_ingest (Ingest + adapters); in Lambda it is mounted at /opt/python
+LAB_INGEST_LAYER_DIR = os.path.join(
+    REPO_ROOT, "modules", "lambda", "layers", "lab_ingest", "python"
+)
+# Layer lab_db (PDF Generator + Notify), also mounted at /opt/python
+LAB_DB_LAYER_DIR = os.path.join(
+    REPO_ROOT, "modules", "lambda", "layers", "lab_db", "python"
+)
+
+SAMPLE_HL7 = "\n".join(
+    [
+        r"MSH|^~\&|LABCORP|LAB002|PORTAL|SYSTEM|20240115103000||ORU^R01|MSG001|P|2.5",
+        "PID|1||P234567||Smith^John^A||19850315|M",
+        "OBR|1||20240115-001|CBC^Complete Blood Count",
+        "OBX|1|NM|WBC^White Blood Cell Count||7.5|10^3/uL|4.5-11.0|N|||F",
+        "OBX|2|NM|HGB^Hemoglobin||12.1|g/dL|13.0-17.0|L|||F",
+    ]
+)
+
+SAMPLE_CSV = "\n".join(
+    [
+        "PatientID,LabID,TestDate,TestCode,TestName,Value,Unit,RefRange",
+        "P123456,SMALL001,2024-01-15,GLU,Glucose,95,mg/dL,70-100",
+        "P123456,SMALL001,2024-01-15,BUN,Blood Urea Nitrogen,15,mg/dL,7-20",
+    ]
+)
+
+SAMPLE_XML = """<LabResult>
+  <LabID>HOSP001</LabID>
+  <Patient ID="P345678"><Name>Maria Garcia</Name></Patient>
+  <Tests>
+    <Test code="CBC" name="Complete Blood Count" date="2024-01-15T10:30:00Z">
+      <Component code="WBC" name="White Blood Cell Count" value="7.5"
+                 unit="10^3/uL" refRange="4.5-11.0" flag="N"/>
+    </Test>
+  </Tests>
+</LabResult>"""
+
+SAMPLE_INGEST_BODY = {
+    "patient_id": "P123456",
+    "lab_id": "LAB001",
+    "lab_name": "Quest Diagnostics",
+    "test_type": "complete_blood_count",
+    "test_date": "2024-01-15T10:00:00Z",
+    "results": [
+        {
+            "test_code": "WBC",
+            "test_name": "White Blood Cell Count",
+            "value": 7.5,
+            "unit": "10^3/uL",
+            "reference_range": "4.5-11.0",
+        }
+    ],
+}
+
+
+def s3_event(key):
+    return {
+        "Records": [
+            {"s3": {"bucket": {"name": "bench-bucket"}, "object": {"key": key}}}
+        ]
+    }
+
+
+COMMON_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "bench",
+    "AWS_SECRET_ACCESS_KEY": "bench",
+    "LOG_LEVEL": "WARNING",
+    "S3_BUCKET": "bench-bucket",
+    "SQS_QUEUE_URL": "https://sqs/bench",
+}
+
+# name -> env vars, event and the S3 object the event points to (if any)
+FUNCTIONS = {
+    "ingest": {
+        "env": {},
+        "event": {"body": json.dumps(SAMPLE_INGEST_BODY)},
+    },
+    "hl7_adapter": {
+        "env": {},
+        "event": s3_event("uploads/hl7/sample.hl7"),
+        "s3_body": SAMPLE_HL7,
+    },
+    "csv_adapter": {
+        "env": {},
+        "event": s3_event("uploads/csv/sample.csv"),
+        "s3_body": SAMPLE_CSV,
+    },
+    "xml_adapter": {
+        "env": {},
+        "event": s3_event("uploads/xml/sample.xml"),
+        "s3_body": SAMPLE_XML,
+    },
+    "pdf_generator": {
+        "env": {"DB_SECRET_ARN": "arn:bench"},
+        "event": {"result_id": 1},
+    },
+    "notify": {
+        "env": {"DB_SECRET_ARN": "arn:bench"},
+        "event": {"result_id": "1", "patient_id": "P123456"},
+    },
+}
+
+# Rows returned by the fake DB, matched by a substring of the query
+FAKE_ROWS = {
+    "pdf_generator": [
+        ("SELECT report_version FROM lab_results", [(datetime(2024, 1, 15, 10, 5),)]),
+        (
+            "FROM lab_results lr",
+            [
+                {
+                    "result_id": 1,
+                    "patient_id": "P123456",
+                    "first_name": "John",
+                    "last_name": "Smith",
+                    "email": "john@example.com",
+                    "date_of_birth": date(1985, 3, 15),
+                    "lab_name": "Quest Diagnostics",
+                    "test_type": "complete_blood_count",
+                    "test_date": datetime(2024, 1, 15, 10, 0),
+                    "status": "completed",
+                    "physician_name": "Dr. Sarah Johnson",
+                    "physician_npi": "1234567890",
+                    "notes": "Fasting sample",
+                    "created_at": datetime(2024, 1, 15, 10, 5),
+                    "updated_at": datetime(2024, 1, 15, 10, 5),
+                    "report_version": datetime(2024, 1, 15, 10, 5),
+                    # json_agg of test_values, as returned by lab_db.results
+                    "test_values": json.dumps(
+                        [
+                            {
+                                "test_code": "WBC",
+                                "test_name": "White Blood Cell Count",
+                                "value": 7.5,
+                                "unit": "10^3/uL",
+                                "reference_range": "4.5-11.0",
+                                "is_abnormal": False,
+                                "severity": "normal",
+                            }
+                        ]
+                    ),
+                }
+            ],
+        ),
+    ],
+    "notify": [
+        ("FROM patients", [("P123456", "John", "Smith", "john@example.com")]),
+        (
+            "FROM lab_results",
+            [(1, "complete_blood_count", datetime(2024, 1, 15), "Quest")],
+        ),
+    ],
+}
+
+
+# --------------------------------------------------
+# PROBE (runs inside the child interpreter)
+# --------------------------------------------------
+class FakeCursor:
+    def __init__(self, rows_by_query):
+        self.rows_by_query = rows_by_query
+        self.rows = []
+
+    description = None
+
+    def execute(self, query, params=None):
+        self.rows = []
+        for fragment, rows in self.rows_by_query:
+            if fragment in query:
+                self.rows = rows
+                break
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    closed = 0
+
+    def __init__(self, rows_by_query):
+        self.rows_by_query = rows_by_query
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self.rows_by_query)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def canned_response(service, operation, params, spec):
+    if service == "s3" and operation == "GetObject":
+        return {"Body": io.BytesIO(spec.get("s3_body", "").encode("utf-8"))}
+    if service == "sqs" and operation == "SendMessage":
+        return {"MessageId": "bench-message"}
+    if service == "sqs" and operation == "SendMessageBatch":
+        entries = params.get("Entries", [])
+        return {
+            "Successful": [{"Id": e["Id"], "MessageId": "bench"} for e in entries],
+            "Failed": [],
+        }
+    if service == "secretsmanager":
+        secret = {
+            "host": "localhost",
+            "port": 5432,
+            "dbname": "bench",
+            "username": "bench",
+            "password": "bench",
+        }
+        return {"SecretString": json.dumps(secret)}
+    if service == "ses":
+        return {"MessageId": "bench-email"}
+    return {}
+
+
+def probe(name):
+    spec = FUNCTIONS[name]
+    os.environ.update(COMMON_ENV)
+    os.environ.update(spec["env"])
+    sys.path.insert(0, LAB_INGEST_LAYER_DIR)
+    sys.path.insert(0, LAB_DB_LAYER_DIR)
+    sys.path.insert(0, os.path.join(FUNCTIONS_DIR, name))
+
+    # boto3 is imported by every function, so its load counts as import time
+    started = time.perf_counter()
+    import boto3
+
+    real_client = boto3.client
+
+    def client(service, *args, **kwargs):
+        instance = real_client(service, *args, **kwargs)
+        instance._make_api_call = lambda op, params: canned_response(
+            service, op, params, spec
+        )
+        return instance
+
+    boto3.client = client
+
+    import lambda_function  # noqa: E402
+
+    import_ms = (time.perf_counter() - started) * 1000
+
+    if name in FAKE_ROWS:
+        rows = FAKE_ROWS[name]
+        # Real secret cache and ConnectionManager; only psycopg2.connect is faked
+        lambda_function.get_db()._connect = lambda creds: FakeConnection(rows)
+
+    timings = []
+    status = None
+    for _ in range(2):
+        started = time.perf_counter()
+        response = lambda_function.lambda_handler(spec["event"], None)
+        timings.append((time.perf_counter() - started) * 1000)
+        status = response.get("statusCode") if isinstance(response, dict) else None
+
+    print(
+        json.dumps(
+            {
+                "import_ms": import_ms,
+                "first_invoke_ms": timings[0],
+                "warm_invoke_ms": timings[1],
+                "status_code": status,
+            }
+        )
+    )
+
+
+# --------------------------------------------------
+# DRIVER
+# --------------------------------------------------
+def run_once(name):
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--probe", name],
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT,
+    )
+    if proc.returncode != 0:
+        last_line = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+        return {"error": last_line}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure(name, runs):
+    samples = [run_once(name) for _ in range(runs)]
+    errors = [s["error"] for s in samples if "error" in s]
+    if errors:
+        return {"error": errors[0]}
+
+    summary = {"status_code": samples[-1]["status_code"]}
+    for metric in ("import_ms", "first_invoke_ms", "warm_invoke_ms"):
+        summary[metric] = round(statistics.median(s[metric] for s in samples), 2)
+    summary["cold_total_ms"] = round(
+        summary["import_ms"] + summary["first_invoke_ms"], 2
+    )
+    return summary
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or "error" in current or "error" in previous:
+            continue
+        limit = previous["cold_total_ms"] * (1 + tolerance)
+        if current["cold_total_ms"] > limit:
+            regressions.append(
+                f"{name}: cold_total_ms {current['cold_total_ms']} > "
+                f"{limit:.2f} (baseline {previous['cold_total_ms']})"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lambda cold-start harness")
+    parser.add_argument("--probe", help=argparse.SUPPRESS)
+    parser.add_argument("--runs", type=int, default=5, help="Runs per function")
+    parser.add_argument(
+        "--function",
+        action="append",
+        choices=sorted(FUNCTIONS),
+        help="Function to measure (repeatable, default: all)",
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed cold_total_ms increase vs baseline (0.25 = 25%%)",
+    )
+    args = parser.parse_args()
+
+    if args.probe:
+        probe(args.probe)
+        return 0
+
+    names = args.function or list(FUNCTIONS)
+    results = {name: measure(name, args.runs) for name in names}
+
+    print(
+        f"{'function':<15} {'import_ms':>10} {'first_ms':>10} "
+        f"{'warm_ms':>10} {'cold_total':>11}  status"
+    )
+    for name, r in results.items():
+        if "error" in r:
+            print(f"{name:<15} ERROR: {r['error']}")
+            continue
+        print(
+            f"{name:<15} {r['import_ms']:>10.2f} {r['first_invoke_ms']:>10.2f} "
+            f"{r['warm_invoke_ms']:>10.2f} {r['cold_total_ms']:>11.2f}  "
+            f"{r['status_code']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nCold-start regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo cold-start regressions against baseline")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
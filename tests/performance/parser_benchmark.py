@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Parser benchmark and regression check for the HL7 / CSV / XML adapters
+
+Generates a synthetic corpus (tests/performance/corpus.py) and, for each
+format, measures in a fresh interpreter:
+  - file:   iter_<fmt>_results() over the whole corpus file (the path an S3
+            upload takes), results/sec and peak RSS
+  - single: parse_<fmt>_to_json() on one-result documents (direct
+            invocations), results/sec
+
+Only parsing and normalization are timed; nothing is sent to AWS. The probe
+checks that the parser returns as many results as the corpus holds, so a
+parser that silently drops results cannot look faster.
+
+With --baseline the run fails (exit 1) when results/sec drops or peak RSS
+grows by more than --tolerance against the saved results.
+
+Usage:
+  python tests/performance/parser_benchmark.py --patients 5000
+  python tests/performance/parser_benchmark.py --output parsers.json
+  python tests/performance/parser_benchmark.py --baseline parsers.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from corpus import (
+    CSV_HEADER,
+    FORMATS,
+    iter_lab_results,
+    to_csv_rows,
+    to_hl7,
+    to_xml,
+    write_corpus,
+)
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+FUNCTIONS_DIR = os.path.join(REPO_ROOT, "modules", "lambda", "functions")
+LAB_INGEST_LAYER_DIR = os.path.join(
+    REPO_ROOT, "modules", "lambda", "layers", "lab_ingest", "python"
+)
+
+SINGLE_DOCS = 200
+
+
+def single_documents(fmt, count):
+    """`count` one-result documents in `fmt`"""
+    docs = []
+    for idx, lab_result in enumerate(iter_lab_results(count)):
+        if fmt == "hl7":
+            docs.append(to_hl7(lab_result, f"SYN{idx:08d}"))
+        elif fmt == "csv":
+            docs.append(CSV_HEADER + "\n" + "\n".join(to_csv_rows(lab_result)) + "\n")
+        else:
+            docs.append(to_xml(lab_result).strip())
+    return docs
+
+
+def probe(fmt, path, expected, repeat):
+    """Runs in the child interpreter: prints one JSON line with the timings"""
+    import resource
+
+    sys.path.insert(0, LAB_INGEST_LAYER_DIR)
+    sys.path.insert(0, os.path.join(FUNCTIONS_DIR, f"{fmt}_adapter"))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import lambda_function  # noqa: E402
+
+    iter_results = getattr(lambda_function, f"iter_{fmt}_results")
+    parse_single = getattr(lambda_function, f"parse_{fmt}_to_json")
+
+    best_file = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        # Same input type the adapter runtime hands each parser
+        if fmt == "xml":
+            f = open(path, "rb")
+        else:
+            f = open(path, encoding="utf-8", newline="")
+        with f:
+            count = sum(1 for _ in iter_results(f))
+        elapsed = time.perf_counter() - started
+        if count != expected:
+            raise SystemExit(f"{fmt}: parsed {count} results, corpus has {expected}")
+        best_file = elapsed if best_file is None else min(best_file, elapsed)
+
+    docs = single_documents(fmt, SINGLE_DOCS)
+    best_single = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for doc in docs:
+            parse_single(doc)
+        elapsed = time.perf_counter() - started
+        best_single = elapsed if best_single is None else min(best_single, elapsed)
+
+    print(
+        json.dumps(
+            {
+                "results": expected,
+                "file_results_per_sec": round(expected / best_file, 1),
+                "single_results_per_sec": round(len(docs) / best_single, 1),
+                # Linux reports ru_maxrss in KB
+                "peak_rss_mb": round(
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+                ),
+            }
+        )
+    )
+
+
+def run_format(fmt, path, expected, repeat):
+    proc = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--probe",
+            fmt,
+            path,
+            str(expected),
+            "--repeat",
+            str(repeat),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": (proc.stderr or proc.stdout).strip().splitlines()[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """Lower throughput or higher peak memory than the baseline allows"""
+    regressions = []
+    for fmt, current in results.items():
+        previous = baseline.get(fmt)
+        if not previous or "error" in current or "error" in previous:
+            continue
+        for metric in ("file_results_per_sec", "single_results_per_sec"):
+            floor = previous[metric] * (1 - tolerance)
+            if current[metric] < floor:
+                regressions.append(
+                    f"{fmt}: {metric} {current[metric]} < {floor:.1f} "
+                    f"(baseline {previous[metric]})"
+                )
+        ceiling = previous["peak_rss_mb"] * (1 + tolerance)
+        if current["peak_rss_mb"] > ceiling:
+            regressions.append(
+                f"{fmt}: peak_rss_mb {current['peak_rss_mb']} > {ceiling:.1f} "
+                f"(baseline {previous['peak_rss_mb']})"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adapter parser benchmark")
+    parser.add_argument("--probe", nargs=3, help=argparse.SUPPRESS)
+    parser.add_argument("--formats", nargs="*", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--results-per-patient", type=int, default=1)
+    parser.add_argument("--size-mb", type=float, help="Corpus size per format")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed throughput drop / memory growth vs baseline (0.2 = 20%%)",
+    )
+    args = parser.parse_args()
+
+    if args.probe:
+        fmt, path, expected = args.probe
+        probe(fmt, path, int(expected), args.repeat)
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = write_corpus(
+            tmp,
+            args.formats,
+            args.patients,
+            args.results_per_patient,
+            size_mb=args.size_mb,
+        )
+        results = {}
+        for fmt, (path, expected) in corpus.items():
+            row = run_format(fmt, path, expected, args.repeat)
+            row["file_mb"] = round(os.path.getsize(path) / (1024 * 1024), 2)
+            results[fmt] = row
+
+    print(
+        f"{'format':<7} {'results':>8} {'file_mb':>8} {'file_res/s':>11} "
+        f"{'single_res/s':>13} {'peak_rss_mb':>12}"
+    )
+    for fmt, r in results.items():
+        if "error" in r:
+            print(f"{fmt:<7} ERROR: {r['error']}")
+            continue
+        print(
+            f"{fmt:<7} {r['results']:>8} {r['file_mb']:>8.2f} "
+            f"{r['file_results_per_sec']:>11.1f} {r['single_results_per_sec']:>13.1f} "
+            f"{r['peak_rss_mb']:>12.1f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+
+    if any("error" in r for r in results.values()):
+        return 1
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nParser regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo parser regressions against baseline")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
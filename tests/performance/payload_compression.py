@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Size / CPU report for raw payload compression (PAYLOAD_COMPRESSION in Ingest)
+
+Compares, for each sample payload:
+  - pretty:   json.dumps(indent=2), the previous storage format
+  - compact:  compact JSON, what Ingest stores with PAYLOAD_COMPRESSION=none
+  - gzip-N:   compact JSON + gzip at level N
+  - zstd-N:   compact JSON + zstd at level N (only if zstandard is installed)
+
+Samples are the test_message_*.json files at the repo root plus synthetic
+panels with many results, to show how the ratio grows with payload size.
+
+Usage:
+  python tests/performance/payload_compression.py
+  python tests/performance/payload_compression.py --repeat 200 --panel-sizes 10 100 1000
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import random
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional for this report
+    zstandard = None
+
+
+def synthetic_panel(size):
+    """Lab result with `size` values, shaped like Ingest's stored payload"""
+    rng = random.Random(size)
+    return {
+        "patient_id": "P123456",
+        "lab_id": "LAB001",
+        "lab_name": "Quest Diagnostics",
+        "test_type": "complete_metabolic_panel",
+        "test_date": "2024-01-15T10:00:00Z",
+        "physician": {"name": "Dr. Sarah Johnson", "npi": "1234567890"},
+        "results": [
+            {
+                "test_code": f"T{idx:04d}",
+                "test_name": f"Analyte {idx}",
+                "value": round(rng.uniform(1, 300), 1),
+                "unit": rng.choice(["mg/dL", "mmol/L", "g/dL", "10^3/uL"]),
+                "reference_range": "70-100",
+                "is_abnormal": rng.random() < 0.2,
+            }
+            for idx in range(size)
+        ],
+        "notes": "Synthetic panel for compression report",
+        "ingested_at": "2024-01-15T10:00:01",
+        "result_id": "LAB001-P123456-20240115100001000000",
+        "environment": "dev",
+        "source_format": "JSON",
+        "payload_schema_version": "1.0",
+    }
+
+
+def load_samples(panel_sizes):
+    samples = []
+    for path in sorted(glob.glob(os.path.join(REPO_ROOT, "test_message_*.json"))):
+        with open(path) as f:
+            samples.append((os.path.basename(path), json.load(f)))
+    for size in panel_sizes:
+        samples.append((f"panel_{size}_results", synthetic_panel(size)))
+    return samples
+
+
+def codecs():
+    entries = [
+        ("pretty", lambda d: json.dumps(d, indent=2).encode(), None),
+        ("compact", lambda d: json.dumps(d, separators=(",", ":")).encode(), None),
+    ]
+    for level in (1, 6, 9):
+        entries.append(
+            (
+                f"gzip-{level}",
+                lambda d, lv=level: gzip.compress(
+                    json.dumps(d, separators=(",", ":")).encode(), compresslevel=lv
+                ),
+                gzip.decompress,
+            )
+        )
+    if zstandard is not None:
+        for level in (3, 10):
+            compressor = zstandard.ZstdCompressor(level=level)
+            entries.append(
+                (
+                    f"zstd-{level}",
+                    lambda d, c=compressor: c.compress(
+                        json.dumps(d, separators=(",", ":")).encode()
+                    ),
+                    zstandard.ZstdDecompressor().decompress,
+                )
+            )
+    return entries
+
+
+def timed(func, arg, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        out = func(arg)
+    return out, (time.perf_counter() - started) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payload compression report")
+    parser.add_argument("--repeat", type=int, default=100, help="Iterations per codec")
+    parser.add_argument(
+        "--panel-sizes",
+        type=int,
+        nargs="*",
+        default=[50, 500, 5000],
+        help="Synthetic panel sizes (number of results)",
+    )
+    args = parser.parse_args()
+
+    if zstandard is None:
+        print("zstandard not installed: zstd rows skipped\n")
+
+    header = f"{'sample':<24} {'codec':<8} {'bytes':>10} {'vs pretty':>10} {'enc_ms':>9} {'dec_ms':>9}"
+    print(header)
+    print("-" * len(header))
+
+    for name, payload in load_samples(args.panel_sizes):
+        pretty_size = None
+        for codec_name, encode, decode in codecs():
+            body, enc_ms = timed(encode, payload, args.repeat)
+            dec_ms = timed(decode, body, args.repeat)[1] if decode else 0.0
+            pretty_size = pretty_size or len(body)
+            ratio = len(body) / pretty_size
+            print(
+                f"{name:<24} {codec_name:<8} {len(body):>10} {ratio:>9.1%} "
+                f"{enc_ms:>9.3f} {dec_ms:>9.3f}"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Render and memory benchmark for the PDF Generator Lambda (generate_pdf)
+
+Renders synthetic lab results (5 to 500 test values, with and without
+notes) and reports, per case:
+  - ms_per_report / p95_ms: wall time of generate_pdf()
+  - pages: pages of the generated PDF
+  - alloc_kb_per_report: peak Python memory allocated during one render
+    (tracemalloc), i.e. the transient allocations a render needs
+  - peak_rss_mb: peak resident memory of the process (imports + renders),
+    the number the Lambda memory setting has to cover
+  - pdf_kb: size of the generated PDF
+
+Each case runs in a fresh interpreter so peak RSS belongs to that case only.
+
+A second table helps pick the Lambda memory setting:
+  - suggested_mb: peak RSS plus headroom (--headroom, default 50%), rounded
+    up to a multiple of 128 MB
+  - batch_mb: the same for batch mode, where --workers renders overlap in
+    one container (peak RSS + one extra render allocation per worker)
+  - est_ms@<MB>: expected render time at that memory size. Lambda allocates
+    CPU in proportion to memory (one full vCPU at 1769 MB), so below that a
+    single-threaded render slows down by 1769 / MB. The estimate assumes this
+    machine's core is comparable to a Lambda vCPU. Below 1769 MB the cost of
+    a render (MB x ms) stays about the same, so extra memory buys latency.
+
+With --cold-template the report template (styles and static flowables) is
+discarded before every render, reproducing the cost of building it on each
+invocation.
+
+Nothing touches AWS or the database. reportlab must be installed
+(modules/lambda/functions/pdf_generator/requirements.txt).
+
+Usage:
+  python tests/performance/pdf_render.py
+  python tests/performance/pdf_render.py --values 5 50 500 --renders 10
+  python tests/performance/pdf_render.py --cold-template
+  python tests/performance/pdf_render.py --output pdf_render.json
+  python tests/performance/pdf_render.py --baseline pdf_render.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+FUNCTION_DIR = os.path.join(
+    REPO_ROOT, "modules", "lambda", "functions", "pdf_generator"
+)
+# Layer lab_db (PDF Generator + Notify), also mounted at /opt/python
+LAB_DB_LAYER_DIR = os.path.join(
+    REPO_ROOT, "modules", "lambda", "layers", "lab_db", "python"
+)
+
+# Lambda gives a function one full vCPU at this memory size
+FULL_VCPU_MB = 1769
+# Memory sizes shown in the est_ms columns (1024 is the current setting)
+ESTIMATE_MB = (512, 1024, FULL_VCPU_MB)
+
+# (test_code, test_name, unit, low, high)
+ANALYTES = [
+    ("WBC", "White Blood Cell Count", "10^3/uL", 4.5, 11.0),
+    ("RBC", "Red Blood Cell Count", "10^6/uL", 4.2, 5.9),
+    ("HGB", "Hemoglobin", "g/dL", 13.5, 17.5),
+    ("HCT", "Hematocrit", "%", 41.0, 53.0),
+    ("PLT", "Platelet Count", "10^3/uL", 150.0, 400.0),
+    ("GLU", "Glucose", "mg/dL", 70.0, 99.0),
+    ("BUN", "Blood Urea Nitrogen", "mg/dL", 7.0, 20.0),
+    ("CREAT", "Creatinine", "mg/dL", 0.6, 1.2),
+    ("NA", "Sodium", "mmol/L", 136.0, 145.0),
+    ("K", "Potassium", "mmol/L", 3.5, 5.1),
+    ("CHOL", "Total Cholesterol", "mg/dL", 0.0, 200.0),
+    ("TSH", "Thyroid Stimulating Hormone", "uIU/mL", 0.4, 4.0),
+]
+
+NOTES = (
+    "Fasting sample collected in the morning. Hemolysis index within limits. "
+    "Results reviewed by the laboratory director. " * 3
+)
+
+
+def synthetic_result(values, notes=False, seed=0):
+    """Result dict shaped like get_result_data() output"""
+    rng = random.Random(seed)
+    test_values = []
+    for i in range(values):
+        code, name, unit, low, high = ANALYTES[i % len(ANALYTES)]
+        value = round(rng.uniform(low * 0.7, high * 1.3), 2)
+        test_values.append(
+            {
+                "test_code": f"{code}{i // len(ANALYTES) or ''}",
+                "test_name": name,
+                "value": value,
+                "unit": unit,
+                "reference_range": f"{low}-{high}",
+                "is_abnormal": not low <= value <= high,
+                "severity": "normal",
+            }
+        )
+    test_date = datetime(2024, 1, 15, 10, 0) - timedelta(days=seed)
+    return {
+        "result_id": 1000 + seed,
+        "patient_id": "P123456",
+        "first_name": "John",
+        "last_name": "Smith",
+        "date_of_birth": datetime(1985, 3, 15),
+        "lab_name": "Quest Diagnostics",
+        "test_type": "comprehensive_panel",
+        "test_date": test_date,
+        "physician_name": "Dr. Sarah Johnson",
+        "physician_npi": "1234567890",
+        "notes": NOTES if notes else None,
+        "created_at": test_date,
+        "updated_at": test_date,
+        "report_version": test_date,
+        "test_values": test_values,
+    }
+
+
+def load_generator():
+    os.environ.setdefault("S3_BUCKET", "bench")
+    os.environ.setdefault("DB_SECRET_ARN", "arn:bench")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    sys.path.insert(0, LAB_DB_LAYER_DIR)
+    sys.path.insert(0, FUNCTION_DIR)
+    import lambda_function
+
+    return lambda_function
+
+
+def reset_template():
+    """Drop the cached report template, if this version of the code has one"""
+    try:
+        import report_template
+    except ImportError:
+        return
+    report_template.reset_template()
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process (ru_maxrss: KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024
+
+
+def count_pages(pdf_bytes):
+    return pdf_bytes.count(b"/Type /Page\n")
+
+
+def measure(generate_pdf, data, renders, cold_template):
+    generate_pdf(data)  # warm-up: imports, font metrics, template
+
+    timings = []
+    for _ in range(renders):
+        if cold_template:
+            reset_template()
+        started = time.perf_counter()
+        generate_pdf(data)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    # Before tracemalloc, whose bookkeeping would inflate RSS
+    rss = peak_rss_mb()
+
+    if cold_template:
+        reset_template()
+    tracemalloc.start()
+    baseline_size, _ = tracemalloc.get_traced_memory()
+    pdf = generate_pdf(data).getvalue()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "ms_per_report": round(statistics.mean(timings), 2),
+        "p95_ms": round(sorted(timings)[math.ceil(len(timings) * 0.95) - 1], 2),
+        "pages": count_pages(pdf),
+        "alloc_kb_per_report": round((peak - baseline_size) / 1024, 1),
+        "peak_rss_mb": round(rss, 1),
+        "pdf_kb": round(len(pdf) / 1024, 1),
+    }
+
+
+def probe(spec):
+    """Child interpreter: measure one case and print it as JSON"""
+    case = json.loads(spec)
+    generate_pdf = load_generator().generate_pdf
+    data = synthetic_result(case["values"], case["notes"])
+    result = measure(generate_pdf, data, case["renders"], case["cold_template"])
+    print(json.dumps(result))
+
+
+def run_case(values, notes, renders, cold_template):
+    spec = json.dumps(
+        {
+            "values": values,
+            "notes": notes,
+            "renders": renders,
+            "cold_template": cold_template,
+        }
+    )
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--probe", spec],
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT,
+    )
+    if proc.returncode != 0:
+        last_line = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+        raise SystemExit(f"Probe failed for {values} values: {last_line}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def round_up(mb, step=128):
+    return max(step, int(math.ceil(mb / step)) * step)
+
+
+def memory_plan(result, headroom, workers):
+    """Lambda memory suggestion and estimated render time per memory size"""
+    alloc_mb = result["alloc_kb_per_report"] / 1024
+    plan = {
+        "suggested_mb": round_up(result["peak_rss_mb"] * (1 + headroom)),
+        "batch_mb": round_up(
+            (result["peak_rss_mb"] + (workers - 1) * alloc_mb) * (1 + headroom)
+        ),
+    }
+    for mb in ESTIMATE_MB:
+        slowdown = max(1.0, FULL_VCPU_MB / mb)
+        plan[f"est_ms@{mb}"] = round(result["ms_per_report"] * slowdown, 1)
+    return plan
+
+
+def compare(results, baseline, tolerance):
+    """Slower renders or more memory than the baseline allows"""
+    regressions = []
+    for case, result in results.items():
+        previous = baseline.get(case)
+        if not previous:
+            continue
+        for metric in ("ms_per_report", "alloc_kb_per_report", "peak_rss_mb"):
+            if metric not in previous:
+                continue
+            if result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{case}: {metric} {result[metric]} (baseline {previous[metric]})"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--probe", help=argparse.SUPPRESS)
+    parser.add_argument("--values", type=int, nargs="*", default=[5, 25, 100, 250, 500])
+    parser.add_argument("--renders", type=int, default=20)
+    parser.add_argument("--cold-template", action="store_true")
+    parser.add_argument(
+        "--headroom",
+        type=float,
+        default=0.5,
+        help="Extra memory over peak RSS in suggested_mb (0.5 = 50%%)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("BATCH_WORKERS", "8")),
+        help="Parallel renders assumed for batch_mb (BATCH_WORKERS)",
+    )
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown / memory growth vs baseline (0.25 = 25%%)",
+    )
+    args = parser.parse_args()
+
+    if args.probe:
+        probe(args.probe)
+        return
+
+    results = {}
+    print(
+        f"{'case':<20}{'ms/report':>10}{'p95 ms':>10}{'pages':>7}"
+        f"{'alloc KB':>10}{'RSS MB':>8}{'PDF KB':>8}"
+    )
+    for values in args.values:
+        for notes in (False, True):
+            case = f"{values}_values{'_notes' if notes else ''}"
+            result = run_case(values, notes, args.renders, args.cold_template)
+            result.update(memory_plan(result, args.headroom, args.workers))
+            results[case] = result
+            print(
+                f"{case:<20}{result['ms_per_report']:>10}{result['p95_ms']:>10}"
+                f"{result['pages']:>7}{result['alloc_kb_per_report']:>10}"
+                f"{result['peak_rss_mb']:>8}{result['pdf_kb']:>8}"
+            )
+
+    estimates = [f"est_ms@{mb}" for mb in ESTIMATE_MB]
+    print(
+        f"\nLambda memory (headroom {args.headroom:.0%}, batch with "
+        f"{args.workers} workers)"
+    )
+    print(
+        f"{'case':<20}{'suggested MB':>14}{'batch MB':>10}"
+        + "".join(f"{name:>14}" for name in estimates)
+    )
+    for case, result in results.items():
+        print(
+            f"{case:<20}{result['suggested_mb']:>14}{result['batch_mb']:>10}"
+            + "".join(f"{result[name]:>14}" for name in estimates)
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo render regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
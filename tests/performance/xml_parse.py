@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Parse time / peak RSS benchmark for the XML adapter on large hospital exports
+
+Generates an export with N <LabResult> elements wrapped in <LabResults> and
+normalizes every result with:
+  - fromstring: the previous approach, whole document read and parsed with
+    ET.fromstring, then each <LabResult> normalized
+  - iterparse:  iter_xml_results(), streaming from the file
+
+Each mode runs in a fresh interpreter so peak RSS (ru_maxrss) belongs to that
+mode alone. Nothing is sent to AWS; only parsing and normalization are timed.
+
+Usage:
+  python tests/performance/xml_parse.py
+  python tests/performance/xml_parse.py --results 10000 50000 --components 8
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+XML_ADAPTER_DIR = os.path.join(
+    REPO_ROOT, "modules", "lambda", "functions", "xml_adapter"
+)
+LAB_INGEST_LAYER_DIR = os.path.join(
+    REPO_ROOT, "modules", "lambda", "layers", "lab_ingest", "python"
+)
+
+MODES = ("fromstring", "iterparse")
+
+
+def write_export(path, results, components):
+    """Hospital export with `results` <LabResult> elements"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<LabResults>\n')
+        for idx in range(results):
+            f.write(
+                f"  <LabResult>\n"
+                f"    <LabID>HOSP001</LabID>\n"
+                f'    <Patient ID="P{idx:06d}"><Name>Patient {idx}</Name></Patient>\n'
+                f"    <Tests>\n"
+                f'      <Test code="CBC" name="Complete Blood Count" '
+                f'date="2024-01-15T10:30:00Z">\n'
+            )
+            for comp in range(components):
+                f.write(
+                    f'        <Component code="C{comp}" name="Analyte {comp}" '
+                    f'value="{comp + 0.5}" unit="mg/dL" refRange="1-10" flag="N"/>\n'
+                )
+            f.write("      </Test>\n    </Tests>\n  </LabResult>\n")
+        f.write("</LabResults>\n")
+
+
+def probe(mode, path):
+    """Runs in the child interpreter: parse `path` and print one JSON line"""
+    import resource
+    import xml.etree.ElementTree as ET
+
+    sys.path.insert(0, LAB_INGEST_LAYER_DIR)
+    sys.path.insert(0, XML_ADAPTER_DIR)
+    import lambda_function  # noqa: E402
+
+    started = time.perf_counter()
+    count = 0
+    if mode == "fromstring":
+        with open(path, encoding="utf-8") as f:
+            root = ET.fromstring(f.read())
+        for elem in root.iter("LabResult"):
+            lambda_function.normalize_lab_result(elem)
+            count += 1
+    else:
+        with open(path, "rb") as f:
+            for _ in lambda_function.iter_xml_results(f):
+                count += 1
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "results": count,
+                "parse_ms": round(elapsed_ms, 1),
+                # Linux reports ru_maxrss in KB
+                "peak_rss_mb": round(
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+                ),
+            }
+        )
+    )
+
+
+def run_mode(mode, path):
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--probe", mode, path],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="XML adapter parse benchmark")
+    parser.add_argument(
+        "--results",
+        type=int,
+        nargs="*",
+        default=[10000],
+        help="<LabResult> elements per export",
+    )
+    parser.add_argument(
+        "--components", type=int, default=5, help="<Component> per result"
+    )
+    parser.add_argument("--probe", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        probe(*args.probe)
+        return
+
+    header = f"{'results':>8} {'file_mb':>8} {'mode':<11} {'parse_ms':>10} {'peak_rss_mb':>12}"
+    print(header)
+    print("-" * len(header))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for results in args.results:
+            path = os.path.join(tmp, f"export_{results}.xml")
+            write_export(path, results, args.components)
+            file_mb = os.path.getsize(path) / (1024 * 1024)
+            for mode in MODES:
+                row = run_mode(mode, path)
+                print(
+                    f"{row['results']:>8} {file_mb:>8.1f} {mode:<11} "
+                    f"{row['parse_ms']:>10.1f} {row['peak_rss_mb']:>12.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Shared fixtures for unit tests
+
+Lambda functions all live in a file called lambda_function.py, so they are
+loaded by path under a unique module name instead of a plain import.
+"""
+
+import importlib.util
+import os
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+FUNCTIONS_DIR = os.path.join(REPO_ROOT, "modules", "lambda", "functions")
+PROCESSOR_DIR = os.path.join(REPO_ROOT, "services", "processor")
+# Layer lab_ingest: en Lambda queda en /opt/python
+LAB_INGEST_LAYER_DIR = os.path.join(
+    REPO_ROOT, "modules", "lambda", "layers", "lab_ingest", "python"
+)
+
+# Layer lab_db (PDF Generator + Notify)
+LAB_DB_LAYER_DIR = os.path.join(
+    REPO_ROOT, "modules", "lambda", "layers", "lab_db", "python"
+)
+
+for path in (PROCESSOR_DIR, LAB_INGEST_LAYER_DIR, LAB_DB_LAYER_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+LAMBDA_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "S3_BUCKET": "test-bucket",
+    "SQS_QUEUE_URL": "https://sqs.us-east-1.amazonaws.com/123456789012/test-queue",
+    "DB_SECRET_ARN": "arn:aws:secretsmanager:us-east-1:123456789012:secret:test",
+}
+
+
+@pytest.fixture
+def load_lambda(monkeypatch):
+    """Import modules/lambda/functions/<name>/lambda_function.py"""
+
+    def _load(name, **env):
+        for key, value in {**LAMBDA_ENV, **env}.items():
+            monkeypatch.setenv(key, value)
+        # Los módulos auxiliares de cada función se importan por nombre
+        monkeypatch.syspath_prepend(os.path.join(FUNCTIONS_DIR, name))
+        path = os.path.join(FUNCTIONS_DIR, name, "lambda_function.py")
+        spec = importlib.util.spec_from_file_location(f"{name}_lambda_function", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    return _load
+
+
+@pytest.fixture
+def sqs_client():
+    """SQS mock: SendMessageBatch acepta todas las entradas y devuelve sus Ids"""
+    client = MagicMock()
+    client.send_message.side_effect = lambda **kw: {"MessageId": "m-single"}
+
+    def send_message_batch(QueueUrl, Entries):
+        return {
+            "Successful": [
+                {"Id": e["Id"], "MessageId": f"m-{e['Id']}"} for e in Entries
+            ],
+            "Failed": [],
+        }
+
+    client.send_message_batch.side_effect = send_message_batch
+    return client
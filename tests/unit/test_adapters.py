@@ -0,0 +1,126 @@
+"""
+Unit tests shared by the HL7 / CSV / XML adapters (S3 event handling through
+the common lab_ingest.adapter runtime)
+"""
+
+import io
+import json
+import threading
+import zlib
+from unittest.mock import MagicMock
+
+import pytest
+
+SAMPLES = {
+    "hl7_adapter": (
+        "MSH|^~\\&|LABCORP|LAB002|PORTAL|SYSTEM|20240115103000||ORU^R01|MSG001|P|2.5\r"
+        "PID|1||{patient}||Smith^John^A||19850315|M\r"
+        "OBR|1||20240115-001|CBC^Complete Blood Count\r"
+        "OBX|1|NM|WBC^White Blood Cell Count||7.5|10^3/uL|4.5-11.0|N|||F\r"
+    ),
+    "csv_adapter": (
+        "PatientID,LabID,TestDate,TestCode,TestName,Value,Unit,RefRange\n"
+        "{patient},SMALL001,2024-01-15,GLU,Glucose,95,mg/dL,70-100\n"
+    ),
+    "xml_adapter": (
+        '<LabResult><LabID>HOSP001</LabID><Patient ID="{patient}"/>'
+        '<Tests><Test code="CBC" name="Complete Blood Count" date="2024-01-15">'
+        '<Component code="WBC" value="7.5" unit="10^3/uL"/></Test></Tests>'
+        "</LabResult>"
+    ),
+}
+
+
+def s3_record(key):
+    return {"s3": {"bucket": {"name": "lab-bucket"}, "object": {"key": key}}}
+
+
+@pytest.fixture(params=sorted(SAMPLES))
+def adapter(request, load_lambda, sqs_client):
+    module = load_lambda(request.param, RECORD_WORKERS="4", FILE_RETRY_DELAY="0")
+    sample = SAMPLES[request.param]
+
+    def get_object(Bucket, Key):
+        if "broken" in Key:
+            raise RuntimeError("boom")
+        # Un paciente distinto por archivo para que no se deduplique el payload
+        patient = f"P{zlib.crc32(Key.encode()) % 1000000:06d}"
+        return {"Body": io.BytesIO(sample.format(patient=patient).encode("utf-8"))}
+
+    module.runtime._s3_client = MagicMock()
+    module.runtime._s3_client.get_object.side_effect = get_object
+    module.runtime._sqs_client = sqs_client
+    return module
+
+
+class TestS3Records:
+    def test_every_record_is_processed(self, adapter):
+        keys = [f"uploads/file+{idx}.dat" for idx in range(6)]
+        response = adapter.lambda_handler(
+            {"Records": [s3_record(k) for k in keys]}, None
+        )
+        body = json.loads(response["body"])
+
+        assert response["statusCode"] == 202
+        assert body["results"] == 6
+        assert [r["source"] for r in body["records"]] == [
+            f"s3://lab-bucket/uploads/file {idx}.dat" for idx in range(6)
+        ]
+        # Escritura directa: un PutObject del payload y un SendMessageBatch por archivo
+        assert adapter.runtime._s3_client.put_object.call_count == 6
+        assert adapter.runtime._sqs_client.send_message_batch.call_count == 6
+        messages = [
+            json.loads(entry["MessageBody"])
+            for call in adapter.runtime._sqs_client.send_message_batch.call_args_list
+            for entry in call.kwargs["Entries"]
+        ]
+        assert {m["source_format"] for m in messages} == {
+            adapter.runtime.parser.source_format
+        }
+
+    def test_partial_failure_returns_failed_records(self, adapter):
+        records = [s3_record("uploads/ok-1"), s3_record("uploads/broken")]
+        records.append(s3_record("uploads/ok-2"))
+        response = adapter.lambda_handler({"Records": records}, None)
+        body = json.loads(response["body"])
+
+        assert response["statusCode"] == 207
+        assert body["status"] == "partial"
+        assert [r["status"] for r in body["records"]] == ["ok", "error", "ok"]
+        assert body["failed_records"] == [s3_record("uploads/broken")]
+
+        # Reintentar solo los fallidos no vuelve a leer los que ya salieron bien
+        adapter.runtime._s3_client.get_object.reset_mock()
+        adapter.lambda_handler({"Records": body["failed_records"]}, None)
+        assert adapter.runtime._s3_client.get_object.call_count == 1
+
+    def test_records_run_concurrently(self, adapter):
+        barrier = threading.Barrier(3, timeout=5)
+        original = adapter.runtime._s3_client.get_object.side_effect
+
+        def get_object(Bucket, Key):
+            barrier.wait()
+            return original(Bucket=Bucket, Key=Key)
+
+        adapter.runtime._s3_client.get_object.side_effect = get_object
+        records = [s3_record(f"uploads/{idx}") for idx in range(3)]
+        response = adapter.lambda_handler({"Records": records}, None)
+        assert response["statusCode"] == 202
+
+    def test_unqueued_results_fail_the_file(self, adapter):
+        adapter.runtime._sqs_client.send_message_batch.side_effect = lambda **kw: {
+            "Successful": [],
+            "Failed": [
+                {"Id": e["Id"], "SenderFault": False, "Code": "InternalError"}
+                for e in kw["Entries"]
+            ],
+        }
+        response = adapter.lambda_handler({"Records": [s3_record("uploads/a")]}, None)
+        body = json.loads(response["body"])
+
+        assert response["statusCode"] == 207
+        assert body["records"][0]["failed"] == 1
+        assert body["records"][0]["attempts"] == 2
+        assert body["failed_records"] == [s3_record("uploads/a")]
+        # SendMessageBatch reintenta la entrada y el runtime reintenta el archivo
+        assert adapter.runtime._sqs_client.send_message_batch.call_count == 4
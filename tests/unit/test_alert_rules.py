@@ -0,0 +1,165 @@
+"""
+Unit tests for the worker's critical-value and delta-check rules
+"""
+
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+from alert_rules import AlertEngine, compile_rules
+
+
+def lab_result(patient_id="P1", test_date="2024-01-15T10:00:00Z", **values):
+    units = {
+        "K": "mmol/L",
+        "NA": "mmol/L",
+        "HGB": "g/dL",
+        "CREAT": "mg/dL",
+        "WBC": "10^3/uL",
+    }
+    return {
+        "patient_id": patient_id,
+        "test_date": test_date,
+        "results": [
+            {"test_code": code, "value": value, "unit": units.get(code, "mg/dL")}
+            for code, value in values.items()
+        ],
+    }
+
+
+@pytest.fixture
+def engine():
+    return AlertEngine(compile_rules())
+
+
+class TestCriticalValues:
+    def test_critical_limits_flag_the_test(self, engine):
+        data = lab_result(K=6.8, WBC=7.5)
+        alerts = engine.evaluate(data, MagicMock(return_value={}))
+
+        assert [(a["test_code"], a["type"]) for a in alerts] == [("K", "critical_high")]
+        potassium, wbc = data["results"]
+        assert potassium["alert_flag"] and potassium["severity"] == "critical"
+        assert "alert_flag" not in wbc
+
+    def test_other_units_are_not_compared(self, engine):
+        data = lab_result(HGB=6.0)
+        data["results"][0]["unit"] = "g/L"
+        assert engine.evaluate(data, MagicMock(return_value={})) == []
+
+    def test_canonical_values_are_compared(self, engine):
+        # Glucosa 1.9 mmol/L = 34 mg/dL: crítica aunque el lab use SI
+        data = lab_result(GLU=1.9)
+        data["results"][0].update(
+            unit="mmol/L", canonical_value=34.23, canonical_unit="mg/dL"
+        )
+        alerts = engine.evaluate(data, MagicMock(return_value={}))
+        assert [a["type"] for a in alerts] == ["critical_low"]
+
+    def test_overrides(self):
+        rules = compile_rules(
+            '{"k": {"critical_high": 7.0}, "LACT": {"critical_high": 4}}'
+        )
+        engine = AlertEngine(rules)
+        loader = MagicMock(return_value={})
+        assert engine.evaluate(lab_result(K=6.8), loader) == []
+        assert engine.evaluate(lab_result(LACT=4.5), loader)[0]["limit"] == 4
+
+
+class TestDeltaChecks:
+    def test_delta_against_previous_value(self, engine):
+        loader = MagicMock(return_value={"HGB": (13.5, datetime(2024, 1, 12))})
+        data = lab_result(HGB=10.9)
+        alerts = engine.evaluate(data, loader)
+
+        assert alerts[0]["type"] == "delta"
+        assert alerts[0]["previous"] == 13.5
+        assert data["results"][0]["alert_flag"] is True
+        # Delta sin valor crítico: la severity no cambia
+        assert "severity" not in data["results"][0]
+
+    def test_percent_delta_and_window(self, engine):
+        loader = MagicMock(return_value={"CREAT": (1.0, datetime(2023, 6, 1))})
+        # Creatinine doubled, but the previous value is outside the window
+        assert engine.evaluate(lab_result(CREAT=2.0), loader) == []
+
+    def test_last_values_are_cached_per_patient(self, engine):
+        loader = MagicMock(return_value={"K": (4.0, datetime(2024, 1, 10))})
+        first = lab_result(K=4.2)
+        engine.evaluate(first, loader)
+        engine.remember(first)
+
+        later = lab_result(test_date="2024-01-16T10:00:00Z", K=5.3)
+        alerts = engine.evaluate(later, loader)
+
+        assert loader.call_count == 1
+        # Compared with the value just stored, not the one from the database
+        assert alerts[0]["previous"] == 4.2
+
+    def test_values_in_other_units_are_not_remembered(self, engine):
+        loader = MagicMock(return_value={"HGB": (13.5, datetime(2024, 1, 12))})
+        engine.evaluate(lab_result(HGB=13.0), loader)
+        # 109 g/L sin canonical_value: no pisa el último valor en g/dL
+        other_unit = lab_result(test_date="2024-01-15T12:00:00Z", HGB=109)
+        other_unit["results"][0]["unit"] = "g/L"
+        engine.remember(other_unit)
+
+        later = lab_result(test_date="2024-01-16T10:00:00Z", HGB=10.9)
+        assert engine.evaluate(later, loader)[0]["previous"] == 13.5
+
+    def test_loader_is_skipped_without_delta_rules(self, engine):
+        loader = MagicMock()
+        engine.evaluate(lab_result(WBC=7.5, GLU=90), loader)
+        loader.assert_not_called()
+
+    def test_loader_errors_keep_critical_checks(self, engine):
+        loader = MagicMock(side_effect=RuntimeError("db down"))
+        alerts = engine.evaluate(lab_result(K=2.5, NA=140), loader)
+        assert [a["type"] for a in alerts] == ["critical_low"]
+        # Nothing cached: the next result retries the lookup
+        engine.evaluate(lab_result(NA=140), loader)
+        assert loader.call_count == 2
+
+    def test_cached_values_expire(self, monkeypatch):
+        import alert_rules
+
+        now = [1000.0]
+        monkeypatch.setattr(alert_rules.time, "monotonic", lambda: now[0])
+        engine = AlertEngine(compile_rules(), cache_ttl=60)
+        loader = MagicMock(return_value={"K": (4.0, datetime(2024, 1, 10))})
+        first = lab_result(K=4.2)
+        engine.evaluate(first, loader)
+        engine.remember(first)
+
+        # Otra task guardó un valor (o se corrigió en la base): pasado el TTL
+        # se vuelve a leer, aunque remember() haya tocado la entrada
+        now[0] += 60
+        loader.return_value = {"K": (5.0, datetime(2024, 1, 15, 12))}
+        later = lab_result(test_date="2024-01-16T10:00:00Z", K=5.3)
+        assert engine.evaluate(later, loader) == []
+        assert loader.call_count == 2
+
+    def test_cache_is_bounded(self):
+        engine = AlertEngine(compile_rules(), cache_size=2)
+        loader = MagicMock(return_value={})
+        for patient in ("P1", "P2", "P3", "P1"):
+            engine.evaluate(lab_result(patient, K=4.0), loader)
+        assert loader.call_count == 4
+
+
+class TestStoredLastValues:
+    def test_only_canonical_values_are_loaded(self):
+        import worker
+
+        processor = worker.LabResultsProcessor.__new__(worker.LabResultsProcessor)
+        processor.db_conn = MagicMock()
+        cursor = processor.db_conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [("HGB", 13.5, datetime(2024, 1, 12))]
+
+        assert processor.fetch_last_values("P1") == {
+            "HGB": (13.5, datetime(2024, 1, 12))
+        }
+        query = " ".join(cursor.execute.call_args.args[0].split())
+        assert "tv.canonical_value IS NOT NULL" in query
+        assert "COALESCE" not in query
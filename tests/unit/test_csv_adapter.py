@@ -0,0 +1,154 @@
+"""
+Unit tests for the CSV adapter (multi-patient streaming grouping)
+"""
+
+import io
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+HEADER = "PatientID,LabID,TestDate,TestCode,TestName,Value,Unit,RefRange,OrderID"
+
+
+def csv_text(rows):
+    return "\n".join([HEADER, *rows]) + "\n"
+
+
+def day_end_file(patients, tests_per_patient=3):
+    rows = []
+    for idx in range(patients):
+        for code in ("GLU", "BUN", "CRE")[:tests_per_patient]:
+            rows.append(f"P{idx:06d},SMALL001,2024-01-15,{code},{code},1.0,mg/dL,,")
+    return csv_text(rows)
+
+
+@pytest.fixture
+def csv_adapter(load_lambda, sqs_client):
+    module = load_lambda("csv_adapter")
+    module.runtime._s3_client = MagicMock()
+    module.runtime._sqs_client = sqs_client
+    return module
+
+
+def sent_batches(module):
+    return [
+        call.kwargs["Entries"]
+        for call in module.runtime._sqs_client.send_message_batch.call_args_list
+    ]
+
+
+class TestGrouping:
+    def test_groups_by_patient_date_and_order(self, csv_adapter):
+        text = csv_text(
+            [
+                "P1,SMALL001,2024-01-15,GLU,Glucose,95,mg/dL,70-100,O1",
+                "P1,SMALL001,2024-01-15,BUN,Urea,15,mg/dL,7-20,O1",
+                "P1,SMALL001,2024-01-15,TSH,TSH,2.1,mIU/L,0.4-4.0,O2",
+                "P1,SMALL001,2024-01-16,GLU,Glucose,101,mg/dL,70-100,O3",
+                "P2,SMALL001,2024-01-15,GLU,Glucose,88,mg/dL,70-100,O4",
+            ]
+        )
+        results = list(csv_adapter.iter_csv_results(io.StringIO(text)))
+        assert [(r["patient_id"], r["order_id"]) for r in results] == [
+            ("P1", "O1"),
+            ("P1", "O2"),
+            ("P1", "O3"),
+            ("P2", "O4"),
+        ]
+        assert [len(r["results"]) for r in results] == [2, 1, 1, 1]
+        assert results[0]["test_type"] == "GLU / Glucose"
+        assert results[2]["test_date"] == "2024-01-16T00:00:00Z"
+
+    def test_interleaved_rows_are_merged(self, csv_adapter):
+        text = csv_text(
+            [
+                "P1,SMALL001,2024-01-15,GLU,Glucose,95,mg/dL,,",
+                "P2,SMALL001,2024-01-15,GLU,Glucose,88,mg/dL,,",
+                "P1,SMALL001,2024-01-15,BUN,Urea,15,mg/dL,,",
+            ]
+        )
+        results = list(csv_adapter.iter_csv_results(io.StringIO(text)))
+        assert {r["patient_id"]: len(r["results"]) for r in results} == {
+            "P1": 2,
+            "P2": 1,
+        }
+
+    def test_open_groups_are_bounded(self, csv_adapter, monkeypatch):
+        monkeypatch.setattr(csv_adapter, "CSV_MAX_OPEN_GROUPS", 2)
+        groups = csv_adapter.iter_csv_groups(io.StringIO(day_end_file(10)))
+        assert next(groups)[0]["PatientID"] == "P000000"
+        assert sum(1 for _ in groups) == 9
+
+    def test_group_reopened_after_flush_fails_the_file(self, csv_adapter, monkeypatch):
+        monkeypatch.setattr(csv_adapter, "CSV_MAX_OPEN_GROUPS", 2)
+        text = csv_text(
+            [
+                "P1,SMALL001,2024-01-15,GLU,Glucose,95,mg/dL,,",
+                "P2,SMALL001,2024-01-15,GLU,Glucose,88,mg/dL,,",
+                "P3,SMALL001,2024-01-15,GLU,Glucose,91,mg/dL,,",
+                "P1,SMALL001,2024-01-15,BUN,Urea,15,mg/dL,,",
+            ]
+        )
+        groups = csv_adapter.iter_csv_groups(io.StringIO(text))
+        assert [row["PatientID"] for row in next(groups)] == ["P1"]
+        with pytest.raises(csv_adapter.CSVGroupingError, match="P1"):
+            next(groups)
+
+    def test_closed_keys_are_bounded(self, csv_adapter, monkeypatch):
+        monkeypatch.setattr(csv_adapter, "CSV_MAX_OPEN_GROUPS", 2)
+        groups = csv_adapter.iter_csv_groups(io.StringIO(day_end_file(500)))
+        for _ in range(490):
+            next(groups)
+
+        frame = groups.gi_frame
+        assert len(frame.f_locals["closed"]) == 2
+        assert len(frame.f_locals["open_groups"]) == 2
+
+    def test_single_patient_file_still_parses(self, csv_adapter):
+        normalized = csv_adapter.parse_csv_to_json(day_end_file(1))
+        assert normalized["patient_id"] == "P000000"
+        assert "order_id" not in normalized
+
+
+class TestBatching:
+    def test_groups_are_sent_in_batches(self, csv_adapter, monkeypatch):
+        monkeypatch.setattr(csv_adapter.runtime, "batch_size", 25)
+        response = csv_adapter.lambda_handler({"csv_body": day_end_file(60)}, None)
+        assert json.loads(response["body"])["results"] == 60
+        assert csv_adapter.runtime._s3_client.put_object.call_count == 60
+        # Lotes de 25 resultados -> SendMessageBatch de a 10 mensajes
+        sizes = [len(entries) for entries in sent_batches(csv_adapter)]
+        assert sizes == [10, 10, 5] * 2 + [10]
+
+    def test_invalid_groups_are_rejected_not_retried(self, csv_adapter):
+        text = csv_text(
+            [
+                "P000001,SMALL001,2024-01-15,GLU,Glucose,95,mg/dL,70-100,",
+                "X000002,SMALL001,2024-01-15,GLU,Glucose,90,mg/dL,70-100,",
+            ]
+        )
+        response = csv_adapter.lambda_handler({"csv_body": text}, None)
+        body = json.loads(response["body"])
+        assert response["statusCode"] == 202
+        assert (body["results"], body["rejected"]) == (1, 1)
+
+
+class TestReferenceRanges:
+    def test_rows_without_flag_are_classified_by_range(self, csv_adapter):
+        text = csv_text(
+            [
+                "P1,SMALL001,2024-01-15,GLU,Glucose,182,mg/dL,70-100,O1",
+                "P1,SMALL001,2024-01-15,CHOL,Cholesterol,190,mg/dL,<200,O1",
+                "P1,SMALL001,2024-01-15,HDL,HDL,38,mg/dL,>40,O1",
+            ]
+        )
+        csv_adapter.lambda_handler({"csv_body": text}, None)
+
+        body = csv_adapter.runtime._s3_client.put_object.call_args.kwargs["Body"]
+        tests = json.loads(body)["results"]
+        assert [(t["is_abnormal"], t["severity"]) for t in tests] == [
+            (True, "high"),
+            (False, "normal"),
+            (True, "low"),
+        ]
@@ -0,0 +1,123 @@
+"""
+Unit tests for the HL7 adapter (streaming batch parser)
+"""
+
+import io
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+MESSAGE = (
+    "MSH|^~\\&|LABCORP|LAB002|PORTAL|SYSTEM|20240115103000||ORU^R01|{ctrl}|P|2.5\r"
+    "PID|1||{patient}^^^MRN~999^^^SSN||Smith^John^A~Smithy^Jack||19850315|M\r"
+    "OBR|1||20240115-001|CBC^Complete Blood Count\r"
+    "OBX|1|NM|WBC^White Blood Cell Count||7.5|10^3/uL|4.5-11.0|N|||F\r"
+    "OBX|2|NM|HGB^Hemoglobin||11.2|g/dL|13.0-17.0|L|||F\r"
+)
+
+
+def batch(count):
+    messages = "".join(
+        MESSAGE.format(ctrl=f"MSG{idx:05d}", patient=f"P{idx:06d}")
+        for idx in range(count)
+    )
+    return (
+        "FHS|^~\\&|LABCORP|LAB002\r"
+        "BHS|^~\\&|LABCORP|LAB002\r"
+        f"{messages}"
+        f"BTS|{count}\r"
+        "FTS|1\r"
+    )
+
+
+class CountingStream(io.StringIO):
+    """StringIO that counts how many characters have been read"""
+
+    def __init__(self, text):
+        super().__init__(text)
+        self.chars_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.chars_read += len(chunk)
+        return chunk
+
+
+@pytest.fixture
+def hl7(load_lambda):
+    return load_lambda("hl7_adapter")
+
+
+class TestTokenizer:
+    def test_escape_sequences(self, hl7):
+        from hl7_stream import unescape
+
+        assert unescape("A\\F\\B\\S\\C\\T\\D\\R\\E\\E\\") == "A|B^C&D~E\\"
+        assert unescape("line1\\.br\\line2") == "line1\nline2"
+        assert unescape("\\X41C3A9\\") == "Aé"
+        assert unescape("plain") == "plain"
+
+    def test_custom_delimiters_from_msh(self, hl7):
+        from hl7_stream import iter_messages
+
+        text = "MSH#*!?@#APP#FAC\rPID#1##P1*x!P2##Doe*Jane\r"
+        [message] = iter_messages(io.StringIO(text))
+        pid = message[1]
+        assert pid.value(3) == "P1"
+        assert pid.component(3, 1, repetition=1) == "P2"
+        assert pid.component(5, 2) == "Jane"
+
+    def test_mixed_line_endings_and_small_chunks(self, hl7):
+        from hl7_stream import iter_segments
+
+        text = "MSH|^~\\&|A\r\nPID|1\nOBX|1\rOBX|2"
+        assert list(iter_segments(io.StringIO(text), chunk_size=3)) == [
+            "MSH|^~\\&|A",
+            "PID|1",
+            "OBX|1",
+            "OBX|2",
+        ]
+
+
+class TestBatchParsing:
+    def test_one_result_per_message(self, hl7):
+        results = list(hl7.iter_hl7_results(io.StringIO(batch(3))))
+        assert [r["patient_id"] for r in results] == [
+            "P000000",
+            "P000001",
+            "P000002",
+        ]
+        assert [r["external_result_id"] for r in results] == [
+            "MSG00000",
+            "MSG00001",
+            "MSG00002",
+        ]
+        first = results[0]
+        assert first["patient_name"] == "John Smith"
+        assert first["test_type"] == "Complete Blood Count"
+        assert first["test_date"] == "2024-01-15T10:30:00Z"
+        assert [r["test_code"] for r in first["results"]] == ["WBC", "HGB"]
+        assert first["results"][1]["severity"] == "low"
+
+    def test_single_message_is_still_supported(self, hl7):
+        text = MESSAGE.format(ctrl="MSG1", patient="P234567")
+        normalized = hl7.parse_hl7_to_json(text)
+        assert normalized["patient_id"] == "P234567"
+        assert len(normalized["results"]) == 2
+
+    def test_parser_reads_lazily(self, hl7):
+        from hl7_stream import READ_CHUNK_SIZE
+
+        stream = CountingStream(batch(5000))
+        results = hl7.iter_hl7_results(stream)
+        next(results)
+        assert stream.chars_read <= 2 * READ_CHUNK_SIZE
+        assert sum(1 for _ in results) == 4999
+
+    def test_handler_queues_every_message(self, hl7, sqs_client):
+        hl7.runtime._s3_client, hl7.runtime._sqs_client = MagicMock(), sqs_client
+        response = hl7.lambda_handler({"hl7_message": batch(4)}, None)
+        assert json.loads(response["body"])["results"] == 4
+        assert hl7.runtime._s3_client.put_object.call_count == 4
+        assert sqs_client.send_message_batch.call_count == 1
@@ -0,0 +1,209 @@
+"""
+Unit tests for Lambda Ingest (idempotency, uploads and batches)
+"""
+
+import json
+import re
+from unittest.mock import MagicMock
+
+import pytest
+
+
+@pytest.fixture
+def ingest(load_lambda):
+    return load_lambda("ingest")
+
+
+class TestIdempotency:
+    @pytest.fixture
+    def lab_result(self):
+        return {
+            "patient_id": "P123456",
+            "lab_id": "LAB001",
+            "lab_name": "Quest Diagnostics",
+            "test_type": "complete_blood_count",
+            "test_date": "2024-01-15T10:00:00Z",
+            "results": [
+                {
+                    "test_code": "WBC",
+                    "test_name": "White Blood Cell Count",
+                    "value": 7.5,
+                    "unit": "10^3/uL",
+                }
+            ],
+        }
+
+    @pytest.fixture
+    def aws(self, ingest):
+        s3, sqs = MagicMock(), MagicMock()
+        sqs.send_message.side_effect = [{"MessageId": f"m-{i}"} for i in range(10)]
+        ingest._s3_client, ingest._sqs_client = s3, sqs
+        return s3, sqs
+
+    def invoke(self, ingest, body, headers=None):
+        event = {"body": json.dumps(body), "headers": headers or {}}
+        response = ingest.lambda_handler(event, None)
+        return response, json.loads(response["body"])
+
+    def test_same_header_key_returns_original(self, ingest, aws, lab_result):
+        s3, sqs = aws
+        headers = {"Idempotency-Key": "retry-123"}
+        first, first_body = self.invoke(ingest, lab_result, headers)
+        second, second_body = self.invoke(
+            ingest, lab_result, {"idempotency-key": "retry-123"}
+        )
+
+        assert first["statusCode"] == second["statusCode"] == 202
+        assert second_body["result_id"] == first_body["result_id"]
+        assert second_body["message_id"] == first_body["message_id"]
+        assert second_body["duplicate"] is True
+        assert second["headers"]["Idempotent-Replayed"] == "true"
+        assert s3.put_object.call_count == 1
+        assert sqs.send_message.call_count == 1
+
+    def test_identical_payload_without_header_is_deduplicated(
+        self, ingest, aws, lab_result
+    ):
+        s3, sqs = aws
+        _, first_body = self.invoke(ingest, lab_result)
+        _, second_body = self.invoke(ingest, dict(lab_result))
+
+        assert second_body["result_id"] == first_body["result_id"]
+        assert sqs.send_message.call_count == 1
+
+    def test_header_key_reused_with_other_payload(self, ingest, aws, lab_result):
+        headers = {"Idempotency-Key": "retry-123"}
+        self.invoke(ingest, lab_result, headers)
+        changed = {**lab_result, "test_date": "2024-02-01T10:00:00Z"}
+        response, _ = self.invoke(ingest, changed, headers)
+        assert response["statusCode"] == 422
+
+    def test_failed_request_can_be_retried(self, ingest, aws, lab_result):
+        s3, sqs = aws
+        s3.put_object.side_effect = [RuntimeError("S3 down"), {}]
+        failed, _ = self.invoke(ingest, lab_result)
+        retried, body = self.invoke(ingest, lab_result)
+
+        assert failed["statusCode"] == 500
+        assert retried["statusCode"] == 202
+        assert "duplicate" not in body
+
+    def test_in_progress_key_conflicts(self, ingest, aws, lab_result):
+        from lab_ingest.idempotency import payload_hash
+
+        store = ingest.get_idempotency_store()
+        store.claim(f"hash:{payload_hash(lab_result)}", payload_hash(lab_result), 60)
+        response, _ = self.invoke(ingest, lab_result)
+        assert response["statusCode"] == 409
+
+
+class TestUploads:
+    @pytest.fixture
+    def s3(self, ingest, monkeypatch):
+        import boto3
+
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_multipart_upload = MagicMock(return_value={"UploadId": "mp-1"})
+        ingest._s3_client = client
+        return client
+
+    def invoke(self, ingest, body):
+        event = {"resource": "/api/v1/uploads", "body": json.dumps(body)}
+        response = ingest.lambda_handler(event, None)
+        return response, json.loads(response["body"])
+
+    def test_small_file_gets_single_put(self, ingest, s3):
+        response, body = self.invoke(
+            ingest, {"format": "hl7", "filename": "batch 01.hl7", "size_bytes": 2048}
+        )
+        assert response["statusCode"] == 201
+        assert body["method"] == "PUT"
+        assert re.match(
+            r"^uploads/hl7/\d{4}/\d{2}/\d{2}/[0-9A-Z]{26}-batch_01\.hl7$", body["key"]
+        )
+        assert "x-amz-server-side-encryption" in body["url"]
+        assert body["headers"]["x-amz-server-side-encryption"] == "AES256"
+        s3.create_multipart_upload.assert_not_called()
+
+    def test_large_file_gets_multipart_urls(self, ingest, s3):
+        from uploads import MB
+
+        response, body = self.invoke(
+            ingest, {"format": "csv", "filename": "big.csv", "size_bytes": 250 * MB}
+        )
+        assert response["statusCode"] == 201
+        assert body["method"] == "MULTIPART"
+        assert body["multipart_upload_id"] == "mp-1"
+        assert len(body["parts"]) * body["part_size"] >= 250 * MB
+        assert [p["part_number"] for p in body["parts"]] == list(
+            range(1, len(body["parts"]) + 1)
+        )
+        assert "uploadId=mp-1" in body["complete_url"]
+        kwargs = s3.create_multipart_upload.call_args.kwargs
+        assert kwargs["ServerSideEncryption"] == "AES256"
+        assert kwargs["Key"].startswith("uploads/csv/")
+
+    def test_part_size_respects_part_limit(self):
+        from uploads import MAX_PARTS, MB, MIN_PART_SIZE, part_size_for
+
+        assert part_size_for(10 * MB) == MIN_PART_SIZE
+        huge = 4 * 1024 * 1024 * MB
+        assert part_size_for(huge) * MAX_PARTS >= huge
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            {"format": "pdf", "size_bytes": 10},
+            {"format": "xml", "size_bytes": "abc"},
+            {"format": "xml", "size_bytes": 6 * 1024**3, "multipart": False},
+        ],
+    )
+    def test_invalid_requests_are_rejected(self, ingest, s3, body):
+        response, _ = self.invoke(ingest, body)
+        assert response["statusCode"] == 400
+
+
+class TestBatch:
+    @pytest.fixture
+    def aws(self, ingest, sqs_client):
+        s3 = MagicMock()
+        ingest._s3_client, ingest._sqs_client = s3, sqs_client
+        return s3, sqs_client
+
+    def lab_result(self, patient_id):
+        return {
+            "patient_id": patient_id,
+            "lab_id": "SMALL001",
+            "lab_name": "Small Lab",
+            "test_type": "GLU / Glucose",
+            "test_date": "2024-01-15T00:00:00Z",
+            "results": [
+                {
+                    "test_code": "GLU",
+                    "test_name": "Glucose",
+                    "value": 95,
+                    "unit": "mg/dL",
+                }
+            ],
+        }
+
+    def test_each_item_is_ingested(self, ingest, aws):
+        batch = [self.lab_result("P1"), self.lab_result("P2"), {"patient_id": "X"}]
+        response = ingest.lambda_handler({"batch": batch}, None)
+        body = json.loads(response["body"])
+
+        assert response["statusCode"] == 207
+        assert (body["accepted"], body["failed"]) == (2, 1)
+        assert [r["statusCode"] for r in body["results"]] == [202, 202, 400]
+        # Los dos mensajes salen en un solo SendMessageBatch
+        assert aws[1].send_message_batch.call_count == 1
+        assert len(aws[1].send_message_batch.call_args.kwargs["Entries"]) == 2
+
+    def test_duplicate_items_are_not_requeued(self, ingest, aws):
+        batch = [self.lab_result("P1"), self.lab_result("P1")]
+        body = json.loads(ingest.lambda_handler({"batch": batch}, None)["body"])
+        assert body["results"][1]["duplicate"] is True
+        assert body["results"][1]["result_id"] == body["results"][0]["result_id"]
+        assert len(aws[1].send_message_batch.call_args.kwargs["Entries"]) == 1
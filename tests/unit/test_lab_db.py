@@ -0,0 +1,254 @@
+"""
+Unit tests for the shared RDS connection manager (lab_db layer)
+"""
+
+import json
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from lab_db import (  # noqa: E402
+    ConnectionManager,
+    fetch_result,
+    fetch_results,
+    submit_report_job,
+)
+
+SECRET = {
+    "host": "db",
+    "port": 5432,
+    "dbname": "lab",
+    "username": "app",
+    "password": "old",
+}
+
+
+def secrets_client(*passwords):
+    client = MagicMock()
+    client.get_secret_value.side_effect = [
+        {"SecretString": json.dumps({**SECRET, "password": p})}
+        for p in passwords or ("old",)
+    ]
+    return client
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    """psycopg2.connect falso: cada llamada devuelve una conexión nueva"""
+
+    def _connect(**kwargs):
+        conn = MagicMock(closed=0)
+        conn.password = kwargs["password"]
+        return conn
+
+    fake = MagicMock(side_effect=_connect)
+    monkeypatch.setattr(psycopg2, "connect", fake)
+    return fake
+
+
+def manager(client=None, **kwargs):
+    return ConnectionManager(
+        "arn:secret", secrets_client=client or secrets_client(), **kwargs
+    )
+
+
+class TestConnectionReuse:
+    def test_warm_invocations_reuse_the_connection(self, connect):
+        db = manager()
+        for _ in range(3):
+            with db.cursor() as cursor:
+                cursor.execute("SELECT 1")
+
+        assert connect.call_count == 1
+        assert db.stats == {
+            "reused": 2,
+            "reconnected": 1,
+            "secret_fetches": 1,
+            "auth_refreshes": 0,
+        }
+
+    def test_each_cursor_ends_its_transaction(self, connect):
+        db = manager()
+        with db.cursor():
+            pass
+        with pytest.raises(ValueError):
+            with db.cursor():
+                raise ValueError("bad row")
+
+        conn = db.get_connection()
+        conn.commit.assert_called_once()
+        conn.rollback.assert_called_once()
+
+    def test_closed_connection_is_replaced(self, connect):
+        db = manager()
+        first = db.get_connection()
+        first.closed = 1
+        assert db.get_connection() is not first
+        assert db.stats["reconnected"] == 2
+
+    def test_idle_connection_is_validated(self, connect):
+        db = manager(validate_after=0)
+        first = db.get_connection()
+        first.cursor.return_value.__enter__.return_value.execute.side_effect = (
+            psycopg2.OperationalError("server closed the connection")
+        )
+
+        second = db.get_connection()
+        assert second is not first
+        first.close.assert_called_once()
+
+    def test_connection_errors_drop_the_connection(self, connect):
+        db = manager()
+        with pytest.raises(psycopg2.OperationalError):
+            with db.cursor():
+                raise psycopg2.OperationalError("SSL SYSCALL error")
+
+        with db.cursor():
+            pass
+        assert connect.call_count == 2
+
+
+class TestSecretCache:
+    def test_secret_is_refetched_after_ttl(self, connect):
+        client = secrets_client("old", "old")
+        db = manager(client, secret_ttl=0)
+        db.get_connection()
+        db.discard()
+        db.get_connection()
+        assert client.get_secret_value.call_count == 2
+
+    def test_auth_failure_refreshes_rotated_secret(self, connect):
+        def _connect(**kwargs):
+            if kwargs["password"] == "old":
+                raise psycopg2.OperationalError(
+                    'FATAL:  password authentication failed for user "app"'
+                )
+            return MagicMock(closed=0)
+
+        connect.side_effect = _connect
+        db = manager(secrets_client("old", "new"))
+
+        db.get_connection()
+        assert connect.call_args.kwargs["password"] == "new"
+        assert db.stats["auth_refreshes"] == 1
+
+    def test_other_connect_errors_are_not_retried(self, connect):
+        connect.side_effect = psycopg2.OperationalError("timeout expired")
+        client = secrets_client()
+        with pytest.raises(psycopg2.OperationalError):
+            manager(client).get_connection()
+        assert client.get_secret_value.call_count == 1
+
+
+class RecordingCursor:
+    """Cursor de tuplas que cuenta los round trips"""
+
+    description = [
+        ("result_id",),
+        ("first_name",),
+        ("email",),
+        ("updated_at",),
+        ("test_values",),
+    ]
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+
+UPDATED_AT = datetime(2024, 1, 15, 10, 5)
+VALUES = '[{"test_code": "GLU", "value": 105.50, "is_abnormal": true}]'
+
+
+class TestFetchResults:
+    def test_result_and_values_in_one_round_trip(self):
+        cursor = RecordingCursor([(7, "John", "j@x.com", UPDATED_AT, VALUES)])
+
+        result = fetch_result(cursor, 7)
+
+        assert len(cursor.queries) == 1
+        assert result["first_name"] == "John"
+        assert result["test_values"] == [
+            {"test_code": "GLU", "value": Decimal("105.50"), "is_abnormal": True}
+        ]
+
+    def test_batch_is_still_one_round_trip(self):
+        cursor = RecordingCursor(
+            [(1, "A", "a@x.com", UPDATED_AT, VALUES), (2, "B", "b@x.com", None, "[]")]
+        )
+
+        results = fetch_results(cursor, [1, 2, 404])
+
+        assert len(cursor.queries) == 1
+        assert cursor.queries[0][1]["result_ids"] == [1, 2, 404]
+        assert sorted(results) == [1, 2]
+        assert results[2]["test_values"] == []
+
+    def test_email_restricts_to_the_patient(self):
+        cursor = RecordingCursor([])
+
+        assert fetch_result(cursor, 7, email="j@x.com") is None
+        query, params = cursor.queries[0]
+        assert "p.email = %(email)s" in query
+        assert params["email"] == "j@x.com"
+
+    def test_dict_rows_are_accepted(self):
+        cursor = RecordingCursor([{"result_id": 3, "test_values": VALUES}])
+        cursor.description = None
+
+        assert fetch_result(cursor, 3)["test_values"][0]["test_code"] == "GLU"
+
+
+class TestReportJobs:
+    JOB = {"job_id": 5, "result_id": 7, "status": "pending"}
+
+    def test_new_job_is_created_in_one_round_trip(self):
+        cursor = RecordingCursor([self.JOB])
+
+        job, created = submit_report_job(cursor, 7, UPDATED_AT, stale_after=60)
+
+        assert created is True
+        assert job["job_id"] == 5
+        query, params = cursor.queries[0]
+        assert "ON CONFLICT (result_id, result_version)" in query
+        assert params == {
+            "result_id": 7,
+            "result_version": UPDATED_AT,
+            "stale_after": 60,
+        }
+
+    def test_requeued_job_starts_its_attempts_again(self):
+        # Job fallido (o completado sin PDF) que ON CONFLICT vuelve a encolar
+        cursor = RecordingCursor([{**self.JOB, "attempt_count": 0}])
+
+        job, created = submit_report_job(cursor, 7, UPDATED_AT)
+
+        assert created is True
+        assert job["attempt_count"] == 0
+        query, _ = cursor.queries[0]
+        requeue = " ".join(query.split("DO UPDATE", 1)[1].split())
+        assert "attempt_count = 0" in requeue
+        assert "WHERE j.status IN ('failed', 'completed')" in requeue
+
+    def test_duplicate_submission_returns_the_running_job(self):
+        # ON CONFLICT no actualizó nada: hay un job en curso para la versión
+        cursor = RecordingCursor([None, {**self.JOB, "status": "running"}])
+
+        job, created = submit_report_job(cursor, 7, UPDATED_AT)
+
+        assert created is False
+        assert job["status"] == "running"
+        assert len(cursor.queries) == 2
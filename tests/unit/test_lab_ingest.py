@@ -0,0 +1,287 @@
+"""
+Unit tests for the shared lab_ingest layer (IDs, S3 key layout, writer,
+reference ranges and the adapter runtime)
+"""
+
+import io
+import json
+import re
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from lab_ingest import IngestWriter, build_s3_key, generate_ulid, shard_prefix
+from lab_ingest import ids, reference_ranges
+from lab_ingest.adapter import AdapterRuntime, ParserPlugin, flag_severity
+from lab_ingest.reference_ranges import (
+    ReferenceRange,
+    classify_results,
+    parse_reference_range,
+)
+
+ULID_RE = re.compile(r"^[0-9A-HJKMNP-TV-Z]{26}$")
+
+
+def lab_result(patient_id="P123456"):
+    return {
+        "patient_id": patient_id,
+        "lab_id": "LAB001",
+        "lab_name": "Quest Diagnostics",
+        "test_type": "complete_blood_count",
+        "test_date": "2024-01-15T10:00:00Z",
+        "results": [
+            {
+                "test_code": "WBC",
+                "test_name": "White Blood Cell Count",
+                "value": 7.5,
+                "unit": "10^3/uL",
+            }
+        ],
+    }
+
+
+class TestResultIds:
+    def test_ulid_format(self):
+        assert ULID_RE.match(generate_ulid())
+
+    def test_ulids_are_unique_and_sorted(self):
+        values = [generate_ulid() for _ in range(5000)]
+        assert len(set(values)) == len(values)
+        assert values == sorted(values)
+
+    def test_same_millisecond_increments(self, monkeypatch):
+        monkeypatch.setattr(ids.time, "time", lambda: 1700000000.0)
+        first, second = generate_ulid(), generate_ulid()
+        assert first[:10] == second[:10]
+        assert second > first
+
+
+class TestS3KeyLayout:
+    def test_key_has_shard_then_date(self):
+        key = build_s3_key("JSON", "01HMX2ABCDEF0123456789ABCD", 16, ".gz")
+        parts = key.split("/")
+        assert parts[:2] == ["incoming", "json"]
+        assert re.match(r"^[0-9a-f]{2}$", parts[2])
+        assert re.match(r"^\d{4}$", parts[3])
+        assert key.endswith("/01HMX2ABCDEF0123456789ABCD.json.gz")
+
+    def test_shard_is_stable_and_spread(self):
+        values = [generate_ulid() for _ in range(2000)]
+        shards = {shard_prefix(i, 16) for i in values}
+        assert shard_prefix(values[0], 16) == shard_prefix(values[0], 16)
+        assert len(shards) == 16
+
+
+class TestIngestWriter:
+    @pytest.fixture
+    def writer(self, sqs_client):
+        return IngestWriter(
+            MagicMock(), sqs_client, "test-bucket", "https://queue", "HL7"
+        )
+
+    def test_messages_are_sent_in_groups_of_ten(self, writer, sqs_client):
+        items = [lab_result(f"P{idx:06d}") for idx in range(23)]
+        outcomes = writer.ingest_many(items)
+
+        assert [o["status_code"] for o in outcomes] == [202] * 23
+        sizes = [
+            len(call.kwargs["Entries"])
+            for call in sqs_client.send_message_batch.call_args_list
+        ]
+        assert sizes == [10, 10, 3]
+        assert writer.s3_client.put_object.call_count == 23
+        key = writer.s3_client.put_object.call_args.kwargs["Key"]
+        assert key.startswith("incoming/hl7/")
+
+    def test_rejected_entries_release_their_key(self, writer, sqs_client):
+        sqs_client.send_message_batch.side_effect = lambda **kw: {
+            "Successful": [{"Id": "0", "MessageId": "m-0"}],
+            "Failed": [{"Id": "1", "SenderFault": True, "Code": "InvalidParameter"}],
+        }
+        outcomes = writer.ingest_many([lab_result("P1"), lab_result("P2")])
+        assert [o["status_code"] for o in outcomes] == [202, 500]
+        # La entrada del cliente no se reintenta, pero puede volver a enviarse
+        assert sqs_client.send_message_batch.call_count == 1
+        sqs_client.send_message_batch.side_effect = None
+        sqs_client.send_message_batch.return_value = {
+            "Successful": [{"Id": "0", "MessageId": "m-retry"}]
+        }
+        retried = writer.ingest_many([lab_result("P2")])
+        assert retried[0]["body"]["message_id"] == "m-retry"
+
+    def test_stream_counts(self, writer):
+        results = [lab_result("P1"), {**lab_result("X2")}, lab_result("P1")]
+        counts = writer.ingest_stream(iter(results), batch_size=2)
+        assert counts == {"results": 2, "rejected": 1, "failed": 0}
+        assert writer.s3_client.put_object.call_count == 1
+
+
+class TestReferenceRanges:
+    @pytest.mark.parametrize(
+        "text, expected",
+        [
+            ("4.5-11.0", ReferenceRange(4.5, 11.0)),
+            ("4.5 - 11.0 10^3/uL", ReferenceRange(4.5, 11.0)),
+            ("-2.0-2.0", ReferenceRange(-2.0, 2.0)),
+            ("<200", ReferenceRange(None, 200.0, high_inclusive=False)),
+            ("<= 5.7", ReferenceRange(None, 5.7)),
+            (">40", ReferenceRange(40.0, None, low_inclusive=False)),
+            ("Negative", None),
+            ("", None),
+            ("11.0-4.5", None),
+        ],
+    )
+    def test_parse(self, text, expected):
+        assert parse_reference_range(text) == expected
+
+    def test_bounds(self):
+        tests = [
+            {"value": 200, "reference_range": "<200"},
+            {"value": 40, "reference_range": ">40"},
+            {"value": 11.0, "reference_range": "4.5-11.0"},
+            {"value": "3.9", "reference_range": "4.5-11.0"},
+        ]
+        assert classify_results(tests) == 4
+        assert [t["severity"] for t in tests] == ["high", "low", "normal", "low"]
+        assert [t["is_abnormal"] for t in tests] == [True, True, False, True]
+
+    def test_lab_flag_wins_and_unknown_ranges_are_left_alone(self):
+        flagged = {"value": 50, "reference_range": "70-100", "severity": "normal"}
+        text_range = {"value": 1, "reference_range": "Negative"}
+        assert classify_results([flagged, text_range]) == 0
+        assert flagged["severity"] == "normal"
+        assert "severity" not in text_range
+
+    def test_parsed_ranges_are_memoized(self):
+        parse_reference_range.cache_clear()
+        classify_results(
+            [{"value": v, "reference_range": "70-100"} for v in range(1000)]
+        )
+        info = parse_reference_range.cache_info()
+        assert (info.misses, info.hits) == (1, 999)
+
+    def test_vectorized_matches_scalar(self):
+        pytest.importorskip("numpy")
+        ranges = ["4.5-11.0", "<200", ">40", "<=5.7", ">=1"]
+        scalar = [
+            {"value": idx / 4 - 2, "reference_range": ranges[idx % 5]}
+            for idx in range(900)
+        ]
+        vector = [dict(t) for t in scalar]
+        classify_results(scalar, vectorize=False)
+        classify_results(vector, vectorize=True)
+        assert [t["severity"] for t in vector] == [t["severity"] for t in scalar]
+
+    def test_writer_classifies_the_whole_batch_once(self, monkeypatch, sqs_client):
+        calls = []
+        original = reference_ranges.classify_results
+        monkeypatch.setattr(
+            reference_ranges,
+            "classify_results",
+            lambda tests, **kw: calls.append(1) or original(tests, **kw),
+        )
+        writer = IngestWriter(MagicMock(), sqs_client, "b", "https://queue", "CSV")
+        items = [lab_result(f"P{idx}") for idx in range(5)]
+        for item in items:
+            item["results"][0]["reference_range"] = "4.5-11.0"
+        writer.ingest_many(items)
+
+        assert calls == [1]
+        body = json.loads(writer.s3_client.put_object.call_args.kwargs["Body"])
+        assert body["results"][0]["severity"] == "normal"
+
+
+class JSONLinesParser(ParserPlugin):
+    """New format added only as a plugin: one lab result per line"""
+
+    source_format = "JSONL"
+    inline_key = "jsonl_body"
+
+    def parse(self, stream):
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class TestAdapterRuntime:
+    @pytest.fixture
+    def runtime(self, monkeypatch, sqs_client):
+        monkeypatch.setenv("S3_BUCKET", "test-bucket")
+        monkeypatch.setenv("SQS_QUEUE_URL", "https://queue")
+        monkeypatch.setenv("FILE_RETRY_DELAY", "0")
+        runtime = AdapterRuntime(JSONLinesParser())
+        runtime._s3_client, runtime._sqs_client = MagicMock(), sqs_client
+        return runtime
+
+    def body(self, *patients):
+        lines = (json.dumps(lab_result(p)) for p in patients)
+        return "\n".join(lines).encode("utf-8")
+
+    def test_plugin_gets_s3_batching_and_response(self, runtime, sqs_client):
+        runtime._s3_client.get_object.return_value = {
+            "Body": io.BytesIO(self.body("P1", "P2", "P3"))
+        }
+        record = {"s3": {"bucket": {"name": "b"}, "object": {"key": "in/a+b.jsonl"}}}
+        response = runtime.handle({"Records": [record]})
+        body = json.loads(response["body"])
+
+        assert response["statusCode"] == 202
+        assert body["results"] == 3
+        assert body["records"][0]["source"] == "s3://b/in/a b.jsonl"
+        assert sqs_client.send_message_batch.call_count == 1
+        key = runtime._s3_client.put_object.call_args.kwargs["Key"]
+        assert key.startswith("incoming/jsonl/")
+
+    def test_transient_errors_retry_the_file(self, runtime):
+        throttled = ClientError({"Error": {"Code": "SlowDown"}}, "GetObject")
+        runtime._s3_client.get_object.side_effect = [
+            throttled,
+            {"Body": io.BytesIO(self.body("P1"))},
+        ]
+        record = {"s3": {"bucket": {"name": "b"}, "object": {"key": "a"}}}
+        body = json.loads(runtime.handle({"Records": [record]})["body"])
+        assert body["records"][0]["status"] == "ok"
+        assert body["records"][0]["attempts"] == 2
+
+    def test_permanent_errors_are_not_retried(self, runtime):
+        missing = ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        runtime._s3_client.get_object.side_effect = missing
+        record = {"s3": {"bucket": {"name": "b"}, "object": {"key": "a"}}}
+        response = runtime.handle({"Records": [record]})
+        assert response["statusCode"] == 207
+        assert runtime._s3_client.get_object.call_count == 1
+
+    def test_metrics_are_emitted_as_emf(self, runtime, monkeypatch):
+        from lab_ingest import metrics
+
+        output = io.StringIO()
+        monkeypatch.setattr(metrics._handler, "stream", output)
+        runtime.handle({"jsonl_body": json.dumps(lab_result("P1"))})
+
+        # Una línea JSON pura, sin el prefijo del formato de logging
+        line = json.loads(output.getvalue().strip().splitlines()[-1])
+        emf = line["_aws"]["CloudWatchMetrics"][0]
+        assert emf["Dimensions"] == [["Format"]]
+        assert {"Name": "DurationMs", "Unit": "Milliseconds"} in emf["Metrics"]
+        assert (line["Format"], line["Results"], line["Files"]) == ("JSONL", 1, 1)
+
+    def test_plugins_must_implement_parse(self):
+        class Incomplete(ParserPlugin):
+            source_format = "NOPE"
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    @pytest.mark.parametrize(
+        "flag, expected",
+        [
+            (None, (False, "normal")),
+            ("N", (False, "normal")),
+            ("HH", (True, "high")),
+            ("l", (True, "low")),
+            ("A", (True, "normal")),
+        ],
+    )
+    def test_flag_severity(self, flag, expected):
+        assert flag_severity(flag) == expected
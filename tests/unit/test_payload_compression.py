@@ -0,0 +1,66 @@
+"""
+Unit tests for compressed raw payload storage (Ingest -> S3 -> Worker)
+"""
+
+import gzip
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from payload_codec import decode_payload, detect_encoding
+
+
+@pytest.fixture
+def payload():
+    return {
+        "patient_id": "P123456",
+        "lab_id": "LAB001",
+        "results": [{"test_code": "WBC", "value": 7.5}],
+    }
+
+
+class TestPayloadCodec:
+    def test_plain_json(self, payload):
+        raw = json.dumps(payload).encode()
+        assert detect_encoding(raw) is None
+        assert decode_payload(raw) == payload
+
+    def test_gzip_from_content_encoding(self, payload):
+        raw = gzip.compress(json.dumps(payload).encode())
+        assert decode_payload(raw, "gzip") == payload
+
+    def test_gzip_detected_without_header(self, payload):
+        raw = gzip.compress(json.dumps(payload).encode())
+        assert detect_encoding(raw, None) == "gzip"
+        assert decode_payload(raw) == payload
+
+    def test_zstd_round_trip(self, payload):
+        zstandard = pytest.importorskip("zstandard")
+        raw = zstandard.ZstdCompressor().compress(json.dumps(payload).encode())
+        assert detect_encoding(raw) == "zstd"
+        assert decode_payload(raw, "zstd") == payload
+
+
+class TestIngestCompression:
+    @pytest.mark.parametrize("mode", ["none", "gzip"])
+    def test_save_to_s3_round_trip(self, load_lambda, payload, mode):
+        ingest = load_lambda("ingest", PAYLOAD_COMPRESSION=mode)
+        s3 = MagicMock()
+        ingest._s3_client = s3
+
+        key = ingest.get_writer().save_to_s3(dict(payload), "LAB001-P123456-1")
+
+        kwargs = s3.put_object.call_args.kwargs
+        assert kwargs["Key"] == key
+        if mode == "gzip":
+            assert key.endswith(".json.gz")
+            assert kwargs["ContentEncoding"] == "gzip"
+            assert kwargs["Metadata"]["content-encoding"] == "gzip"
+        else:
+            assert key.endswith(".json")
+            assert "ContentEncoding" not in kwargs
+
+        stored = decode_payload(kwargs["Body"], kwargs.get("ContentEncoding"))
+        assert stored["patient_id"] == "P123456"
+        assert stored["result_id"] == "LAB001-P123456-1"
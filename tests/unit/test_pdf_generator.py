@@ -0,0 +1,561 @@
+"""
+Unit tests for the PDF Generator Lambda (report cache)
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO
+from unittest.mock import ANY, MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+REPORT_VERSION = datetime(2024, 1, 15, 10, 30, 0, 123456)
+
+
+@pytest.fixture
+def pdf(load_lambda, monkeypatch):
+    module = load_lambda("pdf_generator")
+    s3 = MagicMock()
+    s3.generate_presigned_url.return_value = "https://signed"
+    monkeypatch.setattr(module, "_s3_client", s3)
+    monkeypatch.setattr(
+        module, "get_result_version", lambda rid: module.report_version(REPORT_VERSION)
+    )
+    monkeypatch.setattr(
+        module,
+        "get_result_data",
+        MagicMock(return_value={"result_id": 42, "report_version": REPORT_VERSION}),
+    )
+    monkeypatch.setattr(module, "generate_pdf", lambda data: BytesIO(b"%PDF"))
+    return module
+
+
+def not_found():
+    return ClientError({"Error": {"Code": "404"}}, "HeadObject")
+
+
+class TestReportCache:
+    def test_key_depends_on_result_version(self, pdf):
+        assert pdf.report_key("42", pdf.report_version(REPORT_VERSION)) == (
+            "reports/42/20240115T103000123456.pdf"
+        )
+
+    def test_hit_skips_queries_and_render(self, pdf):
+        response = pdf.lambda_handler({"result_id": "42"}, None)
+        body = json.loads(response["body"])
+
+        assert response["statusCode"] == 200
+        assert body["cached"] is True
+        assert body["s3_key"] == "reports/42/20240115T103000123456.pdf"
+        pdf.get_result_data.assert_not_called()
+        pdf._s3_client.put_object.assert_not_called()
+
+    def test_miss_renders_and_drops_stale_versions(self, pdf):
+        s3 = pdf._s3_client
+        s3.head_object.side_effect = not_found()
+        s3.list_objects_v2.return_value = {
+            "Contents": [
+                {"Key": "reports/42/20240101T000000000000.pdf"},
+                {"Key": "reports/42/20240115T103000123456.pdf"},
+            ]
+        }
+        body = json.loads(pdf.lambda_handler({"result_id": "42"}, None)["body"])
+
+        assert body["cached"] is False
+        assert s3.put_object.call_args.kwargs["Key"] == body["s3_key"]
+        deleted = s3.delete_objects.call_args.kwargs["Delete"]["Objects"]
+        assert deleted == [{"Key": "reports/42/20240101T000000000000.pdf"}]
+
+    def test_corrected_result_gets_a_new_report(self, pdf, monkeypatch):
+        # Corrección de un test_value (o del paciente): los triggers suben
+        # report_version y el PDF anterior deja de servirse
+        corrected = REPORT_VERSION + timedelta(days=2)
+        monkeypatch.setattr(
+            pdf, "get_result_version", lambda rid: pdf.report_version(corrected)
+        )
+        pdf.get_result_data.return_value = {
+            "result_id": 42,
+            "report_version": corrected,
+        }
+        s3 = pdf._s3_client
+        s3.head_object.side_effect = not_found()
+        s3.list_objects_v2.return_value = {
+            "Contents": [
+                {"Key": "reports/42/20240115T103000123456.pdf"},
+                {"Key": "reports/42/20240117T103000123456.pdf"},
+            ]
+        }
+        body = json.loads(pdf.lambda_handler({"result_id": "42"}, None)["body"])
+
+        assert body["s3_key"] == "reports/42/20240117T103000123456.pdf"
+        deleted = s3.delete_objects.call_args.kwargs["Delete"]["Objects"]
+        assert deleted == [{"Key": "reports/42/20240115T103000123456.pdf"}]
+
+    @pytest.mark.parametrize(
+        "trigger",
+        [
+            "AFTER INSERT OR DELETE ON test_values",
+            "AFTER UPDATE ON test_values",
+            "AFTER UPDATE OF first_name, last_name, date_of_birth ON patients",
+        ],
+    )
+    def test_schema_bumps_the_version_on_rendered_tables(self, trigger):
+        schema = os.path.join(
+            os.path.dirname(__file__),
+            "..",
+            "..",
+            "scripts",
+            "database",
+            "setup_database.sql",
+        )
+        with open(schema, encoding="utf-8") as f:
+            _, _, after = f.read().partition(trigger)
+        # El trigger existe y ejecuta una de las funciones que suben la versión
+        function = after.split("EXECUTE FUNCTION", 1)[1].split("(")[0].strip()
+        assert function in (
+            "bump_result_report_version",
+            "bump_patient_report_versions",
+        )
+
+    def test_unknown_result(self, pdf, monkeypatch):
+        monkeypatch.setattr(pdf, "get_result_version", lambda rid: None)
+        assert pdf.lambda_handler({"result_id": "404"}, None)["statusCode"] == 404
+
+    def test_s3_errors_are_not_a_miss(self, pdf):
+        denied = ClientError({"Error": {"Code": "403"}}, "HeadObject")
+        pdf._s3_client.head_object.side_effect = denied
+        assert pdf.lambda_handler({"result_id": "42"}, None)["statusCode"] == 500
+
+
+def sns_event(*messages):
+    return {"Records": [{"Sns": {"Message": json.dumps(m)}} for m in messages]}
+
+
+class TestPregeneration:
+    def test_result_ready_renders_without_signing(self, pdf):
+        pdf._s3_client.head_object.side_effect = not_found()
+        response = pdf.lambda_handler(
+            sns_event({"result_id": 42, "patient_id": "P1"}), None
+        )
+
+        assert json.loads(response["body"])["reports"] == [
+            {"result_id": 42, "s3_key": "reports/42/20240115T103000123456.pdf"}
+        ]
+        pdf._s3_client.put_object.assert_called_once()
+        pdf._s3_client.generate_presigned_url.assert_not_called()
+
+    def test_already_rendered_is_skipped(self, pdf):
+        pdf.lambda_handler(sns_event({"result_id": 42}), None)
+        pdf.get_result_data.assert_not_called()
+
+    def test_failures_are_raised_for_sns_retry(self, pdf):
+        pdf._s3_client.head_object.side_effect = not_found()
+        pdf._s3_client.put_object.side_effect = RuntimeError("s3 down")
+        with pytest.raises(RuntimeError):
+            pdf.lambda_handler(sns_event({"result_id": 42}), None)
+
+
+@pytest.fixture
+def batch(pdf, monkeypatch):
+    results = {
+        rid: {"result_id": rid, "report_version": REPORT_VERSION, "test_values": []}
+        for rid in (1, 2, 3)
+    }
+    monkeypatch.setattr(
+        pdf,
+        "get_results_data",
+        MagicMock(side_effect=lambda ids: {r: results[r] for r in ids if r in results}),
+    )
+    s3 = pdf._s3_client
+    s3.create_multipart_upload.return_value = {"UploadId": "up-1"}
+    s3.upload_part.side_effect = lambda **kw: {"ETag": f"etag-{kw['PartNumber']}"}
+    return pdf
+
+
+def uploaded_bytes(s3):
+    calls = sorted(s3.upload_part.call_args_list, key=lambda c: c.kwargs["PartNumber"])
+    return b"".join(c.kwargs["Body"] for c in calls)
+
+
+class TestReportJobs:
+    @pytest.fixture
+    def jobs(self, pdf, monkeypatch):
+        monkeypatch.setattr(pdf, "_db", MagicMock())
+        for name in ("start_report_job", "complete_report_job", "fail_report_job"):
+            monkeypatch.setattr(pdf, name, MagicMock())
+        pdf._s3_client.head_object.side_effect = not_found()
+        return pdf
+
+    def test_job_is_completed_with_the_report_key(self, jobs):
+        response = jobs.lambda_handler({"job_id": 5, "result_id": 42}, None)
+
+        assert response["statusCode"] == 200
+        jobs.start_report_job.assert_called_once_with(ANY, 5)
+        jobs.complete_report_job.assert_called_once_with(
+            ANY, 5, "reports/42/20240115T103000123456.pdf"
+        )
+        jobs.fail_report_job.assert_not_called()
+
+    def test_render_errors_fail_the_job_without_raising(self, jobs):
+        jobs.get_result_data.side_effect = RuntimeError("db down")
+
+        response = jobs.lambda_handler({"job_id": 5, "result_id": 42}, None)
+
+        assert response["statusCode"] == 500
+        jobs.fail_report_job.assert_called_once_with(ANY, 5, "db down")
+        jobs.complete_report_job.assert_not_called()
+
+
+def history_rows(values, codes=("GLU", "HGB")):
+    start = datetime(2020, 1, 1, 8, 0)
+    return [
+        {
+            "test_code": code,
+            "test_name": code.title(),
+            "unit": "mg/dL",
+            "reference_range": "70-99",
+            "dates": [start + timedelta(days=i) for i in range(values)],
+            "vals": [
+                Decimal(90 + (i % 7) + (300 if i == values // 2 else 0))
+                for i in range(values)
+            ],
+            "abnormal": [i == values // 2 for i in range(values)],
+        }
+        for code in codes
+    ]
+
+
+class TestHistory:
+    def test_downsample_keeps_ends_and_peaks(self):
+        import history
+
+        points = [(float(i), float(i % 5)) for i in range(1000)]
+        points[500] = (500.0, 100.0)
+
+        sampled = history.downsample(points, 50)
+
+        assert len(sampled) == 50
+        assert sampled[0] == points[0] and sampled[-1] == points[-1]
+        assert (500.0, 100.0) in sampled
+        assert history.downsample(points[:10], 50) == points[:10]
+
+    def test_series_summary(self):
+        import history
+
+        series = history.build_series(history_rows(3000)[0], max_points=120)
+
+        assert series["count"] == 3000
+        assert series["abnormal_count"] == 1
+        assert series["max_value"] == 90 + 1500 % 7 + 300
+        assert len(series["points"]) == 120
+        assert abs(series["slope_per_year"]) < 5
+
+    def test_history_is_one_query_after_the_patient(self):
+        import history
+
+        cursor = MagicMock()
+        cursor.fetchone.return_value = {"patient_id": "P1", "first_name": "John"}
+        cursor.fetchall.return_value = history_rows(10)
+
+        data = history.fetch_history(cursor, "P1")
+
+        assert cursor.execute.call_count == 2
+        assert "GROUP BY tv.test_code" in cursor.execute.call_args.args[0]
+        assert [s["test_code"] for s in data["series"]] == ["GLU", "HGB"]
+
+    @pytest.fixture
+    def patient(self, pdf, monkeypatch):
+        cursor = MagicMock()
+        cursor.fetchone.return_value = (REPORT_VERSION, 12, "0123456789abcdef")
+        db = MagicMock()
+        db.cursor.return_value.__enter__.return_value = cursor
+        monkeypatch.setattr(pdf, "_db", db)
+        monkeypatch.setattr(pdf, "get_history_data", MagicMock())
+        return pdf
+
+    def test_cached_history_skips_the_query(self, patient):
+        response = patient.lambda_handler(
+            {"patient_id": "P1", "report": "history"}, None
+        )
+        body = json.loads(response["body"])
+
+        assert body["s3_key"] == (
+            "reports/history/P1/20240115T103000123456-12-0123456789ab.pdf"
+        )
+        assert body["cached"] is True
+        patient.get_history_data.assert_not_called()
+
+    def test_history_key_follows_the_included_results(self):
+        import history
+
+        # Un resultado archivado y otro completado: MAX y COUNT no cambian,
+        # el digest de (result_id, report_version) sí
+        before = history.history_version(REPORT_VERSION, 12, "aaaaaaaaaaaaaaaa")
+        after = history.history_version(REPORT_VERSION, 12, "bbbbbbbbbbbbbbbb")
+
+        assert before != after
+        assert "string_agg" in history.VERSION_QUERY
+
+    def test_patient_without_results(self, patient):
+        patient._db.cursor.return_value.__enter__.return_value.fetchone.return_value = (
+            None,
+            0,
+            None,
+        )
+        response = patient.lambda_handler(
+            {"body": json.dumps({"patient_id": "P1", "report": "history"})}, None
+        )
+        assert response["statusCode"] == 404
+
+    def test_long_history_renders_bounded_charts(self, load_lambda):
+        pytest.importorskip("reportlab")
+        import history
+
+        module = load_lambda("pdf_generator")
+        rows = history_rows(5000, codes=("GLU", "HGB", "WBC"))
+        data = {
+            "patient_id": "P1",
+            "first_name": "John",
+            "last_name": "Smith",
+            "date_of_birth": None,
+            "series": [history.build_series(row, 120) for row in rows],
+        }
+
+        pdf_bytes = module.generate_history_pdf(data).getvalue()
+
+        assert pdf_bytes.startswith(b"%PDF")
+        assert pdf_bytes.count(b"/Type /Page\n") <= 2
+
+
+class TestBatch:
+    def test_one_fetch_for_all_results(self, batch):
+        batch._s3_client.head_object.side_effect = not_found()
+        response = batch.lambda_handler({"result_ids": [3, 1, 404, 1]}, None)
+        body = json.loads(response["body"])
+
+        batch.get_results_data.assert_called_once_with([3, 1, 404])
+        assert body["missing"] == [404]
+        assert [r["result_id"] for r in body["reports"]] == [3, 1]
+        assert batch._s3_client.put_object.call_count == 2
+
+    def test_individual_mode_creates_one_client_for_all_workers(
+        self, batch, monkeypatch
+    ):
+        import time
+
+        s3 = batch._s3_client
+        s3.head_object.side_effect = not_found()
+        created = []
+
+        def client(*args, **kwargs):
+            # Contenedor frío: crear el cliente tarda y los threads se pisan
+            time.sleep(0.05)
+            created.append(args)
+            return s3
+
+        monkeypatch.setattr(batch, "_s3_client", None)
+        monkeypatch.setattr(batch.boto3, "client", client)
+        monkeypatch.setattr(batch, "BATCH_WORKERS", 3)
+        response = batch.lambda_handler({"result_ids": [1, 2, 3]}, None)
+
+        assert len(json.loads(response["body"])["reports"]) == 3
+        assert created == [("s3",)]
+        assert s3.put_object.call_count == 3
+
+    def test_zip_is_streamed_by_multipart(self, batch):
+        import zipfile
+
+        body = json.loads(
+            batch.lambda_handler(
+                {"body": json.dumps({"result_ids": [1, 2], "output": "zip"})}, None
+            )["body"]
+        )
+
+        s3 = batch._s3_client
+        assert body["s3_key"].startswith("reports/batches/")
+        assert s3.complete_multipart_upload.call_args.kwargs["MultipartUpload"] == {
+            "Parts": [{"PartNumber": 1, "ETag": "etag-1"}]
+        }
+        bundle = zipfile.ZipFile(BytesIO(uploaded_bytes(s3)))
+        assert bundle.namelist() == ["result_1.pdf", "result_2.pdf"]
+        assert bundle.read("result_2.pdf") == b"%PDF"
+
+    def test_zip_bounds_renders_in_flight(self, batch, monkeypatch):
+        import threading
+        import zipfile
+
+        lock = threading.Lock()
+        alive = [0, 0]  # PDFs renderizados sin escribir todavía, máximo
+
+        class TrackedPDF(BytesIO):
+            def close(self):
+                with lock:
+                    alive[0] -= 1
+                super().close()
+
+        def render(data):
+            with lock:
+                alive[0] += 1
+                alive[1] = max(alive[1], alive[0])
+            return TrackedPDF(b"%PDF")
+
+        monkeypatch.setattr(batch, "BATCH_WORKERS", 2)
+        monkeypatch.setattr(batch, "generate_pdf", render)
+        results = [{"result_id": rid} for rid in range(1, 41)]
+
+        batch.write_bundle(results, "zip")
+
+        bundle = zipfile.ZipFile(BytesIO(uploaded_bytes(batch._s3_client)))
+        assert len(bundle.namelist()) == 40
+        assert alive[0] == 0
+        assert alive[1] <= 2 * batch.BATCH_WORKERS
+
+    def test_combined_pdf(self, batch, monkeypatch):
+        rendered = []
+
+        def combined(results, out):
+            rendered.append([r["result_id"] for r in results])
+            out.write(b"%PDF-combined")
+
+        monkeypatch.setattr(batch, "generate_combined_pdf", combined)
+        body = json.loads(
+            batch.lambda_handler({"result_ids": [2, 1], "output": "combined"}, None)[
+                "body"
+            ]
+        )
+        assert rendered == [[2, 1]]
+        assert body["s3_key"].endswith(".pdf")
+        assert uploaded_bytes(batch._s3_client) == b"%PDF-combined"
+
+    @pytest.mark.parametrize(
+        "request_body",
+        [
+            {"result_ids": []},
+            {"result_ids": ["x"]},
+            {"result_ids": [1], "output": "tar"},
+        ],
+    )
+    def test_invalid_requests(self, batch, request_body):
+        assert batch.lambda_handler(request_body, None)["statusCode"] == 400
+
+    def test_limit(self, batch, monkeypatch):
+        monkeypatch.setattr(batch, "BATCH_MAX_RESULTS", 2)
+        response = batch.lambda_handler({"result_ids": [1, 2, 3]}, None)
+        assert response["statusCode"] == 400
+
+
+class TestQueries:
+    @pytest.fixture
+    def db(self, load_lambda, monkeypatch):
+        module = load_lambda("pdf_generator")
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [
+            {"result_id": 42, "report_version": REPORT_VERSION, "test_values": "[]"}
+        ]
+        db = MagicMock()
+        db.cursor.return_value.__enter__.return_value = cursor
+        monkeypatch.setattr(module, "_db", db)
+        return module, cursor
+
+    def test_report_data_is_one_round_trip(self, db):
+        module, cursor = db
+        data = module.get_result_data("42")
+
+        assert cursor.execute.call_count == 1
+        assert data["result_id"] == 42
+        assert data["test_values"] == []
+
+    def test_batch_data_is_one_round_trip(self, db):
+        module, cursor = db
+        assert list(module.get_results_data([42, 43])) == [42]
+        assert cursor.execute.call_count == 1
+
+
+class TestMultipartWriter:
+    @pytest.fixture
+    def s3(self):
+        s3 = MagicMock()
+        s3.create_multipart_upload.return_value = {"UploadId": "up-1"}
+        s3.upload_part.side_effect = lambda **kw: {"ETag": str(kw["PartNumber"])}
+        return s3
+
+    def test_parts_are_uploaded_while_writing(self, pdf, s3):
+        from batch import MB, MultipartWriter
+
+        with MultipartWriter(s3, "b", "k", part_size=5 * MB) as out:
+            out.write(b"a" * (6 * MB))
+            # La primera parte ya salió antes de cerrar
+            assert len(out._parts) == 1
+            out.write(b"b" * (5 * MB))
+
+        parts = s3.complete_multipart_upload.call_args.kwargs["MultipartUpload"]
+        assert [p["PartNumber"] for p in parts["Parts"]] == [1, 2, 3]
+        assert len(uploaded_bytes(s3)) == 11 * MB
+
+    def test_errors_abort_the_upload(self, pdf, s3):
+        from batch import MultipartWriter
+
+        with pytest.raises(RuntimeError):
+            with MultipartWriter(s3, "b", "k") as out:
+                out.write(b"partial")
+                raise RuntimeError("render failed")
+
+        s3.abort_multipart_upload.assert_called_once_with(
+            Bucket="b", Key="k", UploadId="up-1"
+        )
+        s3.complete_multipart_upload.assert_not_called()
+
+
+class TestRendering:
+    @pytest.fixture
+    def renderer(self, load_lambda):
+        pytest.importorskip("reportlab")
+        module = load_lambda("pdf_generator")
+        import report_template
+
+        report_template.reset_template()
+        return module
+
+    def report(self, result_id, abnormal=False):
+        return {
+            "result_id": result_id,
+            "patient_id": "P1",
+            "first_name": "Ana",
+            "last_name": "Pérez",
+            "date_of_birth": None,
+            "lab_name": "Lab",
+            "test_type": "basic_panel",
+            "test_date": REPORT_VERSION,
+            "notes": "Fasting",
+            "test_values": [
+                {
+                    "test_name": "Glucose",
+                    "value": 180 if abnormal else 90,
+                    "unit": "mg/dL",
+                    "reference_range": "70-99",
+                    "is_abnormal": abnormal,
+                }
+            ],
+        }
+
+    def test_template_is_built_once(self, renderer):
+        import report_template
+
+        first = renderer.generate_pdf(self.report(1)).getvalue()
+        template = report_template.get_template()
+        second = renderer.generate_pdf(self.report(2, abnormal=True)).getvalue()
+
+        assert first.startswith(b"%PDF") and second.startswith(b"%PDF")
+        assert report_template.get_template() is template
+
+    def test_combined_pdf_repeats_static_fragments(self, renderer):
+        def pages(pdf_bytes):
+            return pdf_bytes.count(b"/Type /Page\n")
+
+        single = pages(renderer.generate_pdf(self.report(1)).getvalue())
+        out = BytesIO()
+        renderer.generate_combined_pdf([self.report(1), self.report(2)], out)
+        assert pages(out.getvalue()) == 2 * single
@@ -0,0 +1,245 @@
+"""
+Unit tests for the patient portal (PDF report jobs and signed URL cache)
+"""
+
+import importlib.util
+import os
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+pytest.importorskip("flask")
+pytest.importorskip("jose")
+
+PORTAL_APP = os.path.join(
+    os.path.dirname(__file__), "..", "..", "services", "portal", "app.py"
+)
+REPORT_VERSION = datetime(2024, 1, 15, 10, 30, 0, 123456)
+EMAIL = "john@example.com"
+
+
+class FakeJobStore:
+    """report_jobs en memoria, detrás de un cursor falso"""
+
+    def __init__(self):
+        self.jobs = {}
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    description = None
+
+    def __init__(self, store):
+        self.store = store
+        self.rows = []
+
+    def execute(self, query, params=None):
+        jobs = self.store.jobs
+        if "SELECT lr.report_version" in query:
+            self.rows = [(REPORT_VERSION,)]
+        elif "INSERT INTO report_jobs" in query:
+            key = (params["result_id"], params["result_version"])
+            if key in jobs and jobs[key]["status"] in ("failed", "completed"):
+                # ON CONFLICT ... DO UPDATE: se re-encola
+                jobs[key].update(status="pending", s3_key=None, error_message=None)
+                self.rows = [jobs[key]]
+            elif key in jobs:
+                self.rows = []
+            else:
+                jobs[key] = {
+                    "job_id": len(jobs) + 1,
+                    "result_id": params["result_id"],
+                    "status": "pending",
+                    "s3_key": None,
+                    "error_message": None,
+                }
+                self.rows = [jobs[key]]
+        elif "WHERE j.result_id" in query:
+            key = (params["result_id"], params["result_version"])
+            self.rows = [jobs[key]]
+        elif "WHERE j.job_id" in query:
+            self.rows = [j for j in jobs.values() if j["job_id"] == params["job_id"]]
+        elif "SET status = 'failed'" in query:
+            for job in jobs.values():
+                if job["job_id"] == params[1]:
+                    job.update(status="failed", error_message=params[0])
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def portal(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("S3_BUCKET", "test-bucket")
+    monkeypatch.setenv("PDF_LAMBDA_NAME", "pdf-generator")
+    spec = importlib.util.spec_from_file_location("portal_app", PORTAL_APP)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    store = FakeJobStore()
+    s3 = MagicMock()
+    s3.head_object.side_effect = ClientError({"Error": {"Code": "404"}}, "HeadObject")
+    s3.generate_presigned_url.return_value = "https://signed"
+    monkeypatch.setattr(module, "s3_client", s3)
+    monkeypatch.setattr(module, "lambda_client", MagicMock())
+    monkeypatch.setattr(module, "get_db_connection", lambda: store)
+    monkeypatch.setattr(module, "get_user_email_from_token", lambda: EMAIL)
+    module.store = store
+    return module
+
+
+@pytest.fixture
+def client(portal):
+    client = portal.app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = {"id_token": "token"}
+    return client
+
+
+class TestReportJobs:
+    def test_duplicate_submissions_collapse_into_one_job(self, portal, client):
+        first = client.post("/results/42/report")
+        second = client.post("/results/42/report")
+
+        assert first.status_code == second.status_code == 202
+        assert first.get_json()["job_id"] == second.get_json()["job_id"] == 1
+        assert first.get_json()["status_url"] == "/report-jobs/1"
+        # Un solo render, y sin esperar la respuesta de la Lambda
+        portal.lambda_client.invoke.assert_called_once()
+        assert portal.lambda_client.invoke.call_args.kwargs["InvocationType"] == "Event"
+
+    def test_cached_report_skips_the_job(self, portal, client):
+        portal.s3_client.head_object.side_effect = None
+
+        response = client.post("/results/42/report")
+
+        assert response.status_code == 200
+        assert response.get_json()["download_url"] == "https://signed"
+        portal.lambda_client.invoke.assert_not_called()
+
+    def test_download_waits_on_a_polling_page(self, portal, client):
+        response = client.get("/results/42/download")
+
+        assert response.status_code == 202
+        assert b"/report-jobs/1" in response.data
+
+    def test_completed_job_redirects_to_the_report(self, portal, client):
+        client.post("/results/42/report")
+        job = next(iter(portal.store.jobs.values()))
+        job.update(status="completed", s3_key=portal.report_key(42, REPORT_VERSION))
+        portal.s3_client.head_object.side_effect = None
+
+        status = client.get("/report-jobs/1").get_json()
+        download = client.get(status["download_url"])
+
+        assert status["status"] == "completed"
+        assert download.status_code == 302
+        assert download.headers["Location"] == "https://signed"
+
+    def test_download_of_a_deleted_report_resubmits_the_job(self, portal, client):
+        client.post("/results/42/report")
+        job = next(iter(portal.store.jobs.values()))
+        job.update(status="completed", s3_key="reports/42/old.pdf")
+
+        download = client.get("/report-jobs/1/download")
+
+        # El PDF de la versión actual no está en S3: nada de redirigir al viejo
+        assert download.status_code == 202
+        assert b"/report-jobs/1" in download.data
+        assert job["status"] == "pending"
+        assert portal.lambda_client.invoke.call_count == 2
+        portal.s3_client.generate_presigned_url.assert_not_called()
+
+    def test_pregenerated_key_matches_the_portal_key(
+        self, portal, client, load_lambda, monkeypatch
+    ):
+        # Mismo resultado visto por la Lambda (evento result-ready) y por el
+        # portal; updated_at ya avanzó por el UPDATE de s3_processed_key
+        pdf = load_lambda("pdf_generator")
+        monkeypatch.setattr(pdf, "save_pdf_to_s3", MagicMock())
+        monkeypatch.setattr(pdf, "invalidate_stale_reports", MagicMock())
+        monkeypatch.setattr(pdf, "generate_pdf", MagicMock())
+        data = {
+            "result_id": 42,
+            "report_version": REPORT_VERSION,
+            "updated_at": datetime(2024, 1, 15, 10, 30, 5),
+        }
+
+        pregenerated = pdf.render_and_store(data)
+        client.post("/results/42/report")
+
+        requested = portal.s3_client.head_object.call_args.kwargs["Key"]
+        assert pregenerated == requested == portal.report_key(42, REPORT_VERSION)
+
+    def test_failed_dispatch_marks_the_job(self, portal, client):
+        portal.lambda_client.invoke.side_effect = RuntimeError("throttled")
+
+        body = client.post("/results/42/report").get_json()
+        status = client.get("/report-jobs/1").get_json()
+
+        # El paciente ve un mensaje genérico; el detalle queda para operaciones
+        assert body["status"] == status["status"] == "failed"
+        assert body["error"] == status["error"] == portal.REPORT_JOB_ERROR
+        assert next(iter(portal.store.jobs.values()))["error_message"] == "throttled"
+
+    def test_unexpected_errors_are_not_shown_to_patients(self, portal, client):
+        portal.s3_client.head_object.side_effect = None
+        portal.s3_client.generate_presigned_url.side_effect = RuntimeError(
+            "AccessDenied for arn:aws:iam::123456789012:role/portal"
+        )
+
+        response = client.post("/results/42/report")
+
+        assert response.status_code == 500
+        assert response.get_json() == {"error": portal.REPORT_JOB_ERROR}
+
+
+class TestSignedUrlCache:
+    def test_repeated_downloads_reuse_the_signed_url(self, portal, client):
+        portal.s3_client.head_object.side_effect = None
+
+        for _ in range(3):
+            response = client.get("/results/42/download")
+            assert response.headers["Location"] == "https://signed"
+
+        assert portal.s3_client.head_object.call_count == 1
+        assert portal.s3_client.generate_presigned_url.call_count == 1
+        portal.lambda_client.invoke.assert_not_called()
+
+    def test_url_expires_before_the_signature(self, portal, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(portal.time, "monotonic", lambda: now[0])
+        cache = portal.SignedUrlCache(ttl=300, max_entries=10)
+
+        cache.put("reports/42/v1.pdf", "https://signed")
+        now[0] += 299
+        assert cache.get("reports/42/v1.pdf") == "https://signed"
+        now[0] += 1
+        assert cache.get("reports/42/v1.pdf") is None
+
+    def test_cache_never_outlives_the_url(self, portal):
+        ttl = portal.report_url_cache.ttl
+        assert ttl <= portal.SIGNED_URL_TTL - portal.SIGNED_URL_MIN_REMAINING
+        assert ttl <= portal.SIGNED_URL_CACHE_TTL
+
+    def test_cache_is_bounded(self, portal):
+        cache = portal.SignedUrlCache(ttl=300, max_entries=2)
+        for version in ("v1", "v2", "v3"):
+            cache.put(f"reports/42/{version}.pdf", version)
+
+        assert cache.get("reports/42/v1.pdf") is None
+        assert cache.get("reports/42/v3.pdf") == "v3"
@@ -0,0 +1,44 @@
+"""
+Unit tests for the worker's unit normalization table
+"""
+
+import pytest
+
+from units import canonical_value, normalize_results, unit_key
+
+
+class TestUnitNormalization:
+    @pytest.mark.parametrize(
+        "code, value, unit, expected",
+        [
+            ("GLU", 95, "mg/dL", (95.0, "mg/dL")),
+            ("GLU", 5.5, "mmol/L", (99.088, "mg/dL")),
+            ("CREAT", 88.42, "µmol/L", (1.0, "mg/dL")),
+            ("HGB", 135, "g/L", (13.5, "g/dL")),
+            ("WBC", 7.5, "x10^9/L", (7.5, "10^3/uL")),
+            ("tsh", 2.1, "mIU/L", (2.1, "uIU/mL")),
+            ("HCT", 0.42, "L/L", (42.0, "%")),
+        ],
+    )
+    def test_conversions(self, code, value, unit, expected):
+        assert canonical_value(code, value, unit) == expected
+
+    def test_unknown_code_or_unit(self):
+        assert canonical_value("XYZ", 1, "mg/dL") is None
+        assert canonical_value("GLU", 1, "furlongs") is None
+        assert canonical_value("GLU", "n/a", "mg/dL") is None
+
+    def test_unit_spellings(self):
+        assert unit_key("µmol/L") == unit_key("umol/l") == unit_key("mcmol / L")
+        assert unit_key("10e9/L") == unit_key("10^9/l")
+
+    def test_original_value_is_kept(self):
+        tests = [
+            {"test_code": "CHOL", "value": 5.2, "unit": "mmol/L"},
+            {"test_code": "XYZ", "value": 1, "unit": "mg/dL"},
+        ]
+        assert normalize_results(tests) == 1
+        chol, other = tests
+        assert (chol["value"], chol["unit"]) == (5.2, "mmol/L")
+        assert (chol["canonical_value"], chol["canonical_unit"]) == (201.084, "mg/dL")
+        assert "canonical_value" not in other
@@ -0,0 +1,69 @@
+"""
+Unit tests for the XML adapter (iterparse streaming of hospital exports)
+"""
+
+import io
+
+import pytest
+
+LAB_RESULT = (
+    "<LabResult><LabID>HOSP001</LabID>"
+    '<Patient ID="{patient}"><Name>Maria Garcia</Name></Patient>'
+    '<Tests><Test code="CBC" name="Complete Blood Count" date="2024-01-15T10:30:00Z">'
+    '<Component code="WBC" name="White Blood Cell Count" value="7.5" '
+    'unit="10^3/uL" refRange="4.5-11.0" flag="N"/>'
+    '<Component code="HGB" name="Hemoglobin" value="11.0" unit="g/dL" flag="L"/>'
+    "</Test></Tests></LabResult>"
+)
+
+
+def export(count, root="<LabResults>", end="</LabResults>"):
+    body = "".join(LAB_RESULT.format(patient=f"P{idx:06d}") for idx in range(count))
+    return f"{root}{body}{end}"
+
+
+@pytest.fixture
+def xml_adapter(load_lambda):
+    return load_lambda("xml_adapter")
+
+
+class TestIterparse:
+    def test_one_result_per_lab_result(self, xml_adapter):
+        results = list(xml_adapter.iter_xml_results(io.BytesIO(export(3).encode())))
+        assert [r["patient_id"] for r in results] == ["P000000", "P000001", "P000002"]
+        assert results[0]["test_type"] == "Complete Blood Count"
+        assert [c["severity"] for c in results[0]["results"]] == ["normal", "low"]
+
+    def test_single_document_is_still_supported(self, xml_adapter):
+        normalized = xml_adapter.parse_xml_to_json(LAB_RESULT.format(patient="P1"))
+        assert normalized["patient_id"] == "P1"
+        assert normalized["test_date"] == "2024-01-15T10:30:00Z"
+
+    def test_namespaced_and_nested_exports(self, xml_adapter):
+        text = export(
+            2,
+            root='<Export xmlns="urn:hosp"><Batch>',
+            end="</Batch></Export>",
+        )
+        results = list(xml_adapter.iter_xml_results(io.StringIO(text)))
+        assert [r["patient_id"] for r in results] == ["P000000", "P000001"]
+        assert results[1]["lab_id"] == "HOSP001"
+        assert len(results[1]["results"]) == 2
+
+    def test_processed_elements_are_released(self, xml_adapter):
+        import xml.etree.ElementTree as ET
+
+        seen = []
+        original = xml_adapter.normalize_lab_result
+
+        def spy(elem):
+            seen.append(elem)
+            return original(elem)
+
+        xml_adapter.normalize_lab_result = spy
+        list(xml_adapter.iter_xml_results(io.StringIO(export(50))))
+
+        assert len(seen) == 50
+        # Cada <LabResult> queda vacío después de normalizarse
+        assert all(len(elem) == 0 for elem in seen)
+        assert isinstance(seen[0], ET.Element)